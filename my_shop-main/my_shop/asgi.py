@@ -9,10 +9,20 @@ https://docs.djangoproject.com/en/dev/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 # Указывает Django путь к файлу настроек проекта.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_shop.settings')
+# Под ASGI каталог обслуживается асинхронными представлениями (см. SHOP_ASYNC_VIEWS в settings.py).
+os.environ.setdefault('SHOP_ASYNC_VIEWS', '1')
 
 # Получает ASGI-приложение для проекта.
-application = get_asgi_application()
\ No newline at end of file
+application = get_asgi_application()
+
+# Статические и медиа-файлы отдаются оберткой до Django: с хэшем в имени - с кэшированием на год,
+# остальные - с проверкой по ETag (см. shop/staticfiles.py и настройку SHOP_STATIC_SERVE).
+if settings.SHOP_STATIC_SERVE:
+    # Импорт после get_asgi_application(): модуль использует модели приложения shop.
+    from shop.staticfiles import StaticFilesASGI
+    application = StaticFilesASGI(application)
\ No newline at end of file
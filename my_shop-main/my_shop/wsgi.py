@@ -9,10 +9,18 @@ https://docs.djangoproject.com/en/dev/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 # Указывает Django путь к файлу настроек проекта.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_shop.settings')
 
 # Получает WSGI-приложение для проекта.
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# Статические и медиа-файлы отдаются оберткой до Django: с хэшем в имени - с кэшированием на год,
+# остальные - с проверкой по ETag (см. shop/staticfiles.py и настройку SHOP_STATIC_SERVE).
+if settings.SHOP_STATIC_SERVE:
+    # Импорт после get_wsgi_application(): модуль использует модели приложения shop.
+    from shop.staticfiles import StaticFilesWSGI
+    application = StaticFilesWSGI(application)
\ No newline at end of file
@@ -1,11 +1,36 @@
+import csv
+from datetime import date
+
+from django import forms
 from django.contrib import admin
-from .models import Category, Product, Order, OrderItem, Coupon # Импортируем все модели
+from django.contrib.admin.widgets import ForeignKeyRawIdWidget
+from django.core.exceptions import PermissionDenied
+from django.db.models import OuterRef, Subquery, Sum
+from django.http import Http404, HttpResponse
+from django.template.response import TemplateResponse
+from django.urls import NoReverseMatch, path, reverse
+from django.utils import timezone
+from django.utils.text import Truncator
+from . import reports # Отчеты о продажах
+from .models import Category, Product, Order, OrderItem, Coupon, EmailJob, DailySales # Импортируем все модели
+from .pagination import EstimatedCountPaginator
+
+# Списки товаров и заказов в админке рассчитаны на десятки тысяч строк: количество запросов
+# на страницу не зависит от числа строк на ней (связанные объекты загружаются одним JOIN через
+# list_select_related, количество товаров в заказе - подзапросом в том же запросе), а общее
+# количество строк на больших выборках PostgreSQL оценивается (EstimatedCountPaginator) и не считается
+# второй раз без фильтров (show_full_result_count = False).
 
 # Регистрация модели Category с кастомными настройками для админки
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     # Поля, которые будут отображаться в списке категорий
-    list_display = ['name', 'slug']
+    list_display = ['name', 'slug', 'parent', 'depth', 'product_count']
+    list_select_related = ['parent'] # Родитель загружается тем же запросом, что и категории
+    list_filter = ['depth']
+    search_fields = ['name', 'slug']
+    # Категорий могут быть тысячи - родитель выбирается поиском, а не из выпадающего списка
+    autocomplete_fields = ['parent']
     # Поле 'slug' будет автоматически заполняться на основе значения поля 'name'
     # при создании новой категории (удобно для генерации URL-дружественных слагов).
     prepopulated_fields = {'slug': ('name',)}
@@ -14,32 +39,78 @@ class CategoryAdmin(admin.ModelAdmin):
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     # Поля в списке товаров
-    list_display = ['name', 'slug', 'category', 'price', 'available', 'created', 'updated']
+    list_display = ['name', 'slug', 'category', 'price', 'available', 'stock', 'reserved', 'created', 'updated']
+    list_select_related = ['category'] # Категория загружается тем же запросом, что и товары
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     # Фильтры, которые будут доступны в боковой панели для фильтрации списка товаров
     list_filter = ['available', 'created', 'updated', 'category']
     # Поля, которые можно редактировать прямо в списке товаров (без перехода на страницу редактирования товара)
-    list_editable = ['price', 'available']
+    list_editable = ['price', 'available', 'stock']
+    # Резерв меняется только корзинами посетителей (shop/inventory.py)
+    readonly_fields = ['reserved']
     # Автозаполнение 'slug' из 'name'
     prepopulated_fields = {'slug': ('name',)}
     # Поля, по которым будет работать поиск в админке
     search_fields = ['name', 'description']
 
+# Поле ввода ID товара, которое показывает название уже загруженного товара позиции.
+# Стандартный виджет raw_id_fields загружает товар для подписи отдельным запросом в каждой строке.
+class ProductRawIdWidget(ForeignKeyRawIdWidget):
+    product = None # Товар позиции (задается формой позиции)
+
+    def label_and_url_for_value(self, value):
+        product = self.product
+        if product is None or str(product.pk) != str(value):
+            return super().label_and_url_for_value(value)
+        try:
+            url = reverse(f'{self.admin_site.name}:shop_product_change', args=[product.pk])
+        except NoReverseMatch:
+            url = ''
+        return Truncator(product).words(14), url
+
+
+# Форма позиции заказа: передает виджету товар, загруженный вместе с позицией (select_related).
+class OrderItemInlineForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        widget = self.fields['product'].widget
+        if isinstance(widget, ProductRawIdWidget) and self.instance.product_id:
+            widget.product = self.instance.product
+
+
 # Класс для встроенного отображения OrderItem на странице Order
 class OrderItemInline(admin.TabularInline): # TabularInline отображает элементы в табличном виде
     model = OrderItem # Модель, которую будем отображать
+    form = OrderItemInlineForm
     # raw_id_fields позволяет выбирать связанный товар через ввод ID,
     # что удобнее, чем выпадающий список, если товаров много.
     raw_id_fields = ['product']
     extra = 0 # Не показывать пустые строки для добавления новых OrderItem по умолчанию
 
+    # Товары позиций загружаются одним запросом вместе с позициями
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'product':
+            kwargs['widget'] = ProductRawIdWidget(db_field.remote_field, self.admin_site, using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
 # Регистрация модели Order
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     # Поля в списке заказов
     list_display = ['id', 'first_name', 'last_name', 'email', 'paid', 
-                    'coupon', 'discount', 'created', 'city']
+                    'coupon', 'discount', 'items_quantity', 'total', 'created', 'city']
+    # Купон (необязательная связь - без этого загружался бы отдельным запросом для каждой строки)
+    list_select_related = ['coupon']
     # Фильтры для списка заказов
     list_filter = ['paid', 'created', 'updated', 'coupon']
+    # Навигация по датам (индексы по created и по paid, created - см. Order.Meta)
+    date_hierarchy = 'created'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     # Поиск по заказам
     search_fields = ['id', 'first_name', 'last_name', 'email']
     # Включаем отображение OrderItemInline на странице редактирования заказа
@@ -48,6 +119,20 @@ class OrderAdmin(admin.ModelAdmin):
     readonly_fields = ['created', 'updated', 'get_total_cost_display', 
                        'get_discount_amount_display', 'get_final_cost_display'] 
                        # Добавим кастомные поля для отображения стоимости
+                       # (значения берутся из сохраненных полей subtotal/discount_amount/total, без запросов к позициям)
+
+    # Количество товаров в заказе считается подзапросом SUM в запросе списка (без запросов к позициям
+    # для каждой строки). Подзапрос, а не JOIN с GROUP BY: COUNT(*) и запросы навигации по датам
+    # его не включают и не соединяются с таблицей позиций.
+    # Суммы заказа хранятся в самом заказе (subtotal/total) и не пересчитываются.
+    def get_queryset(self, request):
+        quantities = (OrderItem.objects.filter(order=OuterRef('pk')).order_by()
+                      .values('order').annotate(total=Sum('quantity')).values('total'))
+        return super().get_queryset(request).annotate(items_quantity=Subquery(quantities))
+
+    @admin.display(description='Товаров', ordering='items_quantity')
+    def items_quantity(self, obj):
+        return obj.items_quantity or 0
 
     # Кастомные поля для отображения в админке (не поля модели)
     def get_total_cost_display(self, obj):
@@ -74,4 +159,90 @@ class CouponAdmin(admin.ModelAdmin):
     # Фильтры для списка купонов
     list_filter = ['active', 'valid_from', 'valid_to']
     # Поиск по купонам
-    search_fields = ['code']
\ No newline at end of file
+    search_fields = ['code']
+
+# Регистрация очереди писем (только просмотр состояния и повторная отправка)
+@admin.register(EmailJob)
+class EmailJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'order', 'status', 'attempts', 'available_at', 'sent_at', 'created']
+    list_filter = ['status', 'created']
+    raw_id_fields = ['order']
+    readonly_fields = ['attempts', 'last_error', 'created', 'sent_at']
+    actions = ['retry_now']
+
+    # Действие: поставить выбранные письма в очередь повторно (сразу, с обнулением попыток)
+    @admin.action(description='Отправить повторно')
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status=EmailJob.STATUS_SENT).update(
+            status=EmailJob.STATUS_PENDING, attempts=0, available_at=timezone.now())
+        self.message_user(request, f'Поставлено в очередь: {updated}')
+
+
+# Отчеты о продажах (раздел "Отчеты о продажах" в админке).
+# Вместо списка строк DailySales показывается страница отчета за период (?start=ГГГГ-ММ-ДД&end=ГГГГ-ММ-ДД,
+# по умолчанию - последние 30 дней): итоги, выручка по дням, лучшие товары и категории, купоны.
+# Все данные берутся из сводных таблиц (shop/reports.py), поэтому страница не зависит от количества заказов.
+# Каждую таблицу можно выгрузить в CSV (export/<отчет>/ с тем же периодом).
+@admin.register(DailySales)
+class SalesReportAdmin(admin.ModelAdmin):
+    change_list_template = 'admin/shop/sales_report.html'
+
+    # Сводки меняются только вместе с заказами
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('export/<str:report>/', self.admin_site.admin_view(self.export_view), name='shop_dailysales_export'),
+        ] + super().get_urls()
+
+    # Период отчета из параметров запроса (неверные даты заменяются периодом по умолчанию)
+    def get_period(self, request):
+        start, end = reports.default_period()
+        try:
+            start = date.fromisoformat(request.GET.get('start') or start.isoformat())
+            end = date.fromisoformat(request.GET.get('end') or end.isoformat())
+        except ValueError:
+            return reports.default_period()
+        return (start, end) if start <= end else (end, start)
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        start, end = self.get_period(request)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Отчет о продажах',
+            'opts': self.model._meta,
+            'start': start,
+            'end': end,
+            'totals': reports.period_totals(start, end),
+            'daily': reports.daily_revenue(start, end),
+            'products': reports.top_products(start, end),
+            'categories': reports.top_categories(start, end),
+            'coupons': reports.coupon_effectiveness(start, end),
+            'period_query': f'start={start.isoformat()}&end={end.isoformat()}',
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, self.change_list_template, context)
+
+    # Выгрузка одного отчета за период в CSV
+    def export_view(self, request, report):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        if report not in reports.CSV_REPORTS:
+            raise Http404('Нет такого отчета')
+        start, end = self.get_period(request)
+        rows, columns = reports.CSV_REPORTS[report]
+        response = HttpResponse(content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="sales-{report}-{start}-{end}.csv"'
+        writer = csv.DictWriter(response, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows(start, end))
+        return response
\ No newline at end of file
@@ -8,4 +8,8 @@ class ShopConfig(AppConfig):
     # Имя приложения. Должно совпадать с именем директории приложения.
     name = 'shop'
     
-    # verbose_name = "Магазин" # Можно задать человекочитаемое имя для админки
\ No newline at end of file
+    # verbose_name = "Магазин" # Можно задать человекочитаемое имя для админки
+
+    # Подключаем обработчики сигналов (поисковый индекс и т.д.) при запуске приложения.
+    def ready(self):
+        from . import signals # noqa: F401
\ No newline at end of file
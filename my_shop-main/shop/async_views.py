@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.http import Http404
+from django.shortcuts import aget_object_or_404, render
+
+from . import images # Подготовка копий изображений до рендеринга
+from .caching import (cache_catalog_page, conditional_catalog_page, aget_category_tree, detail_page_products,
+                      list_page_products)
+from .cart import aget_cart
+from .db import read_from_replica
+from .forms import CouponApplyForm
+from .models import Product
+from .pagination import CachedCountPaginator, KeysetPaginator
+from .related import aget_related_products
+from .search import search_products
+
+# Асинхронные варианты представлений каталога и корзины (для запуска под ASGI: uvicorn, daphne).
+# Логика та же, что в shop/views.py, но все запросы к базе и кэшу выполняются через асинхронный API
+# (aget, acount, async for), а корзина загружается заранее (aget_cart). Шаблон рендерится, когда
+# все данные уже загружены, поэтому синхронных обращений к базе из асинхронного кода нет.
+# Подключаются в shop/urls.py при SHOP_ASYNC_VIEWS = True (my_shop/asgi.py включает ее по умолчанию);
+# cart_detail - только вместе с SHOP_ASYNC_CART_VIEW = True.
+# Остальные представления (добавление в корзину, заказ) остаются синхронными.
+
+
+# Рендеринг шаблона в асинхронном представлении.
+# Корзина нужна шаблону для значка в шапке; при заполнении кэша страниц значок заменяется заглушкой,
+# поэтому корзину загружать не нужно.
+async def _arender(request, template_name, context):
+    if not getattr(request, 'page_cache_fill', False):
+        await aget_cart(request)
+    return render(request, template_name, context)
+
+
+# Асинхронный вариант views.product_list.
+@conditional_catalog_page(list_page_products, catalog_wide=True)
+@cache_catalog_page
+@read_from_replica
+async def product_list(request, category_slug=None):
+    category = None
+    tree = await aget_category_tree()
+    products_queryset = Product.objects.filter(available=True).order_by('name', 'id')
+
+    query = request.GET.get('query', '').strip()
+    if query:
+        products_queryset = search_products(products_queryset, query)
+
+    if category_slug:
+        category = tree.get(category_slug)
+        if category is None:
+            raise Http404('Категория не найдена')
+        products_queryset = tree.filter_products(products_queryset, category)
+
+    page_size = settings.SHOP_CATALOG_PAGE_SIZE
+    count_timeout = settings.SHOP_CATALOG_COUNT_CACHE_TIMEOUT
+    page_number = request.GET.get('page')
+    cursor_mode = page_number is None and not query
+
+    if cursor_mode:
+        paginator = KeysetPaginator(products_queryset, page_size, key_fields=('name', 'id'),
+                                    count_cache_timeout=count_timeout)
+        products_page_obj = await paginator.apage(request.GET.get('cursor'))
+        if settings.SHOP_CATALOG_SHOW_COUNT:
+            await paginator.aload_count()
+    else:
+        paginator = CachedCountPaginator(products_queryset, page_size)
+        paginator.count_cache_timeout = count_timeout
+        products_page_obj = await paginator.apage(page_number)
+    await images.aprepare(products_page_obj.object_list, 'list')
+
+    context = {
+        'category': category,
+        'categories': tree.sidebar(category), # Верхний уровень и раскрытая ветка текущей категории
+        'breadcrumbs': tree.ancestors(category) if category else [],
+        'products': products_page_obj,
+        'query': query,
+        'cursor_mode': cursor_mode,
+        'show_count': settings.SHOP_CATALOG_SHOW_COUNT,
+    }
+    return await _arender(request, 'shop/product/list.html', context)
+
+
+# Асинхронный вариант views.product_detail.
+@conditional_catalog_page(detail_page_products)
+@cache_catalog_page
+@read_from_replica
+async def product_detail(request, id, slug):
+    # Категория загружается сразу (шаблон показывает ссылку на нее, а ленивая загрузка здесь невозможна).
+    product = await aget_object_or_404(Product.objects.select_related('category'),
+                                       id=id, slug=slug, available=True)
+    related_products = await aget_related_products(product, count=4)
+    await images.aprepare([product], 'detail')
+    await images.aprepare(related_products, 'list')
+
+    context = {'product': product,
+               'related_products': related_products}
+    return await _arender(request, 'shop/product/detail.html', context)
+
+
+# Асинхронный вариант views.cart_detail. Подключается только при SHOP_ASYNC_CART_VIEW (см. shop/urls.py).
+async def cart_detail(request):
+    cart = await aget_cart(request)
+    await images.aprepare([item['product'] for item in cart], 'thumbnail')
+
+    context = {'cart': cart,
+               'coupon_apply_form': CouponApplyForm()}
+    return await _arender(request, 'shop/cart/detail.html', context)
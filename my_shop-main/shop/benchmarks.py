@@ -0,0 +1,144 @@
+import random # Для генерации случайных данных
+import statistics # Для медианы и перцентилей
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connections
+from django.utils import timezone
+
+from . import categories as category_tree # Дерево категорий и счетчики товаров
+from .models import Category, Product, Coupon, Order, OrderItem
+
+# Вспомогательные функции для бенчмарков (команды bench_*).
+# Бенчмарки работают на временной тестовой базе данных, поэтому рабочая база не изменяется.
+
+# Слова для генерации названий и описаний товаров.
+ADJECTIVES = ['красный', 'синий', 'белый', 'черный', 'большой', 'маленький', 'новый', 'удобный',
+              'легкий', 'прочный', 'беспроводной', 'кожаный', 'детский', 'кухонный', 'садовый']
+NOUNS = ['телефон', 'чайник', 'рюкзак', 'ноутбук', 'стол', 'стул', 'лампа', 'куртка', 'кроссовки',
+         'наушники', 'часы', 'мышка', 'клавиатура', 'сковорода', 'зонт', 'кружка', 'подушка']
+DESCRIPTION_WORDS = ['качественный', 'материал', 'гарантия', 'доставка', 'подарок', 'цвет', 'размер',
+                     'модель', 'комплект', 'батарея', 'корпус', 'производитель', 'сезон', 'скидка',
+                     'отличный', 'выбор', 'для', 'дома', 'офиса', 'путешествий', 'быстрый', 'надежный']
+
+
+# Контекстный менеджер: создает временную тестовую базу (со всеми миграциями),
+# подключается к ней и удаляет ее на выходе.
+# test_name - имя (для SQLite - путь к файлу) тестовой базы. По умолчанию SQLite создает базу в памяти,
+# но для нагрузки из нескольких потоков нужна база в файле (в памяти запись блокирует всю таблицу без ожидания).
+@contextmanager
+def temporary_database(using='default', verbosity=0, test_name=None):
+    connection = connections[using]
+    if test_name:
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = test_name
+    old_name = connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+# Генерирует синтетический каталог: categories категорий и products товаров.
+# Товары создаются через bulk_create (без сигналов), поэтому поисковый индекс нужно
+# перестроить отдельно (shop.search.rebuild_index).
+def seed_catalog(categories=10, products=1000, seed=0, batch_size=1000):
+    rng = random.Random(seed)
+    Category.objects.bulk_create([
+        Category(name=f'Категория {i}', slug=f'category-{i}') for i in range(categories)
+    ])
+    category_objs = list(Category.objects.order_by('id'))
+
+    batch = []
+    for i in range(products):
+        name = f'{rng.choice(ADJECTIVES).capitalize()} {rng.choice(NOUNS)} {i}'
+        description = ' '.join(rng.choice(DESCRIPTION_WORDS) for _ in range(rng.randint(20, 60)))
+        batch.append(Product(
+            category=rng.choice(category_objs),
+            name=name,
+            slug=f'product-{i}',
+            description=description,
+            price=Decimal(rng.randint(100, 100000)) / 100,
+            available=rng.random() > 0.1,
+        ))
+        if len(batch) >= batch_size:
+            Product.objects.bulk_create(batch)
+            batch = []
+    Product.objects.bulk_create(batch)
+    category_tree.rebuild() # Пути категорий и счетчики товаров (bulk_create не вызывает сигналов)
+    return category_objs
+
+
+# Генерирует count купонов: половина действующих, четверть просроченных, четверть неактивных.
+# Коды: BENCH0, BENCH1, ... Возвращает список действующих купонов.
+def seed_coupons(count=20, seed=0):
+    rng = random.Random(seed)
+    now = timezone.now()
+    coupons = []
+    for i in range(count):
+        kind = i % 4
+        coupons.append(Coupon(
+            code=f'BENCH{i}',
+            valid_from=now - timedelta(days=30),
+            valid_to=now - timedelta(days=1) if kind == 2 else now + timedelta(days=30),
+            discount=rng.choice([5, 10, 15, 20, 30]),
+            active=kind != 3,
+        ))
+    Coupon.objects.bulk_create(coupons)
+    return [coupon for coupon in Coupon.objects.order_by('id') if coupon.is_valid()]
+
+
+# Генерирует orders заказов по 1..max_items позиций; примерно каждый третий заказ - с купоном.
+# Итоги заказа (subtotal/discount_amount/total) считаются сразу, т.к. bulk_create не вызывает save().
+def seed_orders(orders=1000, max_items=5, seed=0, batch_size=500):
+    rng = random.Random(seed)
+    products = list(Product.objects.values_list('id', 'price'))
+    coupons = list(Coupon.objects.filter(active=True))
+    if not products:
+        return 0
+
+    created = 0
+    while created < orders:
+        size = min(batch_size, orders - created)
+        order_objs, lines = [], []
+        for i in range(size):
+            n = created + i
+            chosen = rng.sample(products, min(len(products), rng.randint(1, max_items)))
+            items = [(product_id, price, rng.randint(1, 3)) for product_id, price in chosen]
+            order = Order(first_name=f'Покупатель {n}', last_name='Тестовый', email=f'buyer{n}@example.com',
+                          address=f'ул. Тестовая, {n}', postal_code='101000', city='Москва',
+                          paid=rng.random() < 0.7)
+            if coupons and rng.random() < 0.33:
+                coupon = rng.choice(coupons)
+                order.coupon, order.discount = coupon, coupon.discount
+            order.set_totals(sum(price * quantity for _, price, quantity in items))
+            order_objs.append(order)
+            lines.append(items)
+        Order.objects.bulk_create(order_objs)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=product_id, price=price, quantity=quantity)
+            for order, items in zip(order_objs, lines)
+            for product_id, price, quantity in items
+        ], batch_size=1000)
+        created += size
+    return created
+
+
+# Перцентиль p (0..100) списка значений.
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# Сводка по списку замеров в миллисекундах.
+def summarize(samples_ms):
+    return {
+        'count': len(samples_ms),
+        'mean_ms': statistics.fmean(samples_ms) if samples_ms else 0.0,
+        'p50_ms': percentile(samples_ms, 50),
+        'p95_ms': percentile(samples_ms, 95),
+        'p99_ms': percentile(samples_ms, 99),
+    }
@@ -0,0 +1,365 @@
+import hashlib # Для построения ключей кэша
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction # Для декорирования асинхронных представлений
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import Max
+from django.http import HttpResponse
+from django.middleware.csrf import get_token # CSRF-токен текущего пользователя
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.crypto import salted_hmac # ETag не раскрывает CSRF-секрет посетителя
+from django.utils.http import http_date
+
+from .cart import aget_cart, aget_cart_version, get_cart_version # Корзина для значка в шапке и версия корзины для ETag
+from .categories import CategoryTree # Снимок дерева категорий
+from .models import Category, Product
+
+# Кэширование страниц каталога.
+# Страницы product_list, product_detail, "О нас" и "Контакты" одинаковы для всех посетителей,
+# кроме двух "дыр": значка корзины в шапке и CSRF-токена в формах "В корзину".
+# Поэтому в кэш кладется HTML страницы с заглушками на месте этих дыр, а при каждом запросе
+# заглушки заменяются на значок корзины и токен текущего посетителя.
+# Ключи кэша включают "версию каталога", которую увеличивают сигналы при изменении
+# товаров и категорий (shop/signals.py), - устаревшие страницы просто перестают использоваться.
+# Все остальное содержимое страницы берется из кэша как есть. В том числе блок "Похожие товары"
+# на странице товара: случайная выборка делается при заполнении кэша и не меняется, пока страница
+# в кэше (до SHOP_PAGE_CACHE_TIMEOUT или до изменения каталога). Отдельная "дыра" для блока стоила бы
+# запроса к базе на каждое попадание в кэш, а браузер с ETag и так получает 304 на ту же выборку.
+
+CATALOG_VERSION_KEY = 'shop:catalog_version'
+CATALOG_CHANGED_AT_KEY = 'shop:catalog_changed_at' # Время последнего изменения каталога (для реплик, shop/db.py)
+STATS_KEY_PREFIX = 'shop:page_cache:'
+
+# Заглушки, которые подставляются в HTML при заполнении кэша.
+CSRF_PLACEHOLDER = 'SHOPCSRFTOKENPLACEHOLDER'
+CART_BADGE_PLACEHOLDER = '<!--shop:cart-badge-->'
+
+
+# Текущая версия каталога.
+# Начальное значение - время запуска, чтобы после очистки кэша не совпасть со старыми ключами.
+def catalog_version():
+    return cache.get_or_set(CATALOG_VERSION_KEY, lambda: int(time.time()), None)
+
+
+# --- Асинхронный доступ к кэшу (для асинхронных представлений) ---
+# Асинхронные методы кэша Django (aget, aset ...) выполняют синхронный вызов в отдельном потоке.
+# Кэш в памяти процесса (LocMemCache) никогда не блокирует, поэтому к нему обращаемся напрямую,
+# без переключения потоков; для остальных бэкендов (Redis, Memcached) - через a*-методы.
+def _local_cache():
+    backend = caches['default']
+    return backend if isinstance(backend, (LocMemCache, DummyCache)) else None
+
+
+async def acache_get(key, default=None):
+    local = _local_cache()
+    return local.get(key, default) if local else await cache.aget(key, default)
+
+
+async def acache_set(key, value, timeout):
+    local = _local_cache()
+    if local:
+        local.set(key, value, timeout)
+    else:
+        await cache.aset(key, value, timeout)
+
+
+async def acatalog_version():
+    local = _local_cache()
+    if local:
+        return local.get_or_set(CATALOG_VERSION_KEY, lambda: int(time.time()), None)
+    return await cache.aget_or_set(CATALOG_VERSION_KEY, lambda: int(time.time()), None)
+
+
+# Увеличивает версию каталога (все закэшированные страницы каталога устаревают).
+def bump_catalog_version():
+    cache.set(CATALOG_CHANGED_AT_KEY, time.time(), None)
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError: # Ключа нет в кэше
+        cache.set(CATALOG_VERSION_KEY, int(time.time()), None)
+        return catalog_version()
+
+
+# Время последнего изменения каталога (time.time()) или None, если с запуска кэша изменений не было.
+def catalog_changed_at():
+    return cache.get(CATALOG_CHANGED_AT_KEY)
+
+
+# Снимок дерева категорий (боковое меню, поиск категории по slug) из кэша;
+# запрос к базе - только после изменения каталога.
+def get_category_tree():
+    key = f'shop:category-tree:{catalog_version()}'
+    tree = cache.get(key)
+    if tree is None:
+        tree = CategoryTree(list(Category.objects.all()))
+        cache.set(key, tree, settings.SHOP_PAGE_CACHE_TIMEOUT)
+    return tree
+
+
+async def aget_category_tree():
+    key = f'shop:category-tree:{await acatalog_version()}'
+    tree = await acache_get(key)
+    if tree is None:
+        tree = CategoryTree([category async for category in Category.objects.all()])
+        await acache_set(key, tree, settings.SHOP_PAGE_CACHE_TIMEOUT)
+    return tree
+
+
+def _count(name, backend=None):
+    backend = backend or cache
+    key = STATS_KEY_PREFIX + name
+    try:
+        backend.incr(key)
+    except ValueError:
+        backend.add(key, 0, None)
+        backend.incr(key)
+
+
+async def _acount(name):
+    local = _local_cache()
+    if local:
+        _count(name, local)
+    else:
+        key = STATS_KEY_PREFIX + name
+        try:
+            await cache.aincr(key)
+        except ValueError:
+            await cache.aadd(key, 0, None)
+            await cache.aincr(key)
+
+
+# Счетчики попаданий и промахов кэша страниц: {'hits': ..., 'misses': ..., 'hit_ratio': ...}.
+def page_cache_stats():
+    hits = cache.get(STATS_KEY_PREFIX + 'hits', 0)
+    misses = cache.get(STATS_KEY_PREFIX + 'misses', 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else 0.0,
+        'catalog_version': catalog_version(),
+    }
+
+
+# Ключ кэша страницы: версия каталога + путь (категория, товар) + параметры запроса (query, page, cursor).
+def page_cache_key(request, version=None):
+    params = '&'.join(f'{k}={v}' for k, v in sorted(request.GET.lists()))
+    digest = hashlib.md5(f'{request.path}?{params}'.encode()).hexdigest()
+    return f'shop:page:{version or catalog_version()}:{digest}'
+
+
+# Подставляет в HTML из кэша значок корзины и CSRF-токен текущего посетителя.
+def _fill_holes(request, body):
+    if CART_BADGE_PLACEHOLDER in body:
+        badge = render_to_string('shop/includes/cart_badge.html', request=request)
+        body = body.replace(CART_BADGE_PLACEHOLDER, badge)
+    if CSRF_PLACEHOLDER in body:
+        body = body.replace(CSRF_PLACEHOLDER, get_token(request))
+    return body
+
+
+# Ответ представления, выполненного для заполнения кэша: (ответ, HTML для кэша или None).
+# HTML кэшируется только для обычного ответа 200; в остальных ответах сразу заполняются "дыры".
+def _cacheable_body(request, response):
+    if hasattr(response, 'render') and callable(response.render): # TemplateResponse
+        response.render()
+    if response.status_code != 200 or response.streaming:
+        if not response.streaming:
+            response.content = _fill_holes(request, response.content.decode(response.charset))
+        return None
+    return response.content.decode(response.charset)
+
+
+def _finish(request, response, body, state):
+    response.content = _fill_holes(request, body)
+    response['X-Page-Cache'] = state
+    return response
+
+
+# Декоратор для представлений каталога: кэширует HTML страницы (GET/HEAD, ответ 200).
+# Ответ содержит заголовок X-Page-Cache: HIT или MISS.
+# Подходит и для асинхронных представлений (shop/async_views.py).
+def cache_catalog_page(view_func):
+    if iscoroutinefunction(view_func):
+        return _acache_catalog_page(view_func)
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not settings.SHOP_PAGE_CACHE_ENABLED:
+            return view_func(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        body = cache.get(key)
+        if body is None:
+            _count('misses')
+            # Флаг для контекстного процессора shop.context_processors.page_cache:
+            # вместо токена и значка корзины в шаблон попадут заглушки.
+            request.page_cache_fill = True
+            try:
+                response = view_func(request, *args, **kwargs)
+                body = _cacheable_body(request, response)
+            finally:
+                request.page_cache_fill = False
+            if body is None:
+                return response
+            cache.set(key, body, settings.SHOP_PAGE_CACHE_TIMEOUT)
+            return _finish(request, response, body, 'MISS')
+        _count('hits')
+        return _finish(request, HttpResponse(), body, 'HIT')
+    return wrapper
+
+
+# Асинхронный вариант декоратора. Перед подстановкой значка корзины корзина загружается
+# асинхронно (aget_cart), чтобы рендеринг значка не обращался к базе синхронно.
+def _acache_catalog_page(view_func):
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not settings.SHOP_PAGE_CACHE_ENABLED:
+            return await view_func(request, *args, **kwargs)
+
+        key = page_cache_key(request, await acatalog_version())
+        body = await acache_get(key)
+        if body is None:
+            await _acount('misses')
+            request.page_cache_fill = True
+            try:
+                response = await view_func(request, *args, **kwargs)
+                if hasattr(response, 'render') and callable(response.render): # TemplateResponse
+                    response.render()
+            finally:
+                request.page_cache_fill = False
+            await aget_cart(request)
+            body = _cacheable_body(request, response)
+            if body is None:
+                return response
+            await acache_set(key, body, settings.SHOP_PAGE_CACHE_TIMEOUT)
+            return _finish(request, response, body, 'MISS')
+        await _acount('hits')
+        await aget_cart(request)
+        return _finish(request, HttpResponse(), body, 'HIT')
+    return wrapper
+
+
+# --- Условные запросы (ETag, Last-Modified, ответ 304) ---
+# Браузер и поисковый робот, у которых уже есть страница каталога, получают 304 без тела.
+# Решение принимается до кэша страниц и рендеринга: версия каталога из кэша и один запрос MAX(updated)
+# по индексу (товар или товары категории).
+# ETag (слабый: CSRF-токен в HTML маскируется заново при каждом ответе) - версия каталога, адрес страницы
+# и "отпечаток" посетителя: версия корзины (значок в шапке; сама корзина не загружается,
+# см. get_cart_version) и CSRF-секрет (токен в формах "В корзину").
+# Last-Modified - время изменения товаров страницы. Проверка If-Modified-Since без ETag допустима только
+# для посетителей без сессии и CSRF-cookie (роботы): у остальных по времени не видно изменений корзины.
+# Ответ - Cache-Control: private, no-cache (браузер хранит страницу, но каждый раз проверяет ее)
+# и Vary: Cookie (страница зависит от корзины и CSRF-cookie посетителя).
+
+
+# Товары, по которым определяется время изменения списка товаров: вся категория с подкатегориями
+# (или весь каталог), включая недоступные - снятие товара с продажи тоже меняет страницу.
+# None - категории нет (представление ответит 404).
+def list_page_products(tree, category_slug=None):
+    if not category_slug:
+        return Product.objects.all()
+    category = tree.get(category_slug)
+    if category is None:
+        return None
+    return tree.filter_products(Product.objects.all(), category)
+
+
+def detail_page_products(tree, id, slug):
+    return Product.objects.filter(id=id, slug=slug, available=True)
+
+
+def _page_etag(request, version, cart_version):
+    fingerprint = f'{cart_version}:{request.META.get("CSRF_COOKIE", "")}'
+    value = salted_hmac('shop.page_etag', f'{version}:{request.get_full_path()}:{fingerprint}')
+    return f'W/"{value.hexdigest()[:32]}"'
+
+
+# Посетитель без сессии и CSRF-cookie: страница для него не зависит от корзины.
+def _anonymous(request):
+    return 'CSRF_COOKIE' not in request.META and not request.session.session_key
+
+
+# Время изменения страницы: MAX(updated) товаров; для списков (catalog_wide) - не раньше последнего
+# изменения каталога (боковое меню показывает счетчики всех категорий, а удаленный товар не оставляет
+# следа в updated).
+def _last_modified(updated, changed_at):
+    if changed_at is not None:
+        changed_at = datetime.fromtimestamp(changed_at, tz=timezone.utc)
+        updated = max(updated, changed_at) if updated else changed_at
+    return int(updated.timestamp()) if updated else None
+
+
+def _not_modified(request, etag, last_modified):
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=last_modified if _anonymous(request) else None)
+    if response is not None:
+        _set_validators(response, etag, last_modified)
+    return response
+
+
+def _set_validators(response, etag, last_modified):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+# Декоратор для представлений каталога (над cache_catalog_page): ответ 304 на условный GET/HEAD.
+# products(tree, *args, **kwargs) - QuerySet товаров страницы для Last-Modified (None или пустой - страницы
+# нет, представление выполняется как обычно). catalog_wide - страница зависит от всего каталога.
+# ETag ответа 200 считается после представления: новый посетитель получает CSRF-cookie при рендеринге.
+def conditional_catalog_page(products, catalog_wide=False):
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            return _aconditional_catalog_page(view_func, products, catalog_wide)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not settings.SHOP_CONDITIONAL_GET_ENABLED:
+                return view_func(request, *args, **kwargs)
+            version = catalog_version()
+            queryset = products(get_category_tree(), *args, **kwargs)
+            updated = queryset.aggregate(updated=Max('updated'))['updated'] if queryset is not None else None
+            if updated is None:
+                return view_func(request, *args, **kwargs)
+            last_modified = _last_modified(updated, catalog_changed_at() if catalog_wide else None)
+            cart_version = get_cart_version(request)
+            response = _not_modified(request, _page_etag(request, version, cart_version), last_modified)
+            if response is not None:
+                return response
+            response = view_func(request, *args, **kwargs)
+            return _set_validators(response, _page_etag(request, version, cart_version), last_modified)
+        return wrapper
+    return decorator
+
+
+# Асинхронный вариант: сессия и купон читаются через асинхронный API, запрос к базе - через aaggregate.
+def _aconditional_catalog_page(view_func, products, catalog_wide):
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not settings.SHOP_CONDITIONAL_GET_ENABLED:
+            return await view_func(request, *args, **kwargs)
+        version = await acatalog_version()
+        queryset = products(await aget_category_tree(), *args, **kwargs)
+        updated = (await queryset.aaggregate(updated=Max('updated')))['updated'] if queryset is not None else None
+        if updated is None:
+            return await view_func(request, *args, **kwargs)
+        changed_at = await acache_get(CATALOG_CHANGED_AT_KEY) if catalog_wide else None
+        last_modified = _last_modified(updated, changed_at)
+        cart_version = await aget_cart_version(request)
+        response = _not_modified(request, _page_etag(request, version, cart_version), last_modified)
+        if response is not None:
+            return response
+        response = await view_func(request, *args, **kwargs)
+        return _set_validators(response, _page_etag(request, version, cart_version), last_modified)
+    return wrapper
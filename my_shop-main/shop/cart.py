@@ -1,66 +1,348 @@
-from decimal import Decimal # Для точной работы с денежными суммами
-from django.conf import settings # Для доступа к настройкам проекта (CART_SESSION_ID)
-from .models import Product, Coupon # Импортируем модели Товара и Купона
+import hashlib # Для версии содержимого корзины (ETag JSON API)
+import time
+from decimal import Decimal, ROUND_HALF_UP # Для точной работы с денежными суммами
+from asgiref.sync import sync_to_async # Для пересчета цен из асинхронного кода
+from django.core.cache import cache # Версия цен каталога
+from django.db import transaction
+from .models import Product # Импортируем модель Товара
+from . import coupons # Купоны из кэша (shop/coupons.py)
+from .cart_storage import get_cart_storage, get_cart_key # Хранилище позиций корзины (сессия или таблица CartLine)
+from . import inventory # Резервы товаров с отслеживаемым остатком
 from django.utils import timezone # Для проверки срока действия купона
 
+CENT = Decimal('0.01')
+
+# Маркер "купон еще не загружался" (None означает "купона нет").
+_NOT_LOADED = object()
+
+# Версия цен каталога. Корзина хранит цены позиций на момент добавления, а в сессии - версию цен,
+# с которой эти цены сверены. Изменение цены или удаление товара (сигналы, импорт каталога) увеличивает
+# версию, и при следующей загрузке корзины ее цены пересчитываются одним запросом id__in.
+# Пока версия не менялась, итоги считаются по сохраненным ценам, без запросов к базе.
+PRICE_VERSION_KEY = 'shop:price_version'
+PRICE_VERSION_SESSION_KEY = 'cart_price_version'
+
+
+# Начальное значение - время запуска, чтобы после очистки кэша все корзины были пересчитаны.
+def price_version():
+    return cache.get_or_set(PRICE_VERSION_KEY, lambda: int(time.time()), None)
+
+
+async def aprice_version():
+    return await cache.aget_or_set(PRICE_VERSION_KEY, lambda: int(time.time()), None)
+
+
+def bump_price_version():
+    try:
+        return cache.incr(PRICE_VERSION_KEY)
+    except ValueError: # Ключа нет в кэше
+        cache.set(PRICE_VERSION_KEY, int(time.time()), None)
+        return price_version()
+
+
+# Версия корзины для ETag страниц каталога (значок корзины в шапке), без загрузки позиций корзины:
+# версия содержимого от хранилища (shop/cart_storage.py, version()) и действующий купон из реестра
+# купонов (купон может истечь или измениться в админке без изменения корзины). Сессия при этом
+# не записывается.
+def get_cart_version(request):
+    coupon_id = request.session.get('coupon_id')
+    coupon = coupons.get_coupon(coupon_id) if coupon_id else None
+    return _cart_version(get_cart_storage(request).version(), coupon)
+
+
+async def aget_cart_version(request):
+    coupon_id = await request.session.aget('coupon_id')
+    coupon = await coupons.aget_coupon(coupon_id) if coupon_id else None
+    return _cart_version(await get_cart_storage(request).aversion(), coupon)
+
+
+def _cart_version(content, coupon):
+    if coupon is not None and coupon.is_valid():
+        return f'{content}:{coupon.id}:{coupon.discount}'
+    return f'{content}:'
+
+
+# Возвращает корзину текущего запроса.
+# CartMiddleware создает ее лениво один раз на запрос (request.cart), поэтому представления
+# и контекстный процессор работают с одним и тем же объектом и его кэшем.
+def get_cart(request):
+    cart = getattr(request, 'cart', None)
+    if cart is None:
+        # Запрос без CartMiddleware (например, созданный RequestFactory) - создаем и запоминаем.
+        cart = request.cart = Cart(request)
+    return cart
+
+
+# Асинхронный вариант get_cart для асинхронных представлений (shop/async_views.py).
+# Корзина загружается целиком заранее (позиции, товары, купон), поэтому шаблоны и
+# контекстный процессор потом обращаются к ней без запросов к базе.
+# Ленивый объект из CartMiddleware в асинхронном коде использовать нельзя (он загружает
+# корзину синхронно), поэтому он заменяется готовой корзиной. type() вместо isinstance():
+# isinstance() для SimpleLazyObject сам запустил бы синхронную загрузку.
+async def aget_cart(request):
+    cart = getattr(request, 'cart', None)
+    if type(cart) is not Cart:
+        cart = request.cart = await Cart.acreate(request)
+    return cart
+
 class Cart:
     # Конструктор класса Cart. Вызывается при создании объекта корзины.
     # Принимает объект request, чтобы получить доступ к сессии.
     def __init__(self, request):
-        self.session = request.session # Сохраняем сессию пользователя
-        # Пытаемся получить данные корзины из сессии по ключу CART_SESSION_ID.
-        cart_data = self.session.get(settings.CART_SESSION_ID)
-        if not cart_data:
-            # Если корзины в сессии нет, создаем пустой словарь для нее.
-            cart_data = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart_data # Это основной словарь корзины {product_id: {'quantity': Q, 'price': P}}
+        self._setup(request)
+        self.cart = self.storage.load() # Это основной словарь корзины {product_id: {'quantity': Q, 'price': P}}
         
         # Получаем ID примененного купона из сессии, если он есть.
         self.coupon_id = self.session.get('coupon_id')
 
+        # Кэш вычисленных значений на время запроса (товары, купон, суммы).
+        # Сбрасывается при любом изменении корзины (см. _invalidate).
+        self._invalidate()
+
+        # Цены сверены с другой версией цен каталога - пересчитываем.
+        self._price_version = price_version()
+        if self.cart and self.session.get(PRICE_VERSION_SESSION_KEY) != self._price_version:
+            self.refresh_prices()
+
+    def _setup(self, request):
+        self.session = request.session # Сохраняем сессию пользователя (в ней хранится купон)
+        # Хранилище позиций корзины задается настройкой SHOP_CART_STORAGE (см. shop/cart_storage.py).
+        self.storage = get_cart_storage(request)
+        # Товары, цена которых изменилась при пересчете в этом запросе (посетитель новых цен еще не видел).
+        self.repriced = []
+
+    # Асинхронное создание корзины: содержимое, товары и купон загружаются через асинхронный ORM.
+    @classmethod
+    async def acreate(cls, request):
+        cart = cls.__new__(cls)
+        cart._setup(request)
+        cart.cart = await cart.storage.aload()
+        cart.coupon_id = await cart.session.aget('coupon_id')
+        cart._invalidate()
+        cart._price_version = await aprice_version()
+        if cart.cart and await cart.session.aget(PRICE_VERSION_SESSION_KEY) != cart._price_version:
+            # Пересчет бывает один раз после изменения цен - записи в хранилище выполняем в потоке.
+            products = [p async for p in Product.objects.filter(id__in=cart.cart.keys())]
+            await sync_to_async(cart.refresh_prices)(products)
+        else:
+            cart._items = await cart._aload_items()
+        cart._coupon = await cart._aload_coupon()
+        return cart
+
+    # Сбрасывает закэшированные товары, купон и суммы.
+    def _invalidate(self):
+        self._items = None
+        self._coupon = _NOT_LOADED
+        self._subtotal = None
+        self._discount = None
+
+    # Ключ корзины для резервов товаров (create=True - создать, если его еще нет).
+    def get_key(self, create=False):
+        return get_cart_key(self.session, create)
+
     # Метод для добавления товара в корзину или обновления его количества.
+    # Если остаток товара отслеживается, новое количество сначала резервируется на складе;
+    # при нехватке выбрасывается inventory.InsufficientStock, и корзина не меняется.
     def add(self, product, quantity=1, update_quantity=False):
         product_id = str(product.id) # Ключи в JSON (используется для сессий) должны быть строками.
-        
+
+        if product.stock is not None:
+            current = self.cart[product_id]['quantity'] if product_id in self.cart else 0
+            inventory.reserve(self.get_key(create=True), product,
+                              quantity if update_quantity else current + quantity)
+
         # Если товара еще нет в корзине, инициализируем его с ценой на момент добавления.
         if product_id not in self.cart:
             self.cart[product_id] = {'quantity': 0, 'price': str(product.price)}
+        line = self.cart[product_id]
         
         if update_quantity:
             # Если update_quantity=True, просто устанавливаем новое количество.
-            self.cart[product_id]['quantity'] = quantity
+            line['quantity'] = quantity
         else:
             # Иначе добавляем указанное количество к существующему.
-            self.cart[product_id]['quantity'] += quantity
+            line['quantity'] += quantity
         
-        # Сохраняем изменения в сессии.
+        # Записываем в хранилище только измененную позицию.
+        self._write_line(product.id, line)
         self.save()
 
-    # Метод для сохранения состояния корзины в сессии.
+    # Пакетное изменение корзины (JSON API корзины, см. views.cart_api).
+    # operations - список (op, product_id, quantity): 'add' - добавить quantity единиц,
+    # 'set' - установить количество (0 - удалить позицию), 'remove' - удалить позицию.
+    # Товары всех операций и уже лежащих в корзине позиций загружаются одним запросом (in_bulk),
+    # ими же заполняется кэш позиций, поэтому итоги после изменения считаются без новых запросов.
+    # Операции применяются в памяти (итоговое количество каждого товара, см. _replay), затем резервы всех
+    # товаров записываются одним пакетом (inventory.reserve_many), позиции - тоже одним пакетом, и корзина
+    # сохраняется один раз. Операция, которую нельзя выполнить (товар не найден, не хватает на складе),
+    # пропускается. Возвращает список ошибок {'index', 'product_id', 'error'}.
+    def apply(self, operations):
+        product_ids = {product_id for _, product_id, _ in operations} | {int(product_id) for product_id in self.cart}
+        products = Product.objects.in_bulk(product_ids)
+        errors = []
+        plan = {} # {product_id: [(index, op, quantity), ...]} в порядке операций
+        for index, (op, product_id, quantity) in enumerate(operations):
+            if product_id in products:
+                plan.setdefault(product_id, []).append((index, op, quantity))
+            else:
+                errors.append({'index': index, 'product_id': product_id, 'error': 'Товар не найден'})
+
+        with transaction.atomic():
+            tracked = any(products[product_id].stock is not None for product_id in plan)
+            cart_key = self.get_key(create=True) if tracked else None
+            results = {product_id: self._replay(product_id, ops) for product_id, ops in plan.items()}
+
+            # Товару, которому не хватило остатка, операции повторяются с известным свободным остатком.
+            def fit(product, available):
+                results[product.pk] = self._replay(product.pk, plan[product.pk], available)
+                return results[product.pk][0]
+
+            limits = inventory.reserve_many(cart_key, {products[product_id]: quantity
+                                                       for product_id, (quantity, _, _) in results.items()}, fit)
+
+            changed, removed = {}, []
+            for product_id, (quantity, failed, applied) in results.items():
+                product, key = products[product_id], str(product_id)
+                if failed:
+                    error = str(inventory.InsufficientStock({product_id: limits[product_id]},
+                                                            {product_id: product.name}))
+                    errors.extend({'index': index, 'product_id': product_id, 'error': error} for index in failed)
+                if not applied:
+                    continue
+                if quantity:
+                    line = self.cart.setdefault(key, {'quantity': 0, 'price': str(product.price)})
+                    line['quantity'] = quantity
+                    changed[product_id] = (quantity, line['price'])
+                elif key in self.cart:
+                    del self.cart[key]
+                    removed.append(product_id)
+            self.storage.set_lines(changed)
+            self.storage.remove_lines(removed)
+            self.save()
+        self._items = self._build_items(products.values())
+        return sorted(errors, key=lambda error: error['index'])
+
+    # Количество товара в корзине после операций ops [(index, op, quantity), ...] (см. apply).
+    # limit - сколько можно зарезервировать (None - без ограничения): операция, которая увеличивает количество
+    # сверх него, пропускается, как при нехватке остатка в add().
+    # Возвращает (количество, индексы пропущенных операций, выполнена ли хоть одна операция).
+    def _replay(self, product_id, ops, limit=None):
+        line = self.cart.get(str(product_id))
+        quantity = line['quantity'] if line else 0
+        failed, applied = [], False
+        for index, op, value in ops:
+            new = 0 if op == 'remove' else value if op == 'set' else quantity + value
+            if limit is not None and new > quantity and new > limit:
+                failed.append(index)
+            else:
+                quantity, applied = new, True
+        return quantity, failed, applied
+
+    # Версия содержимого корзины (позиции, цены, действующий купон): меняется при любом изменении,
+    # от которого зависят итоги. Используется как ETag в JSON API корзины.
+    def get_version(self):
+        lines = sorted((int(product_id), item['quantity'], item['price']) for product_id, item in self.cart.items())
+        coupon = self.coupon
+        data = repr((lines, coupon.id if coupon else None, coupon.discount if coupon else None))
+        return hashlib.sha1(data.encode()).hexdigest()[:20]
+
+    # Содержимое корзины и итоги для JSON API корзины (суммы - строки с двумя знаками после запятой).
+    def as_dict(self):
+        coupon = self.coupon
+        return {
+            'version': self.get_version(),
+            'count': len(self),
+            'lines': [{
+                'product_id': item['product'].id,
+                'name': item['product'].name,
+                'url': item['product'].get_absolute_url(),
+                'quantity': item['quantity'],
+                'price': str(item['price'].quantize(CENT)),
+                'total_price': str(item['total_price'].quantize(CENT)),
+            } for item in self],
+            'subtotal': str(Decimal(self.get_subtotal_price()).quantize(CENT, ROUND_HALF_UP)),
+            'discount': str(self.get_discount_amount().quantize(CENT, ROUND_HALF_UP)),
+            'total': str(Decimal(self.get_total_price()).quantize(CENT, ROUND_HALF_UP)),
+            'coupon': {'code': coupon.code, 'discount': coupon.discount} if coupon else None,
+        }
+
+    # Запись позиции в хранилище (None - удаление).
+    def _write_line(self, product_id, line):
+        if line is None:
+            self.storage.remove_line(product_id)
+        else:
+            self.storage.set_line(product_id, line['quantity'], line['price'])
+
+    # Пересчет цен позиций по текущим ценам товаров (products - уже загруженные товары корзины,
+    # None - загрузить одним запросом). Изменившиеся цены записываются в хранилище одним пакетом,
+    # позиции удаленных товаров убираются; загруженными товарами заполняется кэш позиций.
+    def refresh_prices(self, products=None):
+        if products is None:
+            products = Product.objects.filter(id__in=self.cart.keys())
+        products = {str(product.id): product for product in products}
+        changed, removed = {}, []
+        for product_id, line in self.cart.items():
+            product = products.get(product_id)
+            if product is None:
+                removed.append(product_id)
+            elif Decimal(line['price']) != product.price:
+                line['price'] = str(product.price)
+                changed[int(product_id)] = (line['quantity'], line['price'])
+                self.repriced.append(product)
+        for product_id in removed:
+            del self.cart[product_id]
+        self.storage.set_lines(changed)
+        self.storage.remove_lines([int(product_id) for product_id in removed])
+        self.save()
+        self._items = self._build_items(products.values())
+
+    # Метод для сохранения состояния корзины.
+    # Вместе с позициями в сессии запоминается версия цен, с которой они сверены.
     def save(self):
-        # Помечаем сессию как измененную, чтобы Django сохранил ее.
-        self.session.modified = True
+        if self.cart and self.session.get(PRICE_VERSION_SESSION_KEY) != self._price_version:
+            self.session[PRICE_VERSION_SESSION_KEY] = self._price_version
+        self.storage.save()
+        # Содержимое корзины изменилось - закэшированные товары и суммы больше не актуальны.
+        self._invalidate()
 
-    # Метод для удаления товара из корзины.
+    # Метод для удаления товара из корзины (резерв товара возвращается на склад).
     def remove(self, product):
         product_id = str(product.id)
         if product_id in self.cart:
             del self.cart[product_id]
+            self._write_line(product.id, None)
+            if product.stock is not None and self.get_key():
+                inventory.release(self.get_key(), [product.id])
             self.save()
 
     # "Магический" метод, который позволяет итерироваться по объекту Cart (например, в цикле for в шаблоне).
     # Он будет возвращать каждый товар в корзине вместе с его данными (цена, количество, объект Product).
+    # Товары загружаются из базы один раз за запрос, повторные итерации используют готовый список.
     def __iter__(self):
+        if self._items is None:
+            self._items = self._load_items()
+        return iter(self._items)
+
+    # Загрузка товаров корзины и подготовка элементов для итерации.
+    def _load_items(self):
         product_ids = self.cart.keys() # Получаем ID всех товаров в корзине.
         
         # Получаем все объекты Product из базы данных одним запросом для эффективности.
         products = Product.objects.filter(id__in=product_ids)
+        return self._build_items(products)
+
+    async def _aload_items(self):
+        if not self.cart:
+            return []
+        return self._build_items([p async for p in Product.objects.filter(id__in=self.cart.keys())])
+
+    # Элементы корзины для итерации: данные позиций + объекты Product.
+    def _build_items(self, products):
         # Создаем словарь {product_id: product_object} для быстрого доступа к объектам Product.
         product_map = {str(p.id): p for p in products}
 
-        cart_for_iteration = self.cart.copy() # Работаем с копией, чтобы не изменять self.cart напрямую
-
-        for product_id, item_data_from_session in cart_for_iteration.items():
+        items = []
+        for product_id, item_data_from_session in self.cart.items():
             product_object = product_map.get(product_id)
             if product_object: # Убедимся, что товар с таким ID все еще существует в БД
                 # Создаем новый словарь для каждого элемента, чтобы безопасно добавлять объект 'product'
@@ -68,53 +350,73 @@ class Cart:
                 current_item_details['product'] = product_object # Добавляем сам объект Product
                 current_item_details['price'] = Decimal(current_item_details['price']) # Преобразуем цену в Decimal
                 current_item_details['total_price'] = current_item_details['price'] * current_item_details['quantity']
-                yield current_item_details # Возвращаем подготовленный элемент корзины
+                items.append(current_item_details) # Добавляем подготовленный элемент корзины
+        return items
 
     # "Магический" метод, который позволяет использовать len(cart) для получения общего кол-ва единиц товаров.
     def __len__(self):
         return sum(item['quantity'] for item in self.cart.values())
 
     # Метод для получения общей стоимости всех товаров в корзине (до применения скидки).
+    # Результат кэшируется до следующего изменения корзины.
     def get_subtotal_price(self):
-        return sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
+        if self._subtotal is None:
+            self._subtotal = sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
+        return self._subtotal
 
     # Property для получения объекта Coupon, если он применен и валиден.
     # @property позволяет обращаться к методу как к атрибуту (cart.coupon).
+    # Купон берется из реестра купонов в кэше один раз за запрос (в шаблонах cart.coupon используется много раз).
     @property
     def coupon(self):
+        if self._coupon is _NOT_LOADED:
+            self._coupon = self._load_coupon()
+        return self._coupon
+
+    def _load_coupon(self):
         if self.coupon_id:
-            try:
-                coupon_obj = Coupon.objects.get(id=self.coupon_id)
-                # Дополнительно проверяем валидность купона здесь,
-                # так как он мог стать невалидным после добавления в сессию.
-                if coupon_obj.is_valid():
-                    return coupon_obj
-                else:
-                    # Если купон стал невалидным, удаляем его из сессии.
-                    self.session['coupon_id'] = None
-                    self.save()
-            except Coupon.DoesNotExist:
-                # Если купон с таким ID был удален из БД, очищаем его из сессии.
-                self.session['coupon_id'] = None
-                self.save()
+            coupon_obj = coupons.get_coupon(self.coupon_id)
+            # Дополнительно проверяем валидность купона здесь,
+            # так как он мог стать невалидным после добавления в сессию.
+            if coupon_obj is not None and coupon_obj.is_valid():
+                return coupon_obj
+            # Если купон удален из БД или стал невалидным, удаляем его из сессии.
+            self.session['coupon_id'] = self.coupon_id = None
+            self.session.modified = True
         return None # Если купона нет или он невалиден
 
+    async def _aload_coupon(self):
+        if self.coupon_id:
+            coupon_obj = await coupons.aget_coupon(self.coupon_id)
+            if coupon_obj is not None and coupon_obj.is_valid():
+                return coupon_obj
+            # Купон удален или стал невалидным - убираем его из сессии.
+            self.coupon_id = None
+            await self.session.aset('coupon_id', None)
+        return None
+
     # Метод для расчета суммы скидки по купону.
     def get_discount_amount(self):
-        active_coupon = self.coupon # Получаем текущий валидный купон через property
-        if active_coupon:
-            # Рассчитываем скидку от общей суммы товаров (до скидки).
-            return (Decimal(active_coupon.discount) / Decimal('100')) * self.get_subtotal_price()
-        return Decimal('0') # Если купона нет, скидка 0.
+        if self._discount is None:
+            active_coupon = self.coupon # Получаем текущий валидный купон через property
+            if active_coupon:
+                # Рассчитываем скидку от общей суммы товаров (до скидки).
+                self._discount = (Decimal(active_coupon.discount) / Decimal('100')) * self.get_subtotal_price()
+            else:
+                self._discount = Decimal('0') # Если купона нет, скидка 0.
+        return self._discount
 
     # Метод для получения итоговой стоимости корзины (с учетом скидки).
     def get_total_price(self):
         return self.get_subtotal_price() - self.get_discount_amount()
 
-    # Метод для полной очистки корзины (удаление товаров и купона из сессии).
+    # Метод для полной очистки корзины (удаление товаров из хранилища, резервов и купона из сессии).
     def clear(self):
-        if settings.CART_SESSION_ID in self.session:
-            del self.session[settings.CART_SESSION_ID]
+        self.storage.clear()
+        if self.get_key():
+            inventory.release(self.get_key())
+        self.cart = {}
         if 'coupon_id' in self.session:
             del self.session['coupon_id']
+        self.coupon_id = None
         self.save() # Сохраняем сессию после удаления ключей.
\ No newline at end of file
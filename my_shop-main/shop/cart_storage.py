@@ -0,0 +1,236 @@
+import hashlib # Для версии корзины в сессии
+import json
+import secrets # Для генерации случайного ключа корзины
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async # Для редких синхронных операций из асинхронного кода
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.module_loading import import_string # Для загрузки класса хранилища по пути из настроек
+
+from .models import CartLine, Product
+
+# Хранилища содержимого корзины.
+# Класс Cart (shop/cart.py) работает со словарем {product_id (строка): {'quantity': Q, 'price': 'P'}},
+# а где этот словарь хранится, решает хранилище, заданное настройкой SHOP_CART_STORAGE:
+#   - SessionCartStorage  - вся корзина в сессии (как было раньше);
+#   - DatabaseCartStorage - каждая позиция отдельной строкой в таблице CartLine.
+# Интерфейс хранилища: load() (и асинхронный aload()), set_line(), remove_line(), clear(), save(),
+# set_lines() и remove_lines() - пакетные изменения (JSON API корзины, Cart.apply),
+# version() (и aversion()) - строка, которая меняется при любом изменении позиций; по ней строится
+# ETag страниц каталога без загрузки корзины и без записи в сессию.
+
+
+# Возвращает хранилище корзины для запроса (класс берется из settings.SHOP_CART_STORAGE).
+def get_cart_storage(request):
+    storage_class = import_string(getattr(settings, 'SHOP_CART_STORAGE', 'shop.cart_storage.SessionCartStorage'))
+    return storage_class(request)
+
+
+# Случайный ключ корзины, сохраненный в сессии посетителя (create=True - создать, если его еще нет).
+# Им помечаются строки CartLine и резервы товаров (StockReservation); в отличие от ключа сессии,
+# он не меняется при входе пользователя.
+CART_KEY_SESSION_KEY = 'cart_key'
+
+
+def get_cart_key(session, create=False):
+    key = session.get(CART_KEY_SESSION_KEY)
+    if key is None and create:
+        key = session[CART_KEY_SESSION_KEY] = secrets.token_urlsafe(24)
+    return key
+
+
+# Базовый класс хранилища.
+class BaseCartStorage:
+    def __init__(self, request):
+        self.request = request
+        self.session = request.session
+
+    # Загрузка содержимого корзины: {product_id: {'quantity': int, 'price': str}}.
+    def load(self):
+        raise NotImplementedError
+
+    # Асинхронная загрузка (для асинхронных представлений, см. shop/async_views.py).
+    # По умолчанию - синхронная загрузка в отдельном потоке.
+    async def aload(self):
+        return await sync_to_async(self.load)()
+
+    # Установить количество и цену позиции (добавить, если ее не было).
+    def set_line(self, product_id, quantity, price):
+        raise NotImplementedError
+
+    # Удалить позицию.
+    def remove_line(self, product_id):
+        raise NotImplementedError
+
+    # Удалить все позиции.
+    def clear(self):
+        raise NotImplementedError
+
+    # Установить несколько позиций: lines - {product_id: (quantity, price)}.
+    def set_lines(self, lines):
+        for product_id, (quantity, price) in lines.items():
+            self.set_line(product_id, quantity, price)
+
+    # Удалить несколько позиций.
+    def remove_lines(self, product_ids):
+        for product_id in product_ids:
+            self.remove_line(product_id)
+
+    # Сохранить изменения (для хранилищ, которые пишут данные не сразу).
+    def save(self):
+        pass
+
+    # Версия содержимого корзины.
+    def version(self):
+        raise NotImplementedError
+
+    async def aversion(self):
+        return await sync_to_async(self.version)()
+
+
+# Хранилище в сессии: вся корзина - один словарь в request.session[CART_SESSION_ID].
+# При любом изменении сессия (целиком) помечается измененной и перезаписывается.
+class SessionCartStorage(BaseCartStorage):
+    def load(self):
+        # Пустая корзина в сессию не записывается, чтобы не сохранять сессию без необходимости.
+        return self.session.get(settings.CART_SESSION_ID) or {}
+
+    async def aload(self):
+        return await self.session.aget(settings.CART_SESSION_ID) or {}
+
+    def _data(self):
+        return self.session.setdefault(settings.CART_SESSION_ID, {})
+
+    def set_line(self, product_id, quantity, price):
+        self._data()[str(product_id)] = {'quantity': quantity, 'price': str(price)}
+        self.save()
+
+    def remove_line(self, product_id):
+        data = self.session.get(settings.CART_SESSION_ID) or {}
+        if data.pop(str(product_id), None) is not None:
+            self.save()
+
+    def clear(self):
+        if settings.CART_SESSION_ID in self.session:
+            del self.session[settings.CART_SESSION_ID]
+
+    def save(self):
+        # Помечаем сессию как измененную, чтобы Django сохранил ее.
+        self.session.modified = True
+
+    # Хэш содержимого корзины из сессии (сессия уже загружена - запросов нет).
+    def version(self):
+        return self._version(self.session.get(settings.CART_SESSION_ID))
+
+    async def aversion(self):
+        return self._version(await self.session.aget(settings.CART_SESSION_ID))
+
+    @staticmethod
+    def _version(data):
+        if not data:
+            return ''
+        return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()[:20]
+
+
+# Хранилище в базе данных: таблица CartLine, одна строка на позицию.
+# Изменение количества - UPDATE одной строки; сессия записывается только один раз,
+# когда в ней сохраняется ключ корзины.
+# Старые корзины из сессии (формат SessionCartStorage) переносятся в таблицу при первой загрузке.
+class DatabaseCartStorage(BaseCartStorage):
+    SESSION_KEY = CART_KEY_SESSION_KEY
+
+    # Ключ корзины из сессии (create=True - создать, если его еще нет).
+    def get_key(self, create=False):
+        return get_cart_key(self.session, create)
+
+    def load(self):
+        self._migrate_session_cart()
+        key = self.get_key()
+        if key is None:
+            return {}
+        lines = CartLine.objects.filter(cart_key=key).values_list('product_id', 'quantity', 'price')
+        return self._to_dict(lines)
+
+    async def aload(self):
+        if await self.session.aget(settings.CART_SESSION_ID) is not None:
+            # Перенос старой корзины бывает один раз на посетителя - выполняем синхронно в потоке.
+            await sync_to_async(self._migrate_session_cart)()
+        key = await self.session.aget(self.SESSION_KEY)
+        if key is None:
+            return {}
+        lines = CartLine.objects.filter(cart_key=key).values_list('product_id', 'quantity', 'price')
+        return self._to_dict([line async for line in lines])
+
+    # Количество позиций и время последнего изменения (Max(updated)) - один запрос по индексу cart_key:
+    # set_line/set_lines обновляют updated, удаление позиции меняет количество.
+    def version(self):
+        key = self.get_key()
+        if key is None:
+            return ''
+        return self._version(CartLine.objects.filter(cart_key=key)
+                             .aggregate(lines=Count('id'), updated=Max('updated')))
+
+    async def aversion(self):
+        key = await self.session.aget(self.SESSION_KEY)
+        if key is None:
+            return ''
+        return self._version(await CartLine.objects.filter(cart_key=key)
+                             .aaggregate(lines=Count('id'), updated=Max('updated')))
+
+    @staticmethod
+    def _version(row):
+        return f'{row["lines"]}:{row["updated"].timestamp() if row["updated"] else ""}'
+
+    @staticmethod
+    def _to_dict(lines):
+        return {str(product_id): {'quantity': quantity, 'price': str(price)}
+                for product_id, quantity, price in lines}
+
+    # Перенос корзины из старого формата (словарь в сессии) в таблицу CartLine.
+    def _migrate_session_cart(self):
+        legacy = self.session.get(settings.CART_SESSION_ID)
+        if legacy is None:
+            return
+        del self.session[settings.CART_SESSION_ID]
+        if not legacy:
+            return
+        key = self.get_key(create=True)
+        # Товары, удаленные из каталога, не переносим (иначе нарушится внешний ключ).
+        existing = set(Product.objects.filter(id__in=legacy.keys()).values_list('id', flat=True))
+        CartLine.objects.bulk_create([
+            CartLine(cart_key=key, product_id=int(product_id),
+                     quantity=item['quantity'], price=Decimal(item['price']))
+            for product_id, item in legacy.items() if int(product_id) in existing
+        ], ignore_conflicts=True)
+
+    # Одна позиция - тем же INSERT ... ON CONFLICT, что и в set_lines: два одновременных запроса,
+    # добавляющих один товар, не нарушают уникальность (cart_key, product).
+    def set_line(self, product_id, quantity, price):
+        self.set_lines({product_id: (quantity, price)})
+
+    def remove_line(self, product_id):
+        key = self.get_key()
+        if key is not None:
+            CartLine.objects.filter(cart_key=key, product_id=product_id).delete()
+
+    def clear(self):
+        key = self.get_key()
+        if key is not None:
+            CartLine.objects.filter(cart_key=key).delete()
+
+    # Все позиции одним запросом INSERT ... ON CONFLICT (cart_key, product_id) DO UPDATE.
+    def set_lines(self, lines):
+        if not lines:
+            return
+        key, now = self.get_key(create=True), timezone.now()
+        CartLine.objects.bulk_create(
+            [CartLine(cart_key=key, product_id=product_id, quantity=quantity, price=price, updated=now)
+             for product_id, (quantity, price) in lines.items()],
+            update_conflicts=True, unique_fields=['cart_key', 'product'], update_fields=['quantity', 'price', 'updated'])
+
+    def remove_lines(self, product_ids):
+        key = self.get_key()
+        if key is not None and product_ids:
+            CartLine.objects.filter(cart_key=key, product_id__in=product_ids).delete()
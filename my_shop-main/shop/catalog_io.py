@@ -0,0 +1,301 @@
+import csv
+import json
+import re
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+from . import related, search
+from . import categories as category_tree # Дерево категорий и счетчики товаров
+from .caching import bump_catalog_version
+from .cart import bump_price_version # Импорт мог изменить цены товаров в корзинах
+from .models import Category, Product
+
+# Массовый импорт и экспорт каталога (команды import_catalog и export_catalog).
+# Файл читается и пишется потоком, порциями по chunk_size строк, поэтому расход памяти
+# не зависит от размера файла. Формат - CSV с заголовком или JSONL (один JSON-объект на строку).
+# Поля строки:
+#   slug          - ключ товара: товар с таким slug обновляется, иначе создается. Если не задан,
+#                   создается новый товар со slug из названия (с транслитерацией и суффиксом -2, -3 ...);
+#   name, price, category_slug - обязательные;
+#   category_name - название категории, если ее нужно создать (по умолчанию - ее slug);
+#   description, available, stock - необязательные: если колонки нет в файле, у существующих
+#                   товаров эти поля не меняются (stock пустой - остаток не отслеживается).
+# Каждая порция - одна транзакция: категории ищутся и создаются одним запросом на порцию,
+# товары записываются одним INSERT ... ON CONFLICT (slug) DO UPDATE (bulk_create с update_conflicts).
+# Сигналы при этом не вызываются, поэтому поисковый индекс обновляется здесь же по порциям,
+# а похожие товары затронутых категорий и версия каталога (кэш страниц) - в конце импорта.
+
+FIELDS = ['slug', 'name', 'category_slug', 'category_name', 'price', 'available', 'stock', 'description']
+OPTIONAL_FIELDS = ['description', 'available', 'stock']
+
+_TRUE = {'1', 'true', 'yes', 'y', 'да', 'on'}
+_FALSE = {'0', 'false', 'no', 'n', 'нет', 'off'}
+
+# Транслитерация для slug из русских названий (slugify без allow_unicode кириллицу просто удаляет).
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '',
+    'э': 'e', 'ю': 'iu', 'я': 'ia',
+})
+
+_SLUG_MAX_LENGTH = Product._meta.get_field('slug').max_length
+_SUFFIX_RE = re.compile(r'-(\d+)$')
+
+
+# Ошибка в строке файла (строка пропускается).
+class RowError(ValueError):
+    pass
+
+
+def make_slug(text):
+    slug = slugify(text.lower().translate(_TRANSLIT))
+    return slug[:_SLUG_MAX_LENGTH - 10].strip('-') or 'product' # Запас под суффикс -N
+
+
+# --- Чтение ---
+
+# Строки CSV-файла: (номер строки, словарь). Набор колонок - из заголовка.
+def read_csv(f):
+    reader = csv.DictReader(f)
+    for row in reader:
+        yield reader.line_num, row
+
+
+# Строки JSONL-файла: (номер строки, словарь). Пустые строки пропускаются.
+def read_jsonl(f):
+    for line_num, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = RowError(f'неверный JSON: {e}')
+        yield line_num, row
+
+
+# Проверка и преобразование одной строки файла в словарь значений полей товара.
+def parse_row(row):
+    if isinstance(row, RowError):
+        raise row
+    if not isinstance(row, dict):
+        raise RowError('ожидался объект')
+    values = {key: (value.strip() if isinstance(value, str) else value) for key, value in row.items() if key}
+
+    name = values.get('name') or ''
+    if not name:
+        raise RowError('не задано название (name)')
+    category_slug = values.get('category_slug') or ''
+    if not category_slug:
+        raise RowError('не задана категория (category_slug)')
+    try:
+        price = Decimal(str(values.get('price'))).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise RowError(f'неверная цена: {values.get("price")!r}')
+    if price < 0 or price.adjusted() >= 8: # max_digits=10, decimal_places=2
+        raise RowError(f'неверная цена: {price}')
+
+    parsed = {
+        'slug': values.get('slug') or '',
+        'name': name[:200],
+        'category_slug': category_slug,
+        'category_name': (values.get('category_name') or '')[:200],
+        'price': price,
+        'description': values.get('description') or '',
+        'available': True,
+        'stock': None,
+    }
+    available = values.get('available')
+    if isinstance(available, bool):
+        parsed['available'] = available
+    elif available not in (None, ''):
+        flag = str(available).lower()
+        if flag not in _TRUE | _FALSE:
+            raise RowError(f'неверное значение available: {available!r}')
+        parsed['available'] = flag in _TRUE
+    stock = values.get('stock')
+    if stock not in (None, ''):
+        try:
+            parsed['stock'] = int(stock)
+        except (TypeError, ValueError):
+            raise RowError(f'неверный остаток: {stock!r}')
+        if parsed['stock'] < 0:
+            raise RowError(f'неверный остаток: {stock!r}')
+    return parsed
+
+
+# --- Импорт ---
+
+# Категории порции по slug: существующие загружаются одним запросом, недостающие создаются одним
+# bulk_create. known - словарь {slug: id} между порциями (категорий немного).
+def _resolve_categories(rows, known):
+    names = {}
+    for row in rows:
+        if row['category_slug'] not in known and not names.get(row['category_slug']):
+            names[row['category_slug']] = row['category_name']
+    if not names:
+        return
+    known.update(Category.objects.filter(slug__in=names).values_list('slug', 'id'))
+    missing = [slug for slug in names if slug not in known]
+    if missing:
+        Category.objects.bulk_create([Category(slug=slug, name=names[slug] or slug) for slug in missing],
+                                     ignore_conflicts=True)
+        known.update(Category.objects.filter(slug__in=missing).values_list('slug', 'id'))
+
+
+# Уникальные slug для новых товаров без slug. taken - slug, уже занятые в этой порции.
+# Занятые в базе варианты (точное совпадение или base-N) ищутся запросами на группы по
+# SLUG_QUERY_GROUP основ (длинная цепочка OR упирается в ограничение глубины выражения SQLite).
+SLUG_QUERY_GROUP = 200
+
+
+def _assign_slugs(rows, taken):
+    pending = [row for row in rows if not row['slug']]
+    if not pending:
+        return
+    bases = {make_slug(row['name']) for row in pending}
+    existing = set()
+    ordered = sorted(bases)
+    for start in range(0, len(ordered), SLUG_QUERY_GROUP):
+        group = ordered[start:start + SLUG_QUERY_GROUP]
+        condition = Q(slug__in=group)
+        for base in group:
+            condition |= Q(slug__startswith=f'{base}-')
+        existing.update(Product.objects.filter(condition).values_list('slug', flat=True))
+    # Следующий свободный номер для каждой основы (сама основа занята - начинаем с -2).
+    next_number = {}
+    for slug in existing | taken:
+        if slug in bases:
+            next_number[slug] = max(next_number.get(slug, 2), 2)
+        match = _SUFFIX_RE.search(slug)
+        if match and slug[:match.start()] in bases:
+            base = slug[:match.start()]
+            next_number[base] = max(next_number.get(base, 2), int(match.group(1)) + 1)
+    for row in pending:
+        base = make_slug(row['name'])
+        if base in next_number:
+            row['slug'] = f'{base}-{next_number[base]}'
+            next_number[base] += 1
+        else:
+            row['slug'] = base
+            next_number[base] = 2
+        taken.add(row['slug'])
+
+
+# Запись одной порции. Возвращает (создано, обновлено, id категорий записанных товаров).
+def _write_chunk(rows, update_fields, categories):
+    # Одинаковый slug дважды в порции - остается последняя строка (как при последовательном обновлении).
+    rows = list({row['slug']: row for row in rows if row['slug']}.values()) + [row for row in rows if not row['slug']]
+    with transaction.atomic():
+        _resolve_categories(rows, categories)
+        given = [row['slug'] for row in rows if row['slug']]
+        existing = set(Product.objects.filter(slug__in=given).values_list('slug', flat=True)) if given else set()
+        _assign_slugs(rows, set(given))
+
+        Product.objects.bulk_create(
+            [Product(slug=row['slug'], name=row['name'], category_id=categories[row['category_slug']],
+                     price=row['price'], description=row['description'], available=row['available'],
+                     stock=row['stock'])
+             for row in rows],
+            update_conflicts=True, unique_fields=['slug'], update_fields=update_fields,
+        )
+        products = list(Product.objects.filter(slug__in=[row['slug'] for row in rows])
+                        .values_list('id', 'name', 'description', 'category_id'))
+        # bulk_create не вызывает сигналы - индексируем порцию сразу.
+        search.index_documents([(pk, name, description) for pk, name, description, _ in products])
+    created = len(rows) - len(existing)
+    return created, len(existing), {category_id for *_, category_id in products}
+
+
+# Импорт строк rows (итератор пар (номер строки, словарь) из read_csv/read_jsonl).
+# columns - какие колонки есть в файле (необязательные поля обновляются, только если они есть).
+# progress(stats) вызывается после каждой порции. Возвращает статистику:
+# {'rows', 'created', 'updated', 'skipped', 'errors': [(строка, текст), ...], 'seconds', 'related_seconds'}
+# (seconds - запись товаров, related_seconds - перестроение похожих товаров в конце).
+def import_rows(rows, columns, chunk_size=1000, reindex_related=True, progress=None, max_errors=20):
+    update_fields = ['name', 'category', 'price', 'updated'] + [field for field in OPTIONAL_FIELDS if field in columns]
+    stats = {'rows': 0, 'created': 0, 'updated': 0, 'skipped': 0, 'errors': [], 'seconds': 0.0,
+             'related_seconds': 0.0}
+    categories = {}
+    touched_categories = set()
+    started = time.perf_counter()
+
+    def flush(chunk):
+        created, updated, category_ids = _write_chunk(chunk, update_fields, categories)
+        stats['created'] += created
+        stats['updated'] += updated
+        touched_categories.update(category_ids)
+        stats['seconds'] = time.perf_counter() - started
+        if progress:
+            progress(stats)
+
+    chunk = []
+    for line_num, row in rows:
+        stats['rows'] += 1
+        try:
+            chunk.append(parse_row(row))
+        except RowError as e:
+            stats['skipped'] += 1
+            if len(stats['errors']) < max_errors:
+                stats['errors'].append((line_num, str(e)))
+            continue
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    stats['seconds'] = time.perf_counter() - started
+
+    if stats['created'] or stats['updated']:
+        # Пути новых категорий и счетчики товаров (bulk_create и upsert не вызывают сигналов)
+        category_tree.rebuild()
+        if reindex_related:
+            started = time.perf_counter()
+            related.rebuild_categories(touched_categories)
+            stats['related_seconds'] = time.perf_counter() - started
+        bump_catalog_version()
+        if stats['updated']: # Цены существующих товаров могли измениться (upsert не вызывает сигналов)
+            transaction.on_commit(bump_price_version)
+    return stats
+
+
+# --- Экспорт ---
+
+# Товары для экспорта: словари в формате импорта. Читаются курсором порциями по chunk_size
+# (QuerySet.iterator), без загрузки всей таблицы в память.
+def export_rows(queryset=None, chunk_size=2000):
+    queryset = Product.objects.all() if queryset is None else queryset
+    rows = (queryset.order_by('pk')
+            .values_list('slug', 'name', 'category__slug', 'category__name', 'price', 'available', 'stock',
+                         'description')
+            .iterator(chunk_size=chunk_size))
+    for slug, name, category_slug, category_name, price, available, stock, description in rows:
+        yield {
+            'slug': slug, 'name': name, 'category_slug': category_slug, 'category_name': category_name,
+            'price': str(price), 'available': available, 'stock': stock, 'description': description,
+        }
+
+
+# Записывает товары в файл f в формате fmt ('csv' или 'jsonl'). progress(количество) вызывается
+# после каждых chunk_size строк. Возвращает количество выгруженных товаров.
+def export_catalog(f, fmt='csv', queryset=None, chunk_size=2000, progress=None):
+    if fmt == 'csv':
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        write = lambda row: writer.writerow(
+            row | {'available': int(row['available']), 'stock': '' if row['stock'] is None else row['stock']})
+    else:
+        write = lambda row: f.write(json.dumps(row, ensure_ascii=False) + '\n')
+    count = 0
+    for row in export_rows(queryset, chunk_size):
+        write(row)
+        count += 1
+        if progress and count % chunk_size == 0:
+            progress(count)
+    return count
@@ -0,0 +1,144 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, IntegerField, Value, When
+from django.db.models.functions import Concat, Greatest, Substr
+
+from .models import Category, Product
+
+# Дерево категорий (материализованный путь Category.path) и счетчики товаров Category.product_count.
+# - CategoryTree     - снимок всего дерева: боковое меню, поиск категории по slug, цепочка предков.
+#                      Хранится в кэше (caching.get_category_tree), страница каталога не читает категории из базы.
+# - product_moved()  - счетчики при сохранении или удалении товара: один UPDATE для всех затронутых предков.
+# - move_subtree()   - перенос категории к другому родителю: пути и уровни всех потомков одним UPDATE,
+#                      счетчики старых и новых предков - еще одним.
+# - rebuild()        - полный пересчет путей, уровней и счетчиков (команда rebuild_category_tree, а также
+#                      после массового импорта и генерации тестовых данных, где сигналы не вызываются).
+
+STEP = Category.PATH_STEP
+
+
+# id категорий пути - от верхнего уровня до самой категории.
+def path_ids(path):
+    return [int(path[i:i + STEP]) for i in range(0, len(path), STEP)]
+
+
+# Верхняя граница диапазона поддерева: следующее число той же длины, что и путь.
+def _upper(path):
+    return str(int(path) + 1).zfill(len(path))
+
+
+# Прибавляет к счетчикам товаров deltas - {category_id: изменение} - одним UPDATE.
+def _add_counts(deltas):
+    deltas = {category_id: delta for category_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    change = Case(*[When(id=category_id, then=Value(delta)) for category_id, delta in deltas.items()],
+                  default=Value(0), output_field=IntegerField())
+    Category.objects.filter(id__in=deltas).update(product_count=Greatest(F('product_count') + change, Value(0)))
+
+
+# Доступный товар перешел из категории old_category_id в new_category_id (None - товар появился
+# или исчез, стал доступен или недоступен). Общие предки обеих категорий не меняются.
+def product_moved(old_category_id, new_category_id, count=1):
+    ids = [category_id for category_id in (old_category_id, new_category_id) if category_id is not None]
+    paths = dict(Category.objects.filter(id__in=ids).values_list('id', 'path'))
+    deltas = defaultdict(int)
+    for category_id, sign in ((old_category_id, -1), (new_category_id, 1)):
+        if category_id in paths:
+            for ancestor_id in path_ids(paths[category_id]) or [category_id]:
+                deltas[ancestor_id] += sign * count
+    _add_counts(deltas)
+
+
+# Категория перенесена: ее путь сменился с old_path на category.path (сама она уже сохранена).
+@transaction.atomic
+def move_subtree(category, old_path):
+    new_path = category.path
+    Category.objects.filter(path__gt=old_path, path__lt=_upper(old_path)).update(
+        path=Concat(Value(new_path), Substr('path', len(old_path) + 1), output_field=CharField()),
+        depth=F('depth') + (len(new_path) - len(old_path)) // STEP,
+    )
+    count = Category.objects.values_list('product_count', flat=True).get(pk=category.pk)
+    deltas = defaultdict(int)
+    for ancestor_id in path_ids(old_path)[:-1]:
+        deltas[ancestor_id] -= count
+    for ancestor_id in path_ids(new_path)[:-1]:
+        deltas[ancestor_id] += count
+    _add_counts(deltas)
+
+
+# Полный пересчет: пути и уровни - обходом дерева от корней по parent, счетчики - один GROUP BY
+# по товарам и суммирование снизу вверх. Записываются только изменившиеся категории.
+# Возвращает количество обновленных категорий.
+@transaction.atomic
+def rebuild(batch_size=500):
+    rows = list(Category.objects.order_by().values_list('id', 'parent_id', 'path', 'depth', 'product_count'))
+    children = defaultdict(list)
+    for category_id, parent_id, *_ in rows:
+        children[parent_id].append(category_id)
+    direct = dict(Product.objects.filter(available=True).order_by().values('category_id')
+                  .annotate(count=Count('id')).values_list('category_id', 'count'))
+
+    paths, order = {}, []
+    stack = [(category_id, '') for category_id in children[None]]
+    while stack:
+        category_id, parent_path = stack.pop()
+        paths[category_id] = parent_path + Category.path_segment(category_id)
+        order.append(category_id)
+        stack.extend((child_id, paths[category_id]) for child_id in children[category_id])
+    totals = {}
+    for category_id in reversed(order): # Потомки - раньше предков
+        totals[category_id] = direct.get(category_id, 0) + sum(totals[child_id] for child_id in children[category_id])
+
+    changed = [
+        Category(id=category_id, path=paths[category_id], depth=len(paths[category_id]) // STEP - 1,
+                 product_count=totals[category_id])
+        for category_id, _, path, depth, count in rows
+        if category_id in paths and (path, depth, count) != (paths[category_id], len(paths[category_id]) // STEP - 1,
+                                                             totals[category_id])
+    ]
+    Category.objects.bulk_update(changed, ['path', 'depth', 'product_count'], batch_size=batch_size)
+    return len(changed)
+
+
+# Снимок дерева категорий (все категории, дети каждой отсортированы по имени).
+class CategoryTree:
+    def __init__(self, categories):
+        self.by_id = {category.id: category for category in categories}
+        self.by_slug = {category.slug: category for category in categories}
+        self.children = defaultdict(list)
+        for category in sorted(categories, key=lambda category: category.name):
+            self.children[category.parent_id].append(category)
+
+    def get(self, slug):
+        return self.by_slug.get(slug)
+
+    def has_children(self, category):
+        return bool(self.children.get(category.id))
+
+    # Товары категории и всех ее подкатегорий: category_id IN (SELECT id ... WHERE path в диапазоне поддерева)
+    # по индексу path. Для категории без подкатегорий - простое равенство по category_id.
+    def filter_products(self, queryset, category):
+        if not self.has_children(category):
+            return queryset.filter(category=category)
+        return queryset.filter(category__in=Category.objects.filter(category.subtree_q()).values('id'))
+
+    # Предки категории от верхнего уровня (для "хлебных крошек").
+    def ancestors(self, category):
+        return [self.by_id[category_id] for category_id in category.ancestor_ids() if category_id in self.by_id]
+
+    # Категории бокового меню: верхний уровень и раскрытая ветка текущей категории
+    # (ее предки, их соседи и ее подкатегории). Дерево из тысяч категорий целиком не выводится.
+    def sidebar(self, current=None):
+        expanded = {current.id, *current.ancestor_ids()} if current is not None else set()
+        items = []
+
+        def walk(parent_id):
+            for category in self.children.get(parent_id, []):
+                items.append(category)
+                if category.id in expanded:
+                    walk(category.id)
+
+        walk(None)
+        return items
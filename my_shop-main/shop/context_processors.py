@@ -1,12 +1,15 @@
-from .cart import Cart # Импортируем класс Cart
+from .cart import get_cart # Корзина текущего запроса
 from .forms import SearchForm # Импортируем форму поиска
+from .caching import CSRF_PLACEHOLDER, CART_BADGE_PLACEHOLDER # Заглушки для кэша страниц
+from django.utils.safestring import mark_safe
 
 # Контекстный процессор для корзины.
 # Добавляет объект 'cart' в контекст всех шаблонов.
 def cart(request):
-    # Возвращает словарь, где ключ 'cart' - это экземпляр класса Cart.
+    # Возвращает словарь, где ключ 'cart' - это корзина текущего запроса (request.cart).
     # Таким образом, в любом шаблоне можно будет обратиться к {{ cart }}.
-    return {'cart': Cart(request)}
+    # Новый объект не создается: используется тот же, что и в представлении.
+    return {'cart': get_cart(request)}
 
 # Контекстный процессор для формы поиска.
 # Добавляет объект 'search_form' в контекст всех шаблонов.
@@ -14,4 +17,17 @@ def search_form_context(request):
     # Возвращает словарь с экземпляром SearchForm.
     # Это позволяет отобразить форму поиска, например, в шапке сайта (base.html).
     # Сама обработка поиска происходит в представлении product_list.
-    return {'search_form': SearchForm()}
\ No newline at end of file
+    return {'search_form': SearchForm()}
+
+# Контекстный процессор для кэширования страниц каталога (см. shop/caching.py).
+# Пока страница рендерится для записи в кэш, вместо CSRF-токена и значка корзины
+# в шаблон подставляются заглушки, которые затем заменяются для каждого посетителя.
+# Должен стоять в списке после остальных процессоров, чтобы переопределить csrf_token.
+def page_cache(request):
+    if not getattr(request, 'page_cache_fill', False):
+        return {}
+    return {
+        'csrf_token': CSRF_PLACEHOLDER,
+        'page_cache_fill': True,
+        'cart_badge_placeholder': mark_safe(CART_BADGE_PLACEHOLDER),
+    }
\ No newline at end of file
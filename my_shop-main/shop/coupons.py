@@ -0,0 +1,127 @@
+import hashlib # Для ключей кэша по коду купона
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.functions import Length, Upper
+from django.utils import timezone
+
+from .models import Coupon
+
+# Реестр купонов в кэше.
+# Купон нужен почти каждому запросу (значок и страница корзины, оформление заказа), а применение
+# купона ищет его по коду без учета регистра. Поэтому купоны кэшируются по id и по коду,
+# приведенному к верхнему регистру: в обычном режиме показ и применение купона не обращаются к базе.
+# - Запись живет до окончания действия купона (valid_to), но не дольше SHOP_COUPON_CACHE_TIMEOUT;
+#   действительность (active, valid_from, valid_to) проверяется при каждом обращении (Coupon.is_valid).
+# - Несуществующие коды тоже запоминаются (на SHOP_COUPON_MISS_TIMEOUT), чтобы перебор кодов не нагружал базу.
+# - Ключи включают версию реестра, которую увеличивает любое сохранение или удаление купона
+#   (сигналы в shop/signals.py, в том числе из CouponAdmin) - старые записи просто перестают использоваться.
+# В базе купон по коду ищется по выражению UPPER(code), для которого есть функциональный индекс.
+
+VERSION_KEY = 'shop:coupons:version'
+
+# Значение в кэше для "купона нет" (None означает "ключа нет в кэше").
+_MISSING = 'missing'
+
+
+def _version():
+    return cache.get_or_set(VERSION_KEY, lambda: int(time.time()), None)
+
+
+# Увеличивает версию реестра (все закэшированные купоны устаревают).
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError: # Ключа нет в кэше
+        cache.set(VERSION_KEY, int(time.time()), None)
+
+
+# Код купона в том виде, в котором он ищется (без пробелов по краям, без учета регистра).
+def normalize_code(code):
+    return code.strip().upper()
+
+
+def _id_key(version, coupon_id):
+    return f'shop:coupon:{version}:id:{coupon_id}'
+
+
+def _code_key(version, code):
+    digest = hashlib.md5(normalize_code(code).encode()).hexdigest() # Код может содержать пробелы и кириллицу
+    return f'shop:coupon:{version}:code:{digest}'
+
+
+# Сколько секунд хранить купон: до окончания его действия, но не больше SHOP_COUPON_CACHE_TIMEOUT.
+# Закончившийся купон без изменения в админке снова действительным не станет - его храним полный срок.
+def _timeout(coupon):
+    limit = getattr(settings, 'SHOP_COUPON_CACHE_TIMEOUT', 60 * 60)
+    if coupon is None:
+        return getattr(settings, 'SHOP_COUPON_MISS_TIMEOUT', 60)
+    remaining = (coupon.valid_to - timezone.now()).total_seconds()
+    return limit if remaining <= 0 else max(1, min(int(remaining), limit))
+
+
+def _from_cache(value):
+    return None if value == _MISSING else value
+
+
+# Купон по id (действительный или нет) или None, если его нет.
+def get_coupon(coupon_id):
+    version = _version()
+    key = _id_key(version, coupon_id)
+    value = cache.get(key)
+    if value is None:
+        coupon = Coupon.objects.filter(id=coupon_id).first()
+        value = _store(version, coupon, key)
+    return _from_cache(value)
+
+
+# Купон по коду без учета регистра (действительный или нет) или None, если его нет.
+def get_coupon_by_code(code):
+    version = _version()
+    key = _code_key(version, code)
+    value = cache.get(key)
+    if value is None:
+        # Искомый код приводится к верхнему регистру в Python (так же, как в ключе кэша), а в базе
+        # сравнивается с UPPER(code) - используется индекс по UPPER(code).
+        normalized = normalize_code(code)
+        coupon = Coupon.objects.alias(code_upper=Upper('code')).filter(code_upper=normalized).first()
+        if coupon is None and not normalized.isascii():
+            coupon = _find_non_ascii(normalized)
+        value = _store(version, coupon, key)
+    return _from_cache(value)
+
+
+# UPPER() в SQLite меняет регистр только латинских букв: код с кириллицей в смешанном регистре ("Лето")
+# по индексу не найдется. Прежде чем запомнить "купона нет" под ключом, на который указывает и настоящий
+# код, такие коды сверяются в Python среди купонов той же длины.
+def _find_non_ascii(normalized):
+    candidates = Coupon.objects.alias(code_length=Length('code')).filter(code_length=len(normalized))
+    return next((coupon for coupon in candidates if normalize_code(coupon.code) == normalized), None)
+
+
+# Кладет найденный купон в кэш сразу по id и по коду (или отметку "нет" под ключом key).
+def _store(version, coupon, key):
+    if coupon is None:
+        cache.set(key, _MISSING, _timeout(None))
+        return _MISSING
+    timeout = _timeout(coupon)
+    cache.set_many({_id_key(version, coupon.id): coupon, _code_key(version, coupon.code): coupon}, timeout)
+    return coupon
+
+
+# Асинхронный вариант get_coupon (для асинхронной корзины, см. Cart.acreate).
+async def aget_coupon(coupon_id):
+    # Импорт здесь: shop.caching сам импортирует shop.cart, который использует этот модуль.
+    from .caching import acache_get, acache_set
+
+    version = await acache_get(VERSION_KEY)
+    if version is None:
+        version = int(time.time())
+        await acache_set(VERSION_KEY, version, None)
+    value = await acache_get(_id_key(version, coupon_id))
+    if value is None:
+        coupon = await Coupon.objects.filter(id=coupon_id).afirst()
+        value = coupon or _MISSING
+        await acache_set(_id_key(version, coupon_id), value, _timeout(coupon))
+    return _from_cache(value)
@@ -0,0 +1,142 @@
+import logging # Для записи результатов отправки писем
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import EmailJob, Order
+
+logger = logging.getLogger(__name__)
+
+# Очередь писем-подтверждений заказа.
+# checkout (shop/services.py) только добавляет задание EmailJob, поэтому ответ на оформление заказа
+# не ждет SMTP-сервер. Задания обрабатывает команда send_order_emails: берет пачку заданий,
+# загружает заказы со всеми позициями за несколько запросов и отправляет письма через одно
+# SMTP-соединение. При ошибке задание повторяется с растущей задержкой (экспоненциальный backoff),
+# после SHOP_EMAIL_MAX_ATTEMPTS неудачных попыток помечается как failed.
+
+
+# Сколько заданий брать в одну пачку.
+def _batch_size():
+    return getattr(settings, 'SHOP_EMAIL_BATCH_SIZE', 50)
+
+# Максимальное количество попыток отправки одного письма.
+def _max_attempts():
+    return getattr(settings, 'SHOP_EMAIL_MAX_ATTEMPTS', 5)
+
+# Задержка перед повтором после attempts неудачных попыток: base * 2^(attempts-1), но не больше max.
+def retry_delay(attempts):
+    base = getattr(settings, 'SHOP_EMAIL_RETRY_DELAY', 60)
+    maximum = getattr(settings, 'SHOP_EMAIL_RETRY_MAX_DELAY', 60 * 60)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), maximum))
+
+# На сколько секунд задание "арендуется" обработчиком. Если обработчик упал, не отправив пачку,
+# по истечении аренды задания снова станут доступны.
+LEASE_SECONDS = 5 * 60
+
+
+# Добавление письма-подтверждения заказа в очередь.
+# Вызывается внутри транзакции оформления заказа: задание появится только вместе с заказом.
+def enqueue_order_confirmation(order):
+    return EmailJob.objects.create(order=order)
+
+
+# Письмо-подтверждение заказа (тема и текст берутся из методов модели Order).
+def render_order_confirmation(order):
+    return EmailMessage(
+        subject=order.get_email_subject(),
+        body='\n'.join(order.get_email_body_lines()),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[order.email],
+    )
+
+
+# Забирает в работу до limit заданий, готовых к отправке.
+# Выбранные задания помечаются как sending, а available_at сдвигается на время аренды,
+# поэтому параллельно запущенный обработчик их не возьмет.
+def claim_jobs(limit):
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = EmailJob.objects.filter(
+            status__in=[EmailJob.STATUS_PENDING, EmailJob.STATUS_SENDING], available_at__lte=now,
+        )
+        # На PostgreSQL/MySQL строки блокируются, а занятые другим обработчиком пропускаются.
+        # SQLite блокирует всю базу на запись, поэтому там это не нужно.
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        ids = list(queryset.order_by('available_at', 'id').values_list('id', flat=True)[:limit])
+        if ids:
+            EmailJob.objects.filter(id__in=ids).update(
+                status=EmailJob.STATUS_SENDING, available_at=now + timedelta(seconds=LEASE_SECONDS),
+            )
+    return list(EmailJob.objects.filter(id__in=ids).order_by('available_at', 'id')) if ids else []
+
+
+# Обрабатывает одну пачку заданий. Возвращает словарь {'sent': ..., 'retry': ..., 'failed': ...}.
+# Заказы загружаются вместе с купоном, позициями и товарами (3 запроса на всю пачку),
+# а все письма пачки отправляются через одно соединение с почтовым сервером.
+def process_batch(batch_size=None, email_connection=None):
+    result = {'sent': 0, 'retry': 0, 'failed': 0}
+    jobs = claim_jobs(batch_size or _batch_size())
+    if not jobs:
+        return result
+
+    orders = Order.objects.select_related('coupon').prefetch_related('items__product').in_bulk(
+        {job.order_id for job in jobs})
+    email_connection = email_connection or get_connection()
+    sent_ids = []
+    try:
+        email_connection.open()
+    except Exception as e:
+        # Почтовый сервер недоступен: вся пачка откладывается (попытка засчитывается каждому заданию),
+        # обработчик продолжает работу.
+        logger.warning('email connection failed: %s', e)
+        for job in jobs:
+            _schedule_retry(job, e)
+            result['failed' if job.status == EmailJob.STATUS_FAILED else 'retry'] += 1
+        return result
+    try:
+        for job in jobs:
+            try:
+                email_connection.send_messages([render_order_confirmation(orders[job.order_id])])
+            except Exception as e:
+                _schedule_retry(job, e)
+                result['failed' if job.status == EmailJob.STATUS_FAILED else 'retry'] += 1
+            else:
+                sent_ids.append(job.id)
+    finally:
+        email_connection.close()
+
+    if sent_ids:
+        EmailJob.objects.filter(id__in=sent_ids).update(
+            status=EmailJob.STATUS_SENT, sent_at=timezone.now(), last_error='',
+        )
+    result['sent'] = len(sent_ids)
+    logger.info('email batch sent=%d retry=%d failed=%d', result['sent'], result['retry'], result['failed'])
+    return result
+
+
+# Неудачная попытка: увеличиваем счетчик и откладываем задание (или помечаем как failed).
+def _schedule_retry(job, error):
+    job.attempts += 1
+    job.last_error = f'{type(error).__name__}: {error}'
+    if job.attempts >= _max_attempts():
+        job.status = EmailJob.STATUS_FAILED
+        logger.error('email job %s failed after %d attempts: %s', job.id, job.attempts, job.last_error)
+    else:
+        job.status = EmailJob.STATUS_PENDING
+        job.available_at = timezone.now() + retry_delay(job.attempts)
+    job.save(update_fields=['attempts', 'last_error', 'status', 'available_at'])
+
+
+# Обрабатывает пачки, пока в очереди есть готовые к отправке задания. Возвращает суммарный итог.
+def drain(batch_size=None, email_connection=None):
+    total = {'sent': 0, 'retry': 0, 'failed': 0}
+    while True:
+        result = process_batch(batch_size, email_connection)
+        for key, value in result.items():
+            total[key] += value
+        if not any(result.values()):
+            return total
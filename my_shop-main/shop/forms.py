@@ -1,4 +1,5 @@
 from django import forms
+from django.conf import settings # Ограничение количества товара в корзине
 from .models import Order # Модель Order используется для OrderCreateForm
 
 # Форма для создания заказа, основанная на модели Order.
@@ -32,6 +33,29 @@ class CouponApplyForm(forms.Form):
         widget=forms.TextInput(attrs={'placeholder': 'Введите код купона'}) # HTML-атрибуты виджета
     )
 
+# Одна операция изменения корзины: элемент пакета JSON API корзины (views.cart_api) и форма
+# количества товара (views.cart_add). 'add' - добавить quantity единиц (по умолчанию 1),
+# 'set' - установить количество (0 - удалить товар), 'remove' - удалить товар из корзины.
+class CartOperationForm(forms.Form):
+    OPERATIONS = [('add', 'Добавить'), ('set', 'Изменить количество'), ('remove', 'Удалить')]
+
+    op = forms.ChoiceField(choices=OPERATIONS)
+    product_id = forms.IntegerField(min_value=1)
+    quantity = forms.IntegerField(label='Количество', min_value=0, required=False,
+                                  max_value=getattr(settings, 'SHOP_CART_MAX_QUANTITY', 999))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        op, quantity = cleaned_data.get('op'), cleaned_data.get('quantity')
+        if op == 'add':
+            if quantity is None:
+                cleaned_data['quantity'] = 1
+            elif quantity < 1:
+                self.add_error('quantity', 'Добавить можно не меньше одной единицы товара')
+        elif op == 'set' and quantity is None:
+            self.add_error('quantity', 'Укажите количество')
+        return cleaned_data
+
 # Форма для поиска товаров.
 class SearchForm(forms.Form):
     # Одно поле для ввода поискового запроса.
@@ -0,0 +1,192 @@
+import functools
+import hashlib # Для имен файлов по содержимому
+import io
+import logging
+import os
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features # Pillow уже нужен для ImageField
+
+logger = logging.getLogger(__name__)
+
+# Уменьшенные копии изображений товаров.
+# Вместо оригинала (часто многомегабайтный PNG-скриншот) страницы показывают копии нужного размера:
+# thumbnail - корзина, list - каталог и похожие товары, detail - страница товара.
+# Каждая копия сохраняется в формате оригинала (PNG для .png, иначе JPEG) и дополнительно в WebP,
+# если Pillow собран с его поддержкой. Имя файла копии - хэш от содержимого оригинала
+# (Product.image_digest) и параметров копии, поэтому при замене картинки или изменении размеров
+# URL меняется, а старые файлы можно кэшировать в браузере навсегда.
+# Копии создаются при сохранении товара (shop/signals.py), при первом показе (если их еще нет)
+# и командой regenerate_product_images для уже загруженных изображений.
+
+# Варианты по умолчанию: максимальные ширина и высота (пропорции сохраняются) и качество сжатия.
+DEFAULT_VARIANTS = {
+    'thumbnail': {'size': (100, 100), 'quality': 80},
+    'list': {'size': (300, 300), 'quality': 80},
+    'detail': {'size': (800, 800), 'quality': 85},
+}
+
+EXTENSIONS = {'jpeg': 'jpg', 'png': 'png', 'webp': 'webp'}
+
+
+def get_variants():
+    return getattr(settings, 'SHOP_IMAGE_VARIANTS', DEFAULT_VARIANTS)
+
+
+# Папка для копий (относительно MEDIA_ROOT).
+def cache_dir():
+    return getattr(settings, 'SHOP_IMAGE_CACHE_DIR', 'cache/images')
+
+
+# Поддерживает ли установленный Pillow запись WebP (проверяется один раз).
+@functools.lru_cache(maxsize=None)
+def _pillow_webp():
+    return features.check('webp')
+
+
+def webp_enabled():
+    return getattr(settings, 'SHOP_IMAGE_WEBP', True) and _pillow_webp()
+
+
+# Основной формат копий: PNG сохраняет прозрачность, остальное (JPEG, GIF, BMP ...) сжимается в JPEG.
+def fallback_format(name):
+    return 'png' if os.path.splitext(name)[1].lower() == '.png' else 'jpeg'
+
+
+# Форматы копий для файла name: основной и (если возможно) WebP.
+def formats_for(name):
+    formats = [fallback_format(name)]
+    if webp_enabled():
+        formats.append('webp')
+    return formats
+
+
+# SHA-1 содержимого файла изображения (читается блоками, без загрузки целиком в память).
+# Работает и для только что загруженного, еще не сохраненного в хранилище файла.
+def file_digest(field_file):
+    committed = getattr(field_file, '_committed', True) # Обычный File (не FieldFile) - всегда сохранен
+    sha = hashlib.sha1()
+    field_file.open('rb')
+    try:
+        for chunk in field_file.chunks():
+            sha.update(chunk)
+    finally:
+        if committed:
+            field_file.close()
+        else:
+            field_file.seek(0) # Файл еще будет сохраняться в хранилище
+    return sha.hexdigest()
+
+
+# Имя файла копии: cache/images/<вариант>/<xx>/<хэш>.<расширение>.
+def variant_name(digest, variant, fmt):
+    spec = get_variants()[variant]
+    width, height = spec['size']
+    key = f'{digest}:{width}x{height}:{spec.get("quality", 80)}:{fmt}'
+    name = hashlib.sha1(key.encode()).hexdigest()[:20]
+    return f'{cache_dir()}/{variant}/{name[:2]}/{name}.{EXTENSIONS[fmt]}'
+
+
+# Уменьшение одного изображения и сжатие в формат fmt. Возвращает байты файла.
+def render_variant(image, spec, fmt):
+    image = image.copy()
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA')
+    image.thumbnail(spec['size'], Image.Resampling.LANCZOS)
+    quality = spec.get('quality', 80)
+
+    output = io.BytesIO()
+    if fmt == 'jpeg':
+        if image.mode == 'RGBA': # В JPEG нет прозрачности - подкладываем белый фон
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+    elif fmt == 'webp':
+        image.save(output, 'WEBP', quality=quality, method=4)
+    else:
+        image.save(output, 'PNG', optimize=True)
+    return output.getvalue()
+
+
+# Имена копий, которые точно есть в хранилище (чтобы не проверять файл при каждом показе).
+_existing = set()
+
+
+# Создает недостающие копии изображения name (файл в хранилище) с хэшем digest.
+# variants - какие варианты создавать (по умолчанию все), force=True - пересоздать существующие.
+# Возвращает количество созданных файлов. Оригинал открывается один раз на все варианты.
+def generate_variants(name, digest, variants=None, force=False, storage=None):
+    storage = storage or default_storage
+    todo = []
+    for variant in variants or get_variants():
+        for fmt in formats_for(name):
+            target = variant_name(digest, variant, fmt)
+            if force or not storage.exists(target):
+                todo.append((variant, fmt, target))
+            else:
+                _existing.add(target)
+    if not todo:
+        return 0
+
+    with storage.open(name, 'rb') as f:
+        with Image.open(f) as source:
+            source = ImageOps.exif_transpose(source) # Учитываем поворот из EXIF (фото с телефона)
+            for variant, fmt, target in todo:
+                data = render_variant(source, get_variants()[variant], fmt)
+                if storage.exists(target):
+                    storage.delete(target)
+                storage.save(target, ContentFile(data))
+                _existing.add(target)
+    return len(todo)
+
+
+# Хэш изображения товара; если он еще не посчитан (товары, загруженные до появления копий),
+# считается по файлу и сохраняется в базу одним UPDATE (без сигналов и без сброса кэша каталога).
+def ensure_digest(product):
+    if not product.image_digest:
+        product.image_digest = file_digest(product.image)
+        type(product).objects.filter(pk=product.pk).update(image_digest=product.image_digest)
+    return product.image_digest
+
+
+# URL копии изображения товара в формате fmt (по умолчанию основной формат).
+# Если копии еще нет, она создается сейчас. Если оригинал недоступен или поврежден,
+# для основного формата возвращается URL оригинала (чтобы страница все равно отобразилась), для WebP - None.
+def variant_url(product, variant, fmt=None):
+    if not product.image:
+        return None
+    fmt = fmt or fallback_format(product.image.name)
+    if fmt not in formats_for(product.image.name): # Например, WebP без поддержки в Pillow
+        return None
+    try:
+        target = variant_name(ensure_digest(product), variant, fmt)
+        if target not in _existing:
+            generate_variants(product.image.name, product.image_digest, [variant])
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning('image variant %s of %s failed: %s', variant, product.image.name, e)
+        return product.image.url if fmt == fallback_format(product.image.name) else None
+    return default_storage.url(target)
+
+
+# Для асинхронных представлений: заранее (в отдельном потоке) считает недостающие хэши и создает
+# недостающие копии variant для товаров products, чтобы тег {% product_image %} при рендеринге
+# не обращался к базе и диску. Обычно все копии уже есть, и функция ничего не делает.
+async def aprepare(products, variant):
+    pending = [
+        product for product in products
+        if product.image and (not product.image_digest or any(
+            variant_name(product.image_digest, variant, fmt) not in _existing
+            for fmt in formats_for(product.image.name)))
+    ]
+    if pending:
+        await sync_to_async(_prepare)(pending, variant)
+
+
+def _prepare(products, variant):
+    for product in products:
+        for fmt in formats_for(product.image.name):
+            variant_url(product, variant, fmt)
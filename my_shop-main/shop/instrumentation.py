@@ -0,0 +1,225 @@
+import re # Для нормализации текста SQL-запросов
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+
+from .benchmarks import summarize
+
+# Инструментирование запросов (профилирование представлений).
+# Для каждого запроса считается: количество SQL-запросов и их суммарное время, повторяющиеся
+# запросы (один и тот же SQL с теми же параметрами - "дубли", тот же SQL с разными
+# параметрами - признак N+1), время рендеринга шаблонов и контекстных процессоров.
+# Результат пишется в заголовок Server-Timing (видно во вкладке Network браузера) и в
+# скользящую статистику процесса по каждому представлению (view_name из shop.urls).
+# Включается настройкой SHOP_INSTRUMENTATION_ENABLED; когда она выключена, middleware
+# не подключается вообще (MiddlewareNotUsed), а шаблонизатор работает как обычный DjangoTemplates.
+
+# Профиль текущего запроса (None - запрос не инструментируется).
+_current_profile = ContextVar('shop_request_profile', default=None)
+
+# Числа и строки в SQL заменяются на "?", чтобы одинаковые по форме запросы считались одним.
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+# Управление транзакциями (BEGIN, SAVEPOINT ...) повторяется законно и в поиск дублей не входит.
+_TRANSACTION_SQL = re.compile(r'^\s*(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b', re.IGNORECASE)
+
+
+def is_enabled():
+    return getattr(settings, 'SHOP_INSTRUMENTATION_ENABLED', False)
+
+
+# Сколько последних запросов хранить в статистике для каждого представления.
+def _window():
+    return getattr(settings, 'SHOP_INSTRUMENTATION_WINDOW', 500)
+
+
+# Замеры одного запроса.
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_ms = 0.0
+        self.render_ms = 0.0
+        self.context_ms = 0.0
+        self.statements = Counter() # Нормализованный SQL -> сколько раз выполнялся
+        self.exact = Counter()      # (SQL, параметры) -> сколько раз выполнялся
+
+    def record_query(self, sql, params, duration_ms):
+        self.queries += 1
+        self.sql_ms += duration_ms
+        if _TRANSACTION_SQL.match(sql):
+            return
+        self.statements[_SQL_LITERALS.sub('?', sql)] += 1
+        self.exact[(sql, repr(params))] += 1
+
+    # Лишние выполнения полностью одинаковых запросов (тот же SQL и те же параметры).
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.exact.values() if count > 1)
+
+    # Запросы одинаковой формы, выполненные несколько раз: [(SQL, количество), ...].
+    def repeated_statements(self, limit=5):
+        return [(sql, count) for sql, count in self.statements.most_common(limit) if count > 1]
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    # Значение заголовка Server-Timing.
+    def server_timing(self, total_ms):
+        return ', '.join([
+            f'db;dur={self.sql_ms:.1f};desc="{self.queries} queries, {self.duplicates} dup"',
+            f'tpl;dur={self.render_ms:.1f};desc="templates"',
+            f'ctx;dur={self.context_ms:.1f};desc="context processors"',
+            f'total;dur={total_ms:.1f}',
+        ])
+
+
+# Обертка выполнения SQL (connection.execute_wrapper): замеряет каждый запрос.
+class QueryRecorder:
+    def __init__(self, profile):
+        self.profile = profile
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.profile.record_query(sql, params, (time.perf_counter() - started) * 1000)
+
+
+# Контекстный менеджер: SQL-запросы во всех подключениях к базам записываются в профиль profile.
+# Работает и вокруг асинхронного кода: подключения и профиль привязаны к контексту запроса.
+@contextmanager
+def recording(profile):
+    token = _current_profile.set(profile)
+    try:
+        with ExitStack() as stack:
+            recorder = QueryRecorder(profile)
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+# Выполняет функцию с записью SQL-запросов в профиль profile.
+def record_queries(profile, func, *args, **kwargs):
+    with recording(profile):
+        return func(*args, **kwargs)
+
+
+# --- Скользящая статистика процесса ---
+
+_stats_lock = threading.Lock()
+_stats = {} # view_name -> deque последних замеров
+
+
+def record_sample(view_name, profile, total_ms):
+    sample = {
+        'total_ms': total_ms,
+        'sql_ms': profile.sql_ms,
+        'render_ms': profile.render_ms,
+        'context_ms': profile.context_ms,
+        'queries': profile.queries,
+        'duplicates': profile.duplicates,
+        'repeated': profile.repeated_statements(),
+    }
+    with _stats_lock:
+        samples = _stats.get(view_name)
+        if samples is None:
+            samples = _stats[view_name] = deque(maxlen=_window())
+        samples.append(sample)
+
+
+def _mean(samples, key):
+    return round(sum(s[key] for s in samples) / len(samples), 2)
+
+
+# Статистика по представлениям: время (среднее и перцентили), запросы, дубли, рендеринг.
+# Для каждого представления также показываются повторяющиеся запросы из последнего замера, где они были.
+def get_stats():
+    with _stats_lock:
+        snapshot = {name: list(samples) for name, samples in _stats.items()}
+    result = {}
+    for name, samples in sorted(snapshot.items()):
+        timing = summarize([s['total_ms'] for s in samples])
+        repeated = next((s['repeated'] for s in reversed(samples) if s['repeated']), [])
+        result[name] = {
+            'requests': timing['count'],
+            'total_ms': {key: round(timing[key], 2) for key in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms')},
+            'sql_ms': _mean(samples, 'sql_ms'),
+            'render_ms': _mean(samples, 'render_ms'),
+            'context_ms': _mean(samples, 'context_ms'),
+            'queries': _mean(samples, 'queries'),
+            'max_queries': max(s['queries'] for s in samples),
+            'duplicates': _mean(samples, 'duplicates'),
+            'repeated_statements': [{'sql': sql, 'count': count} for sql, count in repeated],
+        }
+    return result
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+# --- Замер рендеринга шаблонов ---
+
+# Шаблон, который записывает время рендеринга в профиль текущего запроса.
+# Вложенные шаблоны ({% include %}, {% extends %}) входят во время внешнего шаблона.
+class _InstrumentedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        profile = _current_profile.get()
+        if profile is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            profile.render_ms += (time.perf_counter() - started) * 1000
+
+
+# Контекстный процессор, который записывает свое время в профиль текущего запроса.
+def _timed_processor(processor):
+    def wrapper(request):
+        profile = _current_profile.get()
+        if profile is None:
+            return processor(request)
+        started = time.perf_counter()
+        try:
+            return processor(request)
+        finally:
+            profile.context_ms += (time.perf_counter() - started) * 1000
+    return wrapper
+
+
+# Шаблонизатор Django с замером времени рендеринга и контекстных процессоров.
+# Указывается в TEMPLATES['BACKEND'] вместо DjangoTemplates. При выключенном
+# инструментировании ничего не оборачивает и работает как обычный DjangoTemplates.
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    def __init__(self, params):
+        super().__init__(params)
+        self.instrumented = is_enabled()
+        if self.instrumented:
+            self.engine.template_context_processors = tuple(
+                _timed_processor(processor) for processor in self.engine.template_context_processors
+            )
+
+    def from_string(self, template_code):
+        template = super().from_string(template_code)
+        return _InstrumentedTemplate(template) if self.instrumented else template
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return _InstrumentedTemplate(template) if self.instrumented else template
@@ -0,0 +1,172 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Product, StockReservation
+
+# Складской учет: остатки (Product.stock) и резервы в корзинах (Product.reserved, StockReservation).
+# Остаток никогда не читается в Python, чтобы потом записать уменьшенное значение (так два
+# одновременных заказа продали бы одну и ту же единицу). Вместо этого каждое изменение - один
+# условный UPDATE: "уменьшить, если хватает" (WHERE stock >= reserved + N). Если строка не
+# обновилась - товара не хватило, и ничего не изменилось.
+# - reserve()  - резерв при добавлении товара в корзину (на SHOP_STOCK_RESERVATION_TTL секунд);
+#   reserve_many() - резервы нескольких товаров корзины одним пакетом (JSON API корзины);
+# - release()  - возврат резерва при удалении из корзины;
+# - commit()   - списание остатка при оформлении заказа: все позиции корзины одним UPDATE;
+# - release_expired() - возврат просроченных резервов (команда release_stock_reservations).
+# Товары с пустым stock не отслеживаются: для них функции ничего не делают.
+
+
+# Исключение: товара на складе не хватает. shortages - {product_id: сколько можно купить}.
+class InsufficientStock(Exception):
+    def __init__(self, shortages, names=None):
+        self.shortages = shortages
+        names = names or {}
+        details = ', '.join(f'{names.get(product_id, product_id)} (доступно {available})'
+                            for product_id, available in shortages.items())
+        super().__init__(f'Недостаточно товара на складе: {details}')
+
+
+def reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'SHOP_STOCK_RESERVATION_TTL', 15 * 60))
+
+
+# Выражение CASE id WHEN <id> THEN <значение> ... для обновления нескольких товаров одним запросом.
+def _by_product(values):
+    return Case(*[When(id=product_id, then=Value(value)) for product_id, value in values.items()],
+                default=Value(0), output_field=IntegerField())
+
+
+# Возвращает зарезервированные количества {product_id: количество} на склад одним UPDATE.
+def _unreserve(quantities):
+    if quantities:
+        Product.objects.filter(id__in=quantities).update(
+            reserved=Greatest(F('reserved') - _by_product(quantities), Value(0)))
+
+
+# Резервирует товар product для корзины cart_key так, чтобы в резерве было ровно quantity единиц
+# (0 - снять резерв). Если свободного остатка не хватает, выбрасывает InsufficientStock, ничего не меняя.
+def reserve(cart_key, product, quantity):
+    shortages = reserve_many(cart_key, {product: quantity})
+    if shortages:
+        raise InsufficientStock(shortages, {product.pk: product.name})
+
+
+# Резервы нескольких товаров одной корзины (пакетное изменение корзины, Cart.apply): как reserve() для каждого
+# товара из quantities {product: количество}, но резервы корзины читаются одним запросом и записываются
+# одним пакетом; запрос к остатку - только для товаров, резерв которых растет.
+# При нехватке свободного остатка fit(product, сколько можно зарезервировать) возвращает новое количество
+# для этого товара; без fit товар не меняется. Возвращает {product_id: сколько можно зарезервировать}
+# для товаров, которым не хватило остатка (пустой словарь - все количества зарезервированы как есть).
+def reserve_many(cart_key, quantities, fit=None):
+    quantities = {product: quantity for product, quantity in quantities.items() if product.stock is not None}
+    if not quantities:
+        return {}
+    with transaction.atomic():
+        current = {reservation.product_id: reservation for reservation in StockReservation.objects
+                   .select_for_update().filter(cart_key=cart_key, product__in=list(quantities))}
+        shortages, released, targets = {}, {}, {}
+        for product, quantity in quantities.items():
+            held = current[product.pk].quantity if product.pk in current else 0
+            while quantity > held and not Product.objects.filter(
+                    pk=product.pk, stock__gte=F('reserved') + (quantity - held)).update(
+                    reserved=F('reserved') + (quantity - held)):
+                stock, reserved = Product.objects.filter(pk=product.pk).values_list('stock', 'reserved').get()
+                if stock is None: # Остаток перестали отслеживать - резерв не нужен, но и нехватки нет
+                    break
+                shortages[product.pk] = max(stock - reserved, 0) + held
+                quantity = fit(product, shortages[product.pk]) if fit else None
+                if quantity is None:
+                    break
+            if quantity is None:
+                continue
+            if quantity < held:
+                released[product.pk] = held - quantity
+            targets[product.pk] = quantity
+        _unreserve(released)
+
+        removed = [current[product_id].pk for product_id, quantity in targets.items()
+                   if quantity <= 0 and product_id in current]
+        if removed:
+            StockReservation.objects.filter(pk__in=removed).delete()
+        expires_at = timezone.now() + reservation_ttl()
+        StockReservation.objects.bulk_create(
+            [StockReservation(cart_key=cart_key, product_id=product_id, quantity=quantity, expires_at=expires_at)
+             for product_id, quantity in targets.items() if quantity > 0],
+            update_conflicts=True, unique_fields=['cart_key', 'product'], update_fields=['quantity', 'expires_at'])
+    return shortages
+
+
+# Снимает резервы корзины cart_key (всех товаров или только product_ids) и возвращает их на склад.
+def release(cart_key, product_ids=None):
+    with transaction.atomic():
+        queryset = StockReservation.objects.select_for_update().filter(cart_key=cart_key)
+        if product_ids is not None:
+            queryset = queryset.filter(product_id__in=product_ids)
+        rows = list(queryset.values_list('id', 'product_id', 'quantity'))
+        if rows:
+            _unreserve({product_id: quantity for _, product_id, quantity in rows})
+            StockReservation.objects.filter(id__in=[row_id for row_id, _, _ in rows]).delete()
+
+
+# Продлевает резервы корзины (например, пока посетитель заполняет форму заказа).
+def extend(cart_key):
+    StockReservation.objects.filter(cart_key=cart_key).update(expires_at=timezone.now() + reservation_ttl())
+
+
+# Списывает остаток при оформлении заказа. quantities - {product_id: количество} для товаров
+# с отслеживаемым остатком. Должна вызываться внутри транзакции заказа: при нехватке любого
+# товара выбрасывает InsufficientStock, и транзакция откатывается целиком.
+# Все позиции списываются одним UPDATE с условием для каждого товара: остаток минус чужие
+# резервы (собственный резерв корзины уже входит в reserved) не меньше заказанного количества.
+def commit(cart_key, quantities, names=None):
+    if not quantities:
+        return
+    held = {}
+    if cart_key is not None:
+        held = dict(StockReservation.objects.select_for_update()
+                    .filter(cart_key=cart_key, product_id__in=quantities)
+                    .values_list('product_id', 'quantity'))
+    ordered, own = _by_product(quantities), _by_product(held)
+    updated = Product.objects.filter(
+        id__in=quantities, stock__gte=F('reserved') - own + ordered,
+    ).update(
+        stock=F('stock') - ordered,
+        reserved=Greatest(F('reserved') - own, Value(0)),
+    )
+    if updated != len(quantities):
+        rows = Product.objects.filter(id__in=quantities).values_list('id', 'stock', 'reserved')
+        shortages = {product_id: max(stock - reserved, 0) + held.get(product_id, 0)
+                     for product_id, stock, reserved in rows
+                     if stock is not None and stock - reserved + held.get(product_id, 0) < quantities[product_id]}
+        raise InsufficientStock(shortages or {product_id: 0 for product_id in quantities}, names)
+    if held:
+        StockReservation.objects.filter(cart_key=cart_key, product_id__in=held).delete()
+
+
+# Возвращает на склад просроченные резервы пачками по batch_size. Возвращает количество снятых резервов.
+def release_expired(batch_size=None):
+    batch_size = batch_size or getattr(settings, 'SHOP_STOCK_SWEEP_BATCH', 500)
+    released = 0
+    while True:
+        with transaction.atomic():
+            queryset = StockReservation.objects.filter(expires_at__lte=timezone.now())
+            # Резервы, которые сейчас списывает оформление заказа, заблокированы - пропускаем их
+            # (на SQLite база блокируется на запись целиком, и это не нужно).
+            if connection.features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            rows = list(queryset.order_by('expires_at').values_list('id', 'product_id', 'quantity')[:batch_size])
+            if not rows:
+                return released
+            quantities = {}
+            for _, product_id, quantity in rows:
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+            _unreserve(quantities)
+            StockReservation.objects.filter(id__in=[row_id for row_id, _, _ in rows]).delete()
+            released += len(rows)
+        if len(rows) < batch_size:
+            return released
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum, F, DecimalField
+
+from shop.models import Order
+
+
+# Команда: python manage.py backfill_order_totals
+# Заполняет сохраненные итоги (subtotal, discount_amount, total) у существующих заказов.
+# Суммы позиций считаются в базе данных (SUM(price * quantity)) порциями по --chunk-size заказов,
+# затем итоги записываются одним bulk_update на порцию.
+class Command(BaseCommand):
+    help = 'Пересчитывает сохраненные итоги заказов по их позициям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Сколько заказов обрабатывать за раз')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_pk = 0
+        updated = 0
+        while True:
+            orders = list(
+                Order.objects.filter(pk__gt=last_pk).order_by('pk')
+                .annotate(items_subtotal=Sum(F('items__price') * F('items__quantity'),
+                                             output_field=DecimalField(max_digits=12, decimal_places=2)))
+                [:chunk_size]
+            )
+            if not orders:
+                break
+            for order in orders:
+                order.set_totals(order.items_subtotal)
+            with transaction.atomic():
+                Order.objects.bulk_update(orders, ['subtotal', 'discount_amount', 'total'])
+            updated += len(orders)
+            last_pk = orders[-1].pk
+            self.stdout.write(f'Обработано заказов: {updated}')
+        self.stdout.write(self.style.SUCCESS(f'Готово. Пересчитано заказов: {updated}'))
@@ -0,0 +1,43 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from shop import reports
+from shop.models import Order
+
+
+# Команда: python manage.py backfill_sales_reports [--start 2024-01-01] [--end 2024-12-31] [--chunk-days 31]
+# Пересчитывает сводные таблицы продаж (shop/reports.py) по заказам: для существующих заказов
+# при первом запуске и для исправления расхождений (например, после загрузки заказов bulk_create
+# или после ошибки обновления сводки). Суммы считаются в базе данных (GROUP BY день, товар, купон)
+# порциями по --chunk-days дней; каждая порция пересчитывается в своей транзакции.
+# По умолчанию - весь период от первого до последнего заказа.
+class Command(BaseCommand):
+    help = 'Пересчитывает сводные таблицы отчетов о продажах по заказам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help='Первый день (ГГГГ-ММ-ДД)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Последний день (ГГГГ-ММ-ДД)')
+        parser.add_argument('--chunk-days', type=int, default=31, help='Сколько дней пересчитывать за раз')
+
+    def handle(self, *args, **options):
+        bounds = Order.objects.aggregate(first=Min('created'), last=Max('created'))
+        if bounds['first'] is None and not (options['start'] and options['end']):
+            self.stdout.write('Заказов нет')
+            return
+        start = options['start'] or reports.order_date(bounds['first'])
+        end = options['end'] or reports.order_date(bounds['last'] or timezone.now())
+        if start > end:
+            raise CommandError('Первый день позже последнего')
+
+        total = 0
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=options['chunk_days'] - 1), end)
+            orders = reports.rebuild_range(chunk_start, chunk_end)
+            total += orders
+            self.stdout.write(f'{chunk_start} - {chunk_end}: заказов {orders}')
+            chunk_start = chunk_end + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f'Готово. Пересчитано заказов: {total} за {start} - {end}'))
@@ -0,0 +1,244 @@
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import django
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from shop import related, search
+from shop.benchmarks import temporary_database, seed_catalog, summarize
+from shop.models import Category, Product
+
+# Сценарии нагрузки: каталог (с категориями и страницами), страница товара, корзина.
+SCENARIOS = ['list', 'detail', 'cart']
+
+# Режимы: sync - синхронные представления shop/views.py (под ASGI каждое выполняется в потоке
+# через sync_to_async), async - асинхронные представления shop/async_views.py.
+MODES = ['sync', 'async']
+
+
+# Команда: python manage.py bench_asgi --concurrency 64 --requests 2000 --output asgi.json
+# Сравнивает пропускную способность приложения под ASGI с синхронными и асинхронными
+# представлениями каталога и корзины (настройки SHOP_ASYNC_VIEWS и SHOP_ASYNC_CART_VIEW - в асинхронном
+# режиме измеряется и асинхронная страница корзины).
+# Каждый режим запускается в отдельном процессе (маршруты выбираются при импорте shop/urls.py),
+# на временной базе с синтетическим каталогом и корзинами посетителей. Запросы подаются напрямую
+# в ASGI-приложение Django (как это делает uvicorn, но без сети), --concurrency запросов одновременно.
+# Для каждого режима и сценария считаются запросы в секунду и перцентили времени ответа (p50/p95/p99).
+class Command(BaseCommand):
+    help = 'Бенчмарк ASGI: синхронные и асинхронные представления каталога при высокой конкурентности'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20, help='Количество категорий')
+        parser.add_argument('--products', type=int, default=2000, help='Количество товаров')
+        parser.add_argument('--users', type=int, default=50, help='Количество посетителей с корзинами (сессий)')
+        parser.add_argument('--requests', type=int, default=1000, help='Запросов на каждый сценарий')
+        parser.add_argument('--concurrency', type=int, default=64, help='Количество одновременных запросов')
+        parser.add_argument('--warmup', type=int, default=50, help='Запросов на прогрев (не учитываются)')
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=SCENARIOS,
+                            help='Сценарий (можно несколько; по умолчанию все)')
+        parser.add_argument('--mode', action='append', dest='modes', choices=MODES,
+                            help='Режим (можно несколько; по умолчанию оба)')
+        parser.add_argument('--page-cache', action='store_true',
+                            help='Включить кэш страниц каталога (по умолчанию выключен, чтобы мерить представления)')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора случайных чисел')
+        parser.add_argument('--output', help='Файл для результатов в формате JSON')
+        parser.add_argument('--child', action='store_true', help='Служебный: прогон одного режима в этом процессе')
+
+    def handle(self, *args, **options):
+        if options['child']:
+            return self._child(options)
+
+        modes = options['modes'] or MODES
+        results = {mode: self._spawn(mode, options) for mode in modes}
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'options': {key: options[key] for key in ('categories', 'products', 'users', 'requests',
+                                                      'concurrency', 'page_cache', 'seed')},
+            'modes': results,
+        }
+        self._print(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты записаны в {options["output"]}'))
+
+    # Запуск одного режима в дочернем процессе; результат читается из его stdout (JSON).
+    def _spawn(self, mode, options):
+        command = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_asgi', '--child']
+        for key in ('categories', 'products', 'users', 'requests', 'concurrency', 'warmup', 'seed'):
+            command += [f'--{key}', str(options[key])]
+        for name in options['scenarios'] or SCENARIOS:
+            command += ['--scenario', name]
+        if options['page_cache']:
+            command.append('--page-cache')
+        flag = '1' if mode == 'async' else '0'
+        env = os.environ | {'SHOP_ASYNC_VIEWS': flag, 'SHOP_ASYNC_CART_VIEW': flag}
+        self.stdout.write(f'Режим {mode}...')
+        process = subprocess.run(command, env=env, capture_output=True, text=True)
+        if process.returncode:
+            raise CommandError(f'Прогон режима {mode} завершился с ошибкой:\n{process.stderr}')
+        return json.loads(process.stdout)
+
+    # --- Дочерний процесс ---
+
+    def _child(self, options):
+        mode = 'async' if settings.SHOP_ASYNC_VIEWS else 'sync'
+        # Тестовое окружение: ALLOWED_HOSTS разрешает 'testserver'.
+        setup_test_environment()
+        test_name = os.path.join(tempfile.gettempdir(), f'bench_asgi_{os.getpid()}.sqlite3')
+        try:
+            with temporary_database(test_name=test_name if connection.vendor == 'sqlite' else None), \
+                    override_settings(SHOP_PAGE_CACHE_ENABLED=options['page_cache'],
+                                      SHOP_INSTRUMENTATION_ENABLED=False, DEBUG=False):
+                self._seed(options)
+                application = get_asgi_application()
+                results = {name: asyncio.run(self._run_scenario(application, name, options))
+                           for name in options['scenarios'] or SCENARIOS}
+        finally:
+            teardown_test_environment()
+        self.stdout.write(json.dumps({'mode': mode, 'scenarios': results}))
+
+    def _seed(self, options):
+        seed_catalog(categories=options['categories'], products=options['products'], seed=options['seed'])
+        search.rebuild_index()
+        related.rebuild_all(seed=options['seed'])
+        cache.clear()
+
+        self.category_urls = [category.get_absolute_url() for category in Category.objects.all()]
+        products = list(Product.objects.filter(available=True).only('id', 'slug'))
+        self.product_urls = [product.get_absolute_url() for product in products]
+        self.pages = max(1, len(products) // settings.SHOP_CATALOG_PAGE_SIZE)
+
+        # Сессии посетителей: у каждого в корзине 1-5 товаров (синхронным клиентом, до запуска цикла событий).
+        rng = random.Random(options['seed'])
+        self.cookies = []
+        for _ in range(options['users']):
+            client = Client()
+            for product in rng.sample(products, rng.randint(1, 5)):
+                client.post(reverse('shop:cart_add', args=[product.id]), {'quantity': rng.randint(1, 3)})
+            self.cookies.append(
+                '; '.join(f'{name}={morsel.value}' for name, morsel in client.cookies.items()).encode('latin-1')
+            )
+
+    # URL очередного запроса сценария.
+    def _url(self, name, rng):
+        if name == 'detail':
+            return rng.choice(self.product_urls)
+        if name == 'cart':
+            return reverse('shop:cart_detail')
+        roll = rng.random()
+        if roll < 0.4:
+            return reverse('shop:product_list')
+        if roll < 0.8:
+            return rng.choice(self.category_urls)
+        return f'{reverse("shop:product_list")}?page={rng.randint(1, min(self.pages, 50))}'
+
+    async def _run_scenario(self, application, name, options):
+        rng = random.Random(options['seed'])
+        total = options['warmup'] + options['requests']
+        plan = [(self._url(name, rng), rng.choice(self.cookies)) for _ in range(total)]
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        samples, statuses = [], Counter()
+
+        async def one(index, url, cookie):
+            async with semaphore:
+                started = time.perf_counter()
+                status = await asgi_get(application, url, cookie)
+                if index >= options['warmup']:
+                    samples.append((time.perf_counter() - started) * 1000)
+                    statuses[status] += 1
+
+        # Прогрев отдельно, чтобы время первых запросов (импорт шаблонов, подключения) не попало в замер.
+        await asyncio.gather(*(one(i, *plan[i]) for i in range(options['warmup'])))
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i, *plan[i]) for i in range(options['warmup'], total)))
+        wall = time.perf_counter() - started
+
+        latency = summarize(samples)
+        return {
+            'requests': len(samples),
+            'errors': sum(count for status, count in statuses.items() if status >= 400),
+            'status_codes': {str(status): count for status, count in sorted(statuses.items())},
+            'latency_ms': {key[:-3]: round(value, 2) for key, value in latency.items() if key.endswith('_ms')},
+            'throughput_rps': round(len(samples) / wall, 1) if wall else 0.0,
+        }
+
+    def _print(self, results):
+        self.stdout.write(f'{"режим":<8}{"сценарий":<10}{"запросов":>9}{"ошибок":>8}{"p50, мс":>9}'
+                          f'{"p95, мс":>9}{"p99, мс":>9}{"запр/с":>9}')
+        for mode, result in results.items():
+            for name, scenario in result['scenarios'].items():
+                latency = scenario['latency_ms']
+                self.stdout.write(f'{mode:<8}{name:<10}{scenario["requests"]:>9}{scenario["errors"]:>8}'
+                                  f'{latency["p50"]:>9.2f}{latency["p95"]:>9.2f}{latency["p99"]:>9.2f}'
+                                  f'{scenario["throughput_rps"]:>9.1f}')
+        if {'sync', 'async'} <= results.keys():
+            for name, scenario in results['async']['scenarios'].items():
+                before = results['sync']['scenarios'].get(name, {}).get('throughput_rps')
+                if before:
+                    self.stdout.write(f'{name}: async/sync = {scenario["throughput_rps"] / before:.2f}x')
+
+
+# Один GET-запрос к ASGI-приложению так, как его передал бы ASGI-сервер. Возвращает статус ответа.
+# Второй вызов receive() ждет до конца ответа: Django слушает разрыв соединения (http.disconnect)
+# параллельно с выполнением представления.
+async def asgi_get(application, url, cookie):
+    parts = urlsplit(url)
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': parts.path,
+        'raw_path': parts.path.encode(),
+        'query_string': parts.query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'cookie', cookie)],
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+    finished = asyncio.Event()
+    request_sent = False
+    status = None
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    try:
+        await application(scope, receive, send)
+    finally:
+        finished.set()
+    return status
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from shop import search
+from shop.benchmarks import temporary_database, seed_catalog, summarize
+from shop.models import Product
+
+# Поисковые запросы для замеров: одно слово, словоформа, префикс, два слова, нет совпадений.
+DEFAULT_QUERIES = ['телефон', 'телефоны', 'наушн', 'красный чайник', 'беспроводные наушники',
+                   'гарантия', 'несуществующийтовар']
+
+
+# Команда: python manage.py bench_search --products 100000
+# Сравнивает старый поиск (icontains по name/description + distinct) с поисковым индексом.
+# Работает на временной тестовой базе с синтетическим каталогом.
+class Command(BaseCommand):
+    help = 'Бенчмарк поиска товаров: icontains против поискового индекса'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20000, help='Количество товаров в каталоге')
+        parser.add_argument('--repeat', type=int, default=5, help='Сколько раз выполнять каждый запрос')
+        parser.add_argument('--page-size', type=int, default=3, help='Размер страницы (как в product_list)')
+        parser.add_argument('--query', action='append', dest='queries', help='Поисковый запрос (можно несколько)')
+
+    def handle(self, *args, **options):
+        queries = options['queries'] or DEFAULT_QUERIES
+        with temporary_database():
+            self.stdout.write(f'Генерация каталога из {options["products"]} товаров...')
+            seed_catalog(products=options['products'])
+            started = time.perf_counter()
+            search.rebuild_index()
+            self.stdout.write(f'Индекс построен за {time.perf_counter() - started:.2f} с '
+                              f'(движок: {search.get_backend()})')
+
+            self.stdout.write(f'{"запрос":<25}{"icontains":>10}{"индекс":>8}{"icontains, мс":>16}{"индекс, мс":>14}')
+            for query in queries:
+                base = Product.objects.filter(available=True).order_by('name')
+                old = lambda: base.filter(Q(name__icontains=query) | Q(description__icontains=query)).distinct()
+                new = lambda: search.search_products(base, query)
+                old_ms, old_found = self._measure(old, options)
+                new_ms, new_found = self._measure(new, options)
+                self.stdout.write(f'{query:<25}{old_found:>10}{new_found:>8}{summarize(old_ms)["p50_ms"]:>16.2f}'
+                                  f'{summarize(new_ms)["p50_ms"]:>14.2f}')
+
+    # Замер одной страницы (медиана по --repeat прогонам) и количество найденных товаров.
+    # Замер одной страницы выдачи так же, как это делает Paginator: COUNT(*) + срез страницы.
+    def _measure(self, make_queryset, options):
+        samples = []
+        found = 0
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            queryset = make_queryset()
+            found = queryset.count()
+            list(queryset[:options['page_size']])
+            samples.append((time.perf_counter() - started) * 1000)
+        return samples, found
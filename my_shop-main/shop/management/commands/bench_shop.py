@@ -0,0 +1,216 @@
+import json
+import os
+import platform
+import queue
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from shop import instrumentation, related, search
+from shop.benchmarks import temporary_database, seed_catalog, seed_coupons, seed_orders, summarize
+from shop.models import Category, Product
+
+# Сценарии нагрузки (названия совпадают с представлениями shop.views).
+SCENARIOS = ['product_list', 'product_detail', 'cart_add', 'coupon_apply', 'order_create']
+
+# Данные формы оформления заказа.
+ORDER_FORM = {'first_name': 'Нагрузка', 'last_name': 'Тест', 'email': 'bench@example.com',
+              'address': 'ул. Тестовая, 1', 'postal_code': '101000', 'city': 'Москва'}
+
+
+# Команда: python manage.py bench_shop --products 5000 --orders 2000 --concurrency 4 --output bench.json
+# Нагрузочный тест основных страниц магазина: каталог, страница товара, добавление в корзину,
+# применение купона и оформление заказа. Работает на временной базе (в файле, чтобы выдерживать
+# запись из нескольких потоков) с синтетическими категориями, товарами, купонами и заказами.
+# Запросы выполняются через тестовый клиент Django из --concurrency потоков; для каждого сценария
+# считаются перцентили времени ответа (p50/p95/p99), запросы к базе на один HTTP-запрос и пропускная способность.
+# Результат можно сохранить в JSON (--output) и сравнить с предыдущим прогоном (--compare).
+class Command(BaseCommand):
+    help = 'Нагрузочный бенчмарк каталога, корзины и оформления заказа'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20, help='Количество категорий')
+        parser.add_argument('--products', type=int, default=5000, help='Количество товаров')
+        parser.add_argument('--orders', type=int, default=2000, help='Количество заказов в истории')
+        parser.add_argument('--coupons', type=int, default=20, help='Количество купонов')
+        parser.add_argument('--requests', type=int, default=200, help='Запросов на каждый сценарий')
+        parser.add_argument('--concurrency', type=int, default=4, help='Количество параллельных клиентов (потоков)')
+        parser.add_argument('--warmup', type=int, default=10, help='Запросов на прогрев (не учитываются)')
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=SCENARIOS,
+                            help='Сценарий (можно несколько; по умолчанию все)')
+        parser.add_argument('--no-page-cache', action='store_true', help='Отключить кэш страниц каталога')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора случайных чисел')
+        parser.add_argument('--output', help='Файл для результатов в формате JSON')
+        parser.add_argument('--compare', help='JSON предыдущего прогона для сравнения')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Не удалось прочитать {options["compare"]}: {e}')
+
+        scenarios = options['scenarios'] or SCENARIOS
+        # Тестовое окружение: locmem-почта, а ALLOWED_HOSTS разрешает 'testserver' тестового клиента.
+        setup_test_environment()
+        test_name = os.path.join(tempfile.gettempdir(), f'bench_shop_{os.getpid()}.sqlite3')
+        try:
+            with temporary_database(test_name=test_name if connection.vendor == 'sqlite' else None), \
+                    override_settings(SHOP_PAGE_CACHE_ENABLED=not options['no_page_cache']):
+                self._seed(options)
+                results = {name: self._run_scenario(name, options) for name in scenarios}
+        finally:
+            teardown_test_environment()
+
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'options': {key: options[key] for key in ('categories', 'products', 'orders', 'coupons',
+                                                      'requests', 'concurrency', 'seed')}
+                       | {'page_cache': not options['no_page_cache']},
+            'scenarios': results,
+        }
+        self._print(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты записаны в {options["output"]}'))
+
+    def _seed(self, options):
+        started = time.perf_counter()
+        seed_catalog(categories=options['categories'], products=options['products'], seed=options['seed'])
+        self.coupon_codes = [coupon.code for coupon in seed_coupons(options['coupons'], seed=options['seed'])]
+        seed_orders(options['orders'], seed=options['seed'])
+        search.rebuild_index()
+        related.rebuild_all(seed=options['seed'])
+        cache.clear()
+
+        self.category_urls = [category.get_absolute_url() for category in Category.objects.all()]
+        products = list(Product.objects.filter(available=True).only('id', 'slug'))
+        self.product_ids = [product.id for product in products]
+        self.product_urls = [product.get_absolute_url() for product in products]
+        self.pages = max(1, len(products) // settings.SHOP_CATALOG_PAGE_SIZE)
+        self.stdout.write(f'Данные сгенерированы за {time.perf_counter() - started:.1f} с')
+
+    # --- Сценарии: каждый выполняет подготовку и возвращает функцию измеряемого запроса ---
+
+    def _product_list(self, client, rng):
+        roll = rng.random()
+        if roll < 0.4:
+            return lambda: client.get(reverse('shop:product_list'))
+        if roll < 0.8:
+            return lambda: client.get(rng.choice(self.category_urls))
+        return lambda: client.get(reverse('shop:product_list'), {'page': rng.randint(1, min(self.pages, 50))})
+
+    def _product_detail(self, client, rng):
+        return lambda: client.get(rng.choice(self.product_urls))
+
+    def _cart_add(self, client, rng):
+        return lambda: client.post(reverse('shop:cart_add', args=[rng.choice(self.product_ids)]))
+
+    def _coupon_apply(self, client, rng):
+        code = rng.choice(self.coupon_codes + ['NOSUCHCOUPON'])
+        return lambda: client.post(reverse('shop:coupon_apply'), {'code': code})
+
+    def _order_create(self, client, rng):
+        for product_id in rng.sample(self.product_ids, rng.randint(1, 3)):
+            client.post(reverse('shop:cart_add', args=[product_id]))
+        return lambda: client.post(reverse('shop:order_create'), ORDER_FORM)
+
+    # Прогон одного сценария: --requests запросов из --concurrency потоков, у каждого потока свой клиент (сессия).
+    # Сначала все потоки выполняют прогрев (--warmup запросов, не учитываются), затем измеряемые запросы.
+    # Пропускная способность - сумма скоростей потоков, каждая по времени только измеряемых запросов
+    # (без прогрева и подготовки запроса, например наполнения корзины перед оформлением заказа).
+    def _run_scenario(self, name, options):
+        prepare = getattr(self, f'_{name}')
+        concurrency = options['concurrency']
+        clients = [Client() for _ in range(concurrency)]
+        rngs = [random.Random(options['seed'] * 1000 + index) for index in range(concurrency)]
+        samples, queries, statuses, errors = [], [], Counter(), []
+        busy_ms, measured_count = [0.0] * concurrency, [0] * concurrency
+        lock = threading.Lock()
+
+        def worker(index, tasks, measured):
+            client, rng = clients[index], rngs[index]
+            try:
+                while True:
+                    try:
+                        tasks.get_nowait()
+                    except queue.Empty:
+                        return
+                    request = prepare(client, rng)
+                    profile = instrumentation.RequestProfile()
+                    try:
+                        response = instrumentation.record_queries(profile, request)
+                    except Exception as e:
+                        with lock:
+                            errors.append(f'{type(e).__name__}: {e}')
+                        continue
+                    elapsed = profile.elapsed_ms()
+                    if measured:
+                        busy_ms[index] += elapsed
+                        measured_count[index] += 1
+                        with lock:
+                            samples.append(elapsed)
+                            queries.append(profile.queries)
+                            statuses[response.status_code] += 1
+            finally:
+                connections.close_all()
+
+        for count, measured in ((options['warmup'], False), (options['requests'], True)):
+            tasks = queue.Queue()
+            for _ in range(count):
+                tasks.put(None)
+            threads = [threading.Thread(target=worker, args=(i, tasks, measured)) for i in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        latency = summarize(samples)
+        return {
+            'requests': len(samples),
+            'errors': len(errors) + sum(count for status, count in statuses.items() if status >= 400),
+            'error_samples': errors[:5],
+            'status_codes': {str(status): count for status, count in sorted(statuses.items())},
+            'latency_ms': {key[:-3]: round(value, 2) for key, value in latency.items() if key.endswith('_ms')}
+                          | {'max': round(max(samples, default=0.0), 2)},
+            'queries': {
+                'mean': round(sum(queries) / len(queries), 2) if queries else 0.0,
+                'max': max(queries, default=0),
+            },
+            'throughput_rps': round(sum(count / busy * 1000
+                                        for count, busy in zip(measured_count, busy_ms) if busy), 1),
+        }
+
+    def _print(self, results, baseline):
+        self.stdout.write(f'{"сценарий":<16}{"запросов":>9}{"ошибок":>8}{"p50, мс":>9}{"p95, мс":>9}'
+                          f'{"p99, мс":>9}{"SQL/запр":>10}{"запр/с":>9}')
+        for name, result in results.items():
+            latency = result['latency_ms']
+            line = (f'{name:<16}{result["requests"]:>9}{result["errors"]:>8}{latency["p50"]:>9.2f}'
+                    f'{latency["p95"]:>9.2f}{latency["p99"]:>9.2f}{result["queries"]["mean"]:>10.1f}'
+                    f'{result["throughput_rps"]:>9.1f}')
+            previous = (baseline or {}).get('scenarios', {}).get(name)
+            if previous and previous['latency_ms']['p95']:
+                change = (latency['p95'] / previous['latency_ms']['p95'] - 1) * 100
+                line += f'   p95 {change:+.0f}%, SQL {result["queries"]["mean"] - previous["queries"]["mean"]:+.1f}'
+            self.stdout.write(line)
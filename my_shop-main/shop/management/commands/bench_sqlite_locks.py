@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from shop.benchmarks import temporary_database, seed_catalog, summarize
+from shop.db import SQLITE_WAL_PRAGMAS
+from shop.models import Product
+
+# Режимы журнала SQLite для сравнения: rollback - прежняя настройка (журнал отката,
+# synchronous=FULL: чтение ждет записи и наоборот), wal - shop.db.SQLITE_WAL_PRAGMAS (независимо от
+# SHOP_SQLITE_WAL). Остальные PRAGMA берутся из SHOP_SQLITE_PRAGMAS.
+MODES = ['rollback', 'wal']
+
+ORDER_FORM = {'first_name': 'Нагрузка', 'last_name': 'Тест', 'email': 'bench@example.com',
+              'address': 'ул. Тестовая, 1', 'postal_code': '101000', 'city': 'Москва'}
+
+
+# Команда: python manage.py bench_sqlite_locks --writers 8 --readers 8 --seconds 10 [--output locks.json]
+# Нагрузка на SQLite одновременными записью и чтением: --writers потоков покупают (добавление
+# в корзину с резервом остатка и оформление заказа), --readers потоков открывают страницы каталога
+# и товаров (кэш страниц выключен). Каждый режим журнала - на своей временной базе в файле.
+# Для каждого запроса измеряется время ответа и время выполнения SQL-запросов (в него входит
+# ожидание блокировки базы); выводятся перцентили, пропускная способность и ошибки "database is locked".
+class Command(BaseCommand):
+    help = 'Бенчмарк блокировок SQLite: журнал отката против WAL при одновременных записи и чтении'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Потоков-покупателей (запись)')
+        parser.add_argument('--readers', type=int, default=8, help='Потоков, читающих каталог')
+        parser.add_argument('--seconds', type=float, default=10, help='Длительность каждого прогона')
+        parser.add_argument('--products', type=int, default=200, help='Количество товаров')
+        parser.add_argument('--mode', action='append', dest='modes', choices=MODES,
+                            help='Режим журнала (можно несколько; по умолчанию оба)')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора случайных чисел')
+        parser.add_argument('--output', help='Файл для результатов в формате JSON')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Бенчмарк предназначен для SQLite')
+        setup_test_environment()
+        checkout_logger = logging.getLogger('shop.services')
+        level = checkout_logger.level
+        checkout_logger.setLevel(logging.WARNING) # Без строки замеров на каждый заказ
+        try:
+            results = {mode: self._run_mode(mode, options) for mode in options['modes'] or MODES}
+        finally:
+            checkout_logger.setLevel(level)
+            teardown_test_environment()
+
+        self._print(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'options': {key: options[key] for key in ('writers', 'readers', 'seconds', 'products',
+                                                                     'seed')},
+                           'modes': results},
+                          f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты записаны в {options["output"]}'))
+
+    def _run_mode(self, mode, options):
+        pragmas = dict(settings.SHOP_SQLITE_PRAGMAS)
+        if mode == 'rollback':
+            pragmas.update({'journal_mode': 'DELETE', 'synchronous': 'FULL'})
+        else:
+            pragmas.update(SQLITE_WAL_PRAGMAS)
+        test_name = os.path.join(tempfile.gettempdir(), f'bench_locks_{mode}_{os.getpid()}.sqlite3')
+        connections.close_all() # Новые соединения получат PRAGMA этого режима
+        with override_settings(SHOP_SQLITE_PRAGMAS=pragmas, SHOP_PAGE_CACHE_ENABLED=False,
+                               SHOP_INSTRUMENTATION_ENABLED=False), \
+                temporary_database(test_name=test_name):
+            seed_catalog(categories=5, products=options['products'], seed=options['seed'])
+            Product.objects.update(stock=10 ** 6, available=True)
+            self.products = list(Product.objects.values_list('id', 'slug'))
+            result = self._load(options)
+            with connection.cursor() as cursor:
+                result['journal_mode'] = cursor.execute('PRAGMA journal_mode').fetchone()[0]
+        connections.close_all()
+        return result
+
+    def _load(self, options):
+        lock = threading.Lock()
+        samples = {'write': [], 'read': []}
+        sql_time = {'write': [], 'read': []}
+        errors = Counter()
+        deadline = time.perf_counter() + options['seconds']
+        barrier = threading.Barrier(options['writers'] + options['readers'])
+
+        def worker(kind, index):
+            rng = random.Random(options['seed'] * 1000 + index + (500 if kind == 'read' else 0))
+            db_time = [0.0]
+
+            # Время выполнения SQL-запросов этого потока (включая ожидание блокировки базы)
+            def timer(execute, sql, params, many, context):
+                started = time.perf_counter()
+                try:
+                    return execute(sql, params, many, context)
+                finally:
+                    db_time[0] += time.perf_counter() - started
+
+            try:
+                with connection.execute_wrapper(timer):
+                    barrier.wait()
+                    while time.perf_counter() < deadline:
+                        db_time[0] = 0.0
+                        started = time.perf_counter()
+                        try:
+                            ok = self._write(rng) if kind == 'write' else self._read(rng)
+                        except OperationalError as e:
+                            ok = False
+                            with lock:
+                                errors[str(e)] += 1
+                        elapsed = (time.perf_counter() - started) * 1000
+                        if ok:
+                            with lock:
+                                samples[kind].append(elapsed)
+                                sql_time[kind].append(db_time[0] * 1000)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=('write', i)) for i in range(options['writers'])]
+        threads += [threading.Thread(target=worker, args=('read', i)) for i in range(options['readers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        def stats(kind):
+            latency, db = summarize(samples[kind]), summarize(sql_time[kind])
+            return {
+                'requests': len(samples[kind]),
+                'per_second': round(len(samples[kind]) / wall, 1) if wall else 0.0,
+                'latency_ms': {key[:-3]: round(value, 2) for key, value in latency.items() if key.endswith('_ms')},
+                'sql_ms': {key[:-3]: round(value, 2) for key, value in db.items() if key.endswith('_ms')},
+            }
+
+        return {'writes': stats('write'), 'reads': stats('read'), 'errors': dict(errors), 'seconds': round(wall, 2)}
+
+    # Покупка: 1-3 товара в корзину (резерв остатка) и оформление заказа.
+    def _write(self, rng):
+        client = Client()
+        for _ in range(rng.randint(1, 3)):
+            client.post(reverse('shop:cart_add', args=[rng.choice(self.products)[0]]))
+        response = client.post(reverse('shop:order_create'), ORDER_FORM)
+        return response.status_code == 302 and response.url == reverse('shop:order_created')
+
+    # Чтение: страница товара или первая страница каталога.
+    def _read(self, rng):
+        product_id, slug = rng.choice(self.products)
+        url = reverse('shop:product_detail', args=[product_id, slug]) if rng.random() < 0.7 \
+            else reverse('shop:product_list')
+        return Client().get(url).status_code == 200
+
+    def _print(self, results):
+        for mode, result in results.items():
+            self.stdout.write(f'Режим {mode} (journal_mode={result["journal_mode"]}), {result["seconds"]} с:')
+            for kind, title in (('writes', 'Покупки'), ('reads', 'Чтение')):
+                data = result[kind]
+                self.stdout.write(
+                    f'  {title}: {data["requests"]} ({data["per_second"]}/с), '
+                    f'ответ p50 {data["latency_ms"]["p50"]:.1f} / p95 {data["latency_ms"]["p95"]:.1f} / '
+                    f'p99 {data["latency_ms"]["p99"]:.1f} мс, '
+                    f'SQL с ожиданием блокировок p95 {data["sql_ms"]["p95"]:.1f} мс')
+            if result['errors']:
+                self.stdout.write(self.style.WARNING(
+                    '  Ошибки: ' + ', '.join(f'{text} x{count}' for text, count in result['errors'].items())))
+        if set(MODES) <= set(results):
+            before, after = results['rollback'], results['wal']
+            for kind, title in (('writes', 'покупок'), ('reads', 'чтения')):
+                old, new = before[kind]['sql_ms']['p95'], after[kind]['sql_ms']['p95']
+                if new:
+                    self.stdout.write(f'WAL: время SQL {title} p95 в {old / new:.1f} раза меньше')
@@ -0,0 +1,190 @@
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.db.models import F, Sum
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from shop import inventory
+from shop.benchmarks import temporary_database, seed_catalog, summarize
+from shop.models import OrderItem, Product, StockReservation
+
+ORDER_FORM = {'first_name': 'Нагрузка', 'last_name': 'Тест', 'email': 'bench@example.com',
+              'address': 'ул. Тестовая, 1', 'postal_code': '101000', 'city': 'Москва'}
+
+
+# Команда: python manage.py bench_stock --products 3 --stock 300 --buyers 16 [--sweep] [--output stock.json]
+# Нагрузочная проверка складского учета: --buyers потоков одновременно покупают --products "горячих"
+# товаров с остатком --stock, пока все не будет распродано. Каждый покупатель - новая сессия:
+# добавляет в корзину 1..--quantity единиц случайного товара (резерв) и оформляет заказ.
+# С --sweep резервы истекают сразу (SHOP_STOCK_RESERVATION_TTL = 0), а отдельный поток постоянно
+# снимает их (inventory.release_expired) - так проверяется списание без резерва и гонки с очисткой.
+# В конце проверяется, что ничего не продано сверх остатка, и выводятся пропускная способность
+# оформления заказов и перцентили времени ответа. Работает на временной базе: SQLite (в файле)
+# или той, что указана в DATABASES (например, PostgreSQL).
+class Command(BaseCommand):
+    help = 'Нагрузочная проверка остатков: одновременные заказы без продажи сверх остатка'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=3, help='Количество товаров, за которые идет конкуренция')
+        parser.add_argument('--stock', type=int, default=200, help='Остаток каждого товара')
+        parser.add_argument('--buyers', type=int, default=8, help='Количество одновременных покупателей (потоков)')
+        parser.add_argument('--quantity', type=int, default=2, help='Максимум единиц товара в одном заказе')
+        parser.add_argument('--sweep', action='store_true', help='Резервы истекают сразу и снимаются параллельно')
+        parser.add_argument('--max-attempts', type=int, default=20000, help='Ограничение общего числа попыток покупки')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора случайных чисел')
+        parser.add_argument('--output', help='Файл для результатов в формате JSON')
+
+    def handle(self, *args, **options):
+        # Тестовое окружение: locmem-почта, а ALLOWED_HOSTS разрешает 'testserver' тестового клиента.
+        setup_test_environment()
+        test_name = os.path.join(tempfile.gettempdir(), f'bench_stock_{os.getpid()}.sqlite3')
+        try:
+            with temporary_database(test_name=test_name if connection.vendor == 'sqlite' else None), \
+                    override_settings(SHOP_INSTRUMENTATION_ENABLED=False,
+                                      SHOP_STOCK_RESERVATION_TTL=0 if options['sweep'] else 15 * 60):
+                seed_catalog(categories=1, products=options['products'], seed=options['seed'])
+                Product.objects.update(stock=options['stock'], available=True)
+                self.product_ids = list(Product.objects.values_list('id', flat=True))
+                result = self._run(options)
+                result['check'] = self._check(options)
+        finally:
+            teardown_test_environment()
+
+        self._print(result)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'database': connection.vendor,
+                           'options': {key: options[key] for key in ('products', 'stock', 'buyers', 'quantity',
+                                                                     'sweep', 'seed')},
+                           **result},
+                          f, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Результаты записаны в {options["output"]}'))
+        if result['check']['oversold']:
+            raise CommandError('Продано больше, чем было на складе')
+
+    def _run(self, options):
+        attempts = iter(range(options['max_attempts']))
+        lock = threading.Lock()
+        outcomes, samples = Counter(), []
+        sold_out = threading.Event()
+        stop_sweeper = threading.Event()
+
+        def buyer(index):
+            rng = random.Random(options['seed'] * 1000 + index)
+            try:
+                while not sold_out.is_set():
+                    with lock:
+                        if next(attempts, None) is None:
+                            return
+                    outcome, elapsed = self._buy(rng, options)
+                    with lock:
+                        outcomes[outcome] += 1
+                        if outcome == 'ordered':
+                            samples.append(elapsed)
+                    # Свободного остатка не осталось (зарезервированное докупят те, кто его держит).
+                    if outcome != 'ordered' and not Product.objects.filter(id__in=self.product_ids,
+                                                                           stock__gt=F('reserved')).exists():
+                        sold_out.set()
+            finally:
+                connections.close_all()
+
+        def sweeper():
+            released = 0
+            try:
+                while not stop_sweeper.is_set():
+                    try:
+                        released += inventory.release_expired()
+                    except OperationalError:
+                        pass
+                    time.sleep(0.01)
+            finally:
+                outcomes['reservations_released'] = released
+                connections.close_all()
+
+        threads = [threading.Thread(target=buyer, args=(i,)) for i in range(options['buyers'])]
+        sweeper_thread = threading.Thread(target=sweeper) if options['sweep'] else None
+        started = time.perf_counter()
+        for thread in threads + ([sweeper_thread] if sweeper_thread else []):
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+        if sweeper_thread:
+            stop_sweeper.set()
+            sweeper_thread.join()
+
+        latency = summarize(samples)
+        return {
+            'outcomes': dict(outcomes),
+            'orders': len(samples),
+            'seconds': round(wall, 2),
+            'orders_per_second': round(len(samples) / wall, 1) if wall else 0.0,
+            'checkout_latency_ms': {key[:-3]: round(value, 2) for key, value in latency.items() if key.endswith('_ms')},
+        }
+
+    # Одна покупка новым посетителем. Возвращает (исход, время оформления заказа в мс).
+    def _buy(self, rng, options):
+        client = Client()
+        product_id = rng.choice(self.product_ids)
+        try:
+            for _ in range(rng.randint(1, options['quantity'])):
+                client.post(reverse('shop:cart_add', args=[product_id]))
+            started = time.perf_counter()
+            response = client.post(reverse('shop:order_create'), ORDER_FORM)
+        except OperationalError: # Например, "database is locked" на SQLite при долгом ожидании
+            return 'db_error', 0.0
+        elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code == 302 and response.url == reverse('shop:order_created'):
+            return 'ordered', elapsed
+        if response.status_code == 302 and response.url == reverse('shop:cart_detail'):
+            return 'refused_at_checkout', elapsed
+        if response.status_code == 302: # Корзина пуста: товар не удалось зарезервировать
+            return 'refused_at_cart', elapsed
+        return f'status_{response.status_code}', elapsed
+
+    # Проверка остатков: проданное + остаток = исходный остаток, резерв совпадает со строками резервов.
+    def _check(self, options):
+        sold = dict(OrderItem.objects.values('product_id').annotate(total=Sum('quantity'))
+                    .values_list('product_id', 'total'))
+        reserved = dict(StockReservation.objects.values('product_id').annotate(total=Sum('quantity'))
+                        .values_list('product_id', 'total'))
+        products = {}
+        for product_id, stock, product_reserved in Product.objects.filter(id__in=self.product_ids) \
+                .values_list('id', 'stock', 'reserved'):
+            products[product_id] = {
+                'sold': sold.get(product_id, 0),
+                'stock_left': stock,
+                'reserved': product_reserved,
+                'consistent': stock + sold.get(product_id, 0) == options['stock']
+                              and product_reserved == reserved.get(product_id, 0),
+            }
+        return {
+            'oversold': any(p['sold'] > options['stock'] for p in products.values()),
+            'consistent': all(p['consistent'] for p in products.values()),
+            'products': products,
+        }
+
+    def _print(self, result):
+        check = result['check']
+        latency = result['checkout_latency_ms']
+        self.stdout.write(f'База: {connection.vendor}, заказов: {result["orders"]} за {result["seconds"]} с '
+                          f'({result["orders_per_second"]} заказов/с)')
+        self.stdout.write(f'Оформление заказа: p50 {latency["p50"]:.2f} мс, p95 {latency["p95"]:.2f} мс, '
+                          f'p99 {latency["p99"]:.2f} мс')
+        self.stdout.write('Исходы: ' + ', '.join(f'{name}={count}' for name, count in sorted(result['outcomes'].items())))
+        for product_id, product in check['products'].items():
+            self.stdout.write(f'  товар {product_id}: продано {product["sold"]}, осталось {product["stock_left"]}, '
+                              f'в резерве {product["reserved"]}')
+        if check['oversold'] or not check['consistent']:
+            self.stdout.write(self.style.ERROR('Остатки не сходятся!'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Продано не больше остатка, остатки и резервы сходятся'))
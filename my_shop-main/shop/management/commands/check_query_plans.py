@@ -0,0 +1,64 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from shop import query_plans
+from shop.benchmarks import temporary_database
+
+
+# Команда: python manage.py check_query_plans [--products 5000] [--orders 2000] [--scenario product_list] [--verbose]
+# Создает временную базу с тестовыми данными (см. query_plans.seed), выполняет сценарии представлений
+# shop.views и проверяет EXPLAIN каждого SELECT. Если хоть один запрос читает таблицу целиком
+# (а не по индексу), команда завершается с ошибкой - ее можно запускать в CI после изменения запросов
+# или индексов. --output сохраняет полный отчет (запросы и планы) в JSON.
+class Command(BaseCommand):
+    help = 'Проверяет планы запросов представлений магазина: ошибка, если есть полный просмотр таблицы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20, help='Количество категорий')
+        parser.add_argument('--products', type=int, default=5000, help='Количество товаров')
+        parser.add_argument('--orders', type=int, default=2000, help='Количество заказов')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора случайных чисел')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            choices=[name for name, _ in query_plans.SCENARIOS], help='Только эти сценарии')
+        parser.add_argument('--verbose', action='store_true', help='Выводить планы всех запросов')
+        parser.add_argument('--output', help='Файл для отчета в формате JSON')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        checkout_logger = logging.getLogger('shop.services')
+        level = checkout_logger.level
+        checkout_logger.setLevel(logging.WARNING) # Без строки замеров на каждый заказ
+        try:
+            with temporary_database():
+                query_plans.seed(categories_count=options['categories'], products=options['products'],
+                                 orders=options['orders'], seed=options['seed'])
+                report = query_plans.collect(options['scenarios'])
+        finally:
+            checkout_logger.setLevel(level)
+            teardown_test_environment()
+
+        for entry in report:
+            sorts = sum(query['sorts'] for query in entry['queries'])
+            scans = sum(1 for query in entry['queries'] if query['full_scans'])
+            line = (f'{entry["scenario"]}: HTTP {entry["status"]}, запросов {len(entry["queries"])}, '
+                    f'сортировок во временном индексе {sorts}, полных просмотров {scans}')
+            self.stdout.write(self.style.ERROR(line) if scans else line)
+            for query in entry['queries']:
+                if options['verbose'] or query['full_scans']:
+                    self.stdout.write(f'    {query["sql"]}')
+                    for step in query['plan']:
+                        self.stdout.write(f'        {step}')
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Отчет записан в {options["output"]}')
+
+        regressions = query_plans.full_scans(report)
+        if regressions:
+            tables = sorted({table for _, _, found in regressions for table in found})
+            raise CommandError(f'Полный просмотр таблиц ({", ".join(tables)}) в {len(regressions)} запросах')
+        self.stdout.write(self.style.SUCCESS('Все запросы используют индексы'))
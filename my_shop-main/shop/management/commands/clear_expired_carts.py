@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from shop.models import CartLine
+
+
+# Команда: python manage.py clear_expired_carts --days 30
+# Удаляет брошенные корзины (таблица CartLine) целиком: все позиции корзин, в которых ни одна позиция
+# не менялась больше --days дней. Давно добавленная позиция активной корзины не удаляется.
+# Аналог стандартной команды clearsessions для хранилища DatabaseCartStorage.
+class Command(BaseCommand):
+    help = 'Удаляет позиции корзин, которые давно не изменялись'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Через сколько дней корзина считается брошенной')
+
+    def handle(self, *args, **options):
+        border = timezone.now() - timedelta(days=options['days'])
+        expired = (CartLine.objects.order_by().values('cart_key').annotate(last_updated=Max('updated'))
+                   .filter(last_updated__lt=border).values('cart_key'))
+        deleted, _ = CartLine.objects.filter(cart_key__in=expired).delete()
+        self.stdout.write(self.style.SUCCESS(f'Удалено позиций корзин: {deleted}'))
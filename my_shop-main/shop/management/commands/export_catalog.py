@@ -0,0 +1,41 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import catalog_io
+from shop.models import Product
+
+
+# Команда: python manage.py export_catalog products.csv [--format csv|jsonl] [--category phones]
+# Выгружает товары в CSV или JSONL (в формате import_catalog; '-' или без пути - в стандартный вывод).
+# Товары читаются курсором порциями (QuerySet.iterator), поэтому расход памяти не зависит от
+# размера каталога. Прогресс выводится в stderr, чтобы не смешиваться с выгрузкой в stdout.
+class Command(BaseCommand):
+    help = 'Выгружает товары в CSV/JSONL-файл'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Файл для выгрузки ('-' - стандартный вывод)")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--category', action='append', dest='categories', help='Только товары категории (slug)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Сколько товаров читать из базы за раз')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        queryset = Product.objects.all()
+        if options['categories']:
+            queryset = queryset.filter(category__slug__in=options['categories'])
+
+        started = time.perf_counter()
+
+        def progress(count):
+            self.stderr.write(f'Выгружено товаров: {count} ({count / (time.perf_counter() - started):.0f} в секунду)')
+
+        if path == '-':
+            count = catalog_io.export_catalog(sys.stdout, fmt, queryset, options['chunk_size'], progress)
+        else:
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                count = catalog_io.export_catalog(f, fmt, queryset, options['chunk_size'], progress)
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено товаров: {count} за {time.perf_counter() - started:.1f} с'))
@@ -0,0 +1,73 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import catalog_io
+
+
+# Команда: python manage.py import_catalog products.csv [--format csv|jsonl] [--chunk-size 1000]
+# Массовая загрузка каталога из файла поставщика (CSV с заголовком или JSONL; '-' - стандартный ввод).
+# Файл читается потоком, товары записываются порциями: существующие (по slug) обновляются, новые
+# создаются, недостающие категории создаются по category_slug. Формат полей - см. shop/catalog_io.py.
+# Строки с ошибками пропускаются (первые из них выводятся в конце). После каждой порции выводится
+# прогресс и скорость; в конце перестраиваются похожие товары затронутых категорий (если не указан
+# --no-related) и сбрасывается кэш страниц каталога. Поисковый индекс обновляется по ходу импорта.
+class Command(BaseCommand):
+    help = 'Импортирует товары из CSV/JSONL-файла (создание и обновление по slug)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Файл для импорта ('-' - стандартный ввод)")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--encoding', default='utf-8-sig', help='Кодировка файла')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Сколько строк записывать за раз')
+        parser.add_argument('--no-related', action='store_true',
+                            help='Не перестраивать похожие товары (потом: rebuild_related_products)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        if path == '-':
+            return self._import(sys.stdin, fmt, options)
+        if not os.path.isfile(path):
+            raise CommandError(f'Файл не найден: {path}')
+        with open(path, encoding=options['encoding'], newline='') as f:
+            return self._import(f, fmt, options)
+
+    def _import(self, f, fmt, options):
+        if fmt == 'csv':
+            rows = catalog_io.read_csv(f)
+            first = next(rows, None)
+            columns = set(first[1]) if first else set()
+        else:
+            rows = catalog_io.read_jsonl(f)
+            first = next(rows, None)
+            # Набор необязательных полей берется из первой записи
+            columns = set(first[1]) if first and isinstance(first[1], dict) else set()
+        if first is None:
+            self.stdout.write('Файл пуст')
+            return
+        missing = {'name', 'price', 'category_slug'} - columns
+        if missing:
+            raise CommandError(f'В файле нет обязательных полей: {", ".join(sorted(missing))}')
+
+        def progress(stats):
+            rate = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+            self.stdout.write(f"Строк: {stats['rows']}, создано: {stats['created']}, обновлено: {stats['updated']}, "
+                              f"пропущено: {stats['skipped']} ({rate:.0f} строк/с)")
+
+        def all_rows():
+            yield first
+            yield from rows
+
+        stats = catalog_io.import_rows(all_rows(), columns, chunk_size=options['chunk_size'],
+                                       reindex_related=not options['no_related'], progress=progress)
+        for line_num, error in stats['errors']:
+            self.stderr.write(f'Строка {line_num}: {error}')
+        rate = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово за {stats['seconds']:.1f} с ({rate:.0f} строк/с). Создано: {stats['created']}, "
+            f"обновлено: {stats['updated']}, пропущено с ошибками: {stats['skipped']}"
+        ))
+        if stats['related_seconds']:
+            self.stdout.write(f"Похожие товары перестроены за {stats['related_seconds']:.1f} с")
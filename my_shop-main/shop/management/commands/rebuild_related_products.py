@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import related
+
+
+# Команда: python manage.py rebuild_related_products
+# Пересчитывает таблицу кандидатов "похожих товаров" для всего каталога:
+# товары, которые покупали вместе (по позициям заказов), и товары той же категории.
+# Удобно запускать периодически (например, раз в сутки через cron),
+# чтобы учитывать новые заказы.
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие товары (покупают вместе + та же категория)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=None, help='Зерно генератора случайных чисел')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = related.rebuild_all(seed=options['seed'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано товаров: {total} за {time.perf_counter() - started:.2f} с'
+        ))
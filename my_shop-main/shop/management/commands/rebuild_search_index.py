@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import search
+
+
+# Команда: python manage.py rebuild_search_index
+# Полностью перестраивает поисковый индекс товаров (FTS5 или таблицу токенов).
+# Нужна после массового импорта через bulk_create/update (они не вызывают сигналы)
+# или после изменения правил стемминга в shop/search.py.
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Алиас базы данных')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Сколько товаров индексировать за раз')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        started = time.perf_counter()
+        total = search.rebuild_index(using=using, chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано товаров: {total} за {elapsed:.2f} с (движок: {search.get_backend(using)})'
+        ))
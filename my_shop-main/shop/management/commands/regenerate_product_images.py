@@ -0,0 +1,89 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from shop import images
+from shop.caching import bump_catalog_version
+from shop.models import Product
+
+
+# Обработка одного изображения в отдельном процессе: хэш (если нужен) и недостающие копии.
+# Возвращает (id товара, хэш, создано файлов, текст ошибки или None).
+def _process(product_id, name, digest, force):
+    try:
+        if not digest:
+            digest = images.file_digest(default_storage.open(name, 'rb'))
+        return product_id, digest, images.generate_variants(name, digest, force=force), None
+    except Exception as e:
+        return product_id, digest, 0, f'{type(e).__name__}: {e}'
+
+
+# Команда: python manage.py regenerate_product_images [--workers 4] [--force] [--rehash] [--prune]
+# Создает уменьшенные копии (thumbnail/list/detail, JPEG/PNG + WebP) для всех изображений товаров,
+# которые уже лежат в media. Изображения обрабатываются параллельно в --workers процессах.
+# --force  - пересоздать существующие копии (например, после изменения качества сжатия);
+# --rehash - пересчитать хэши изображений (если файлы меняли в обход админки);
+# --prune  - удалить копии, которые больше не используются ни одним товаром.
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии изображений товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Количество процессов')
+        parser.add_argument('--force', action='store_true', help='Пересоздать существующие копии')
+        parser.add_argument('--rehash', action='store_true', help='Пересчитать хэши изображений')
+        parser.add_argument('--prune', action='store_true', help='Удалить неиспользуемые копии')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = list(Product.objects.exclude(image='').order_by().values_list('id', 'image', 'image_digest'))
+        tasks = [(pk, name, '' if options['rehash'] else digest, options['force']) for pk, name, digest in rows]
+
+        # Соединения с базой не должны наследоваться дочерними процессами.
+        connections.close_all()
+        created, failed, digests = 0, 0, {}
+        with ProcessPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            futures = [pool.submit(_process, *task) for task in tasks]
+            for future in as_completed(futures):
+                product_id, digest, count, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f'Товар {product_id}: {error}')
+                    continue
+                created += count
+                digests[product_id] = digest
+
+        # Новые хэши записываем без сигналов (update), чтобы не сбрасывать кэш каталога на каждый товар.
+        changed = [pk for pk, name, digest in rows if pk in digests and digests[pk] != digest]
+        for pk in changed:
+            Product.objects.filter(pk=pk).update(image_digest=digests[pk])
+        if changed:
+            bump_catalog_version() # URL копий изменились - закэшированные страницы устарели
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Изображений: {len(rows)}, создано копий: {created}, ошибок: {failed}, '
+            f'обновлено хэшей: {len(changed)} за {time.perf_counter() - started:.1f} с'
+        ))
+        if options['prune']:
+            self.stdout.write(f'Удалено неиспользуемых копий: {self._prune(digests.values())}')
+
+    # Удаляет файлы в папке копий, имена которых не соответствуют ни одному текущему изображению.
+    def _prune(self, digests):
+        expected = set()
+        for digest in digests:
+            for variant in images.get_variants():
+                for fmt in images.EXTENSIONS:
+                    expected.add(images.variant_name(digest, variant, fmt))
+        removed = 0
+        root = images.cache_dir()
+        for variant in default_storage.listdir(root)[0] if default_storage.exists(root) else []:
+            for bucket in default_storage.listdir(f'{root}/{variant}')[0]:
+                for filename in default_storage.listdir(f'{root}/{variant}/{bucket}')[1]:
+                    name = f'{root}/{variant}/{bucket}/{filename}'
+                    if name not in expected:
+                        default_storage.delete(name)
+                        removed += 1
+        return removed
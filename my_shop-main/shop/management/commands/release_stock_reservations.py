@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import inventory
+
+
+# Команда: python manage.py release_stock_reservations [--once] [--interval 30]
+# Возвращает на склад резервы товаров из корзин, срок которых истек (SHOP_STOCK_RESERVATION_TTL).
+# Без --once работает постоянно: снимает все просроченные резервы, затем ждет --interval секунд.
+# С --once снимает просроченные резервы и завершается (удобно для cron).
+class Command(BaseCommand):
+    help = 'Возвращает на склад просроченные резервы товаров из корзин'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Проверить резервы один раз и завершиться')
+        parser.add_argument('--batch-size', type=int, default=None, help='Резервов в одной транзакции')
+        parser.add_argument('--interval', type=float, default=30.0, help='Пауза между проверками, с')
+
+    def handle(self, *args, **options):
+        while True:
+            released = inventory.release_expired(batch_size=options['batch_size'])
+            if released or options['once']:
+                self.stdout.write(f'Снято просроченных резервов: {released}')
+            if options['once']:
+                break
+            time.sleep(options['interval'])
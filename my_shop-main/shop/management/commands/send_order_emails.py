@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import emails
+
+
+# Команда: python manage.py send_order_emails [--once] [--batch-size 50] [--interval 5]
+# Обработчик очереди писем-подтверждений заказов (таблица EmailJob).
+# Без --once работает постоянно: отправляет все готовые письма, затем ждет --interval секунд.
+# С --once отправляет все готовые письма и завершается (удобно для cron).
+# Куда уходят письма, определяет EMAIL_BACKEND (для разработки - console или locmem).
+class Command(BaseCommand):
+    help = 'Отправляет письма-подтверждения заказов из очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Обработать очередь один раз и завершиться')
+        parser.add_argument('--batch-size', type=int, default=None, help='Писем в одной пачке (одно соединение)')
+        parser.add_argument('--interval', type=float, default=5.0, help='Пауза между проверками очереди, с')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                result = emails.drain(batch_size=options['batch_size'])
+            except Exception as e: # Например, база недоступна: задания вернутся в очередь по истечении аренды
+                if options['once']:
+                    raise
+                emails.logger.exception('email worker error: %s', e)
+                result = {}
+            if any(result.values()):
+                self.stdout.write(
+                    f"Отправлено: {result['sent']}, отложено: {result['retry']}, с ошибкой: {result['failed']}"
+                )
+            if options['once']:
+                break
+            time.sleep(options['interval'])
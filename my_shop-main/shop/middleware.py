@@ -0,0 +1,75 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction # Для поддержки ASGI без лишних потоков
+from django.core.exceptions import MiddlewareNotUsed # Исключение: middleware не нужно (отключено настройкой)
+from django.utils.functional import SimpleLazyObject # Ленивый объект: создается при первом обращении
+
+from . import instrumentation
+from .cart import Cart
+
+logger = logging.getLogger(__name__)
+
+# Промежуточное ПО (middleware) приложения shop.
+
+# Добавляет к запросу корзину request.cart.
+# Корзина создается лениво (только если к ней обратились) и один раз на запрос,
+# поэтому контекстный процессор, представления и шаблоны используют общий объект
+# с уже загруженными товарами, купоном и посчитанными суммами.
+# Должно стоять после SessionMiddleware.
+# Поддерживает и синхронный, и асинхронный режим: под ASGI Django не переключает поток ради него.
+# Асинхронные представления ленивый объект не используют, а загружают корзину через aget_cart.
+class CartMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.cart = SimpleLazyObject(lambda: Cart(request))
+        return self.get_response(request) # В асинхронном режиме возвращает корутину
+
+
+# Инструментирование: количество и время SQL-запросов, дубли запросов, время рендеринга
+# для каждого запроса (заголовок Server-Timing) и скользящая статистика по представлениям
+# (страница shop:instrumentation_stats). Подробности в shop/instrumentation.py.
+# Если SHOP_INSTRUMENTATION_ENABLED выключена, Django исключает middleware из цепочки
+# (MiddlewareNotUsed), и накладных расходов нет. Лучше ставить первым в MIDDLEWARE,
+# чтобы учитывались и запросы других middleware (сессия, пользователь).
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not instrumentation.is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profile = instrumentation.RequestProfile()
+        with instrumentation.recording(profile):
+            response = self.get_response(request)
+        return self._finish(request, profile, response)
+
+    async def __acall__(self, request):
+        profile = instrumentation.RequestProfile()
+        with instrumentation.recording(profile):
+            response = await self.get_response(request)
+        return self._finish(request, profile, response)
+
+    def _finish(self, request, profile, response):
+        total_ms = profile.elapsed_ms()
+
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        instrumentation.record_sample(view_name, profile, total_ms)
+        response['Server-Timing'] = profile.server_timing(total_ms)
+        if profile.duplicates:
+            logger.warning('%s: %d queries, %d duplicated', view_name, profile.queries, profile.duplicates)
+        return response
@@ -0,0 +1,114 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:28
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+# Код миграции не зависит от shop.search: стеммер и схема индекса скопированы сюда в том виде,
+# в каком были при создании миграции. Последующие изменения shop/search.py не меняют результат
+# применения миграции; индекс по новым правилам строит команда rebuild_search_index.
+
+FTS_TABLE = 'shop_product_fts'
+NAME_WEIGHT = 10
+DESCRIPTION_WEIGHT = 1
+MAX_TOKEN_LENGTH = 64
+
+_WORD_RE = re.compile(r'\w+')
+_CYRILLIC_RE = re.compile(r'^[а-я]+$')
+_RU_ENDINGS = sorted([
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой',
+    'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+    'иями', 'ями', 'ами', 'иях', 'ях', 'ах', 'иям', 'ям', 'ам', 'ием', 'ией', 'ев', 'ов',
+    'ии', 'ию', 'ья', 'ье', 'ью', 'ия', 'а', 'е', 'и', 'о', 'у', 'ы', 'ь', 'ю', 'я', 'й',
+], key=len, reverse=True)
+_MIN_STEM_LENGTH = 3
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    if not _CYRILLIC_RE.match(word):
+        return word
+    for ending in _RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    return [stem(word)[:MAX_TOKEN_LENGTH] for word in _WORD_RE.findall(text or '')]
+
+
+# Виртуальная таблица FTS5. False - не SQLite или SQLite собран без FTS5 (тогда индекс - таблица токенов).
+def create_fts_table(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                f"USING fts5(name, description, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+    except OperationalError:
+        return False
+    return True
+
+
+# На SQLite создаем виртуальную таблицу FTS5 и сразу индексируем существующие товары;
+# без FTS5 - заполняем таблицу токенов.
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    using = connection.alias
+    Product = apps.get_model('shop', 'Product')
+    ProductSearchToken = apps.get_model('shop', 'ProductSearchToken')
+    rows = Product.objects.using(using).order_by('pk').values_list('id', 'name', 'description')
+
+    if create_fts_table(connection):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)',
+                [(pk, ' '.join(tokenize(name)), ' '.join(tokenize(description))) for pk, name, description in rows],
+            )
+        return
+
+    tokens = []
+    for pk, name, description in rows:
+        weights = {}
+        for token in tokenize(name):
+            weights[token] = weights.get(token, 0) + NAME_WEIGHT
+        for token in tokenize(description):
+            weights[token] = weights.get(token, 0) + DESCRIPTION_WEIGHT
+        tokens.extend(ProductSearchToken(product_id=pk, token=token, weight=weight)
+                      for token, weight in weights.items())
+    ProductSearchToken.objects.using(using).bulk_create(tokens, batch_size=1000)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(db_index=True, max_length=64, verbose_name='Токен')),
+                ('weight', models.PositiveIntegerField(default=1, verbose_name='Вес')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='shop.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'токен поиска',
+                'verbose_name_plural': 'токены поиска',
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:32
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, Sum
+
+
+# Итоги существующих заказов по их позициям (так же, как Order.set_totals и команда backfill_order_totals):
+# без этого старые заказы показывали бы $0.00 в админке, письмах и сводных отчетах продаж.
+def fill_order_totals(apps, schema_editor):
+    Order = apps.get_model('shop', 'Order')
+    cent = Decimal('0.01')
+    orders = Order.objects.order_by('pk').annotate(
+        items_subtotal=Sum(F('items__price') * F('items__quantity'),
+                           output_field=DecimalField(max_digits=12, decimal_places=2)))
+    batch = []
+    for order in orders.iterator(chunk_size=500):
+        order.subtotal = Decimal(order.items_subtotal or 0).quantize(cent)
+        if order.coupon_id and order.discount > 0:
+            order.discount_amount = (Decimal(order.discount) / Decimal('100') * order.subtotal).quantize(cent)
+        else:
+            order.discount_amount = Decimal('0.00')
+        order.total = order.subtotal - order.discount_amount
+        batch.append(order)
+        if len(batch) >= 500:
+            Order.objects.bulk_update(batch, ['subtotal', 'discount_amount', 'total'])
+            batch = []
+    Order.objects.bulk_update(batch, ['subtotal', 'discount_amount', 'total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='discount_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='Сумма скидки'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='Сумма до скидки'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='Итоговая сумма'),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
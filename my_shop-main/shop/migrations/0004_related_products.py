@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_order_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(default=0, verbose_name='Вес')),
+                ('source', models.CharField(choices=[('category', 'Та же категория'), ('copurchase', 'Покупают вместе')], max_length=20, verbose_name='Источник')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='shop.product', verbose_name='Товар')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product', verbose_name='Похожий товар')),
+            ],
+            options={
+                'verbose_name': 'похожий товар',
+                'verbose_name_plural': 'похожие товары',
+                'indexes': [models.Index(fields=['product', '-score'], name='shop_relate_product_8a8e9a_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'related'), name='shop_relatedproduct_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_related_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cart_key', models.CharField(max_length=64, verbose_name='Ключ корзины')),
+                ('quantity', models.PositiveIntegerField(default=1, verbose_name='Количество')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Обновлена')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_lines', to='shop.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'позиция корзины',
+                'verbose_name_plural': 'позиции корзины',
+                'indexes': [models.Index(fields=['updated'], name='shop_cartli_updated_a431a4_idx')],
+                'constraints': [models.UniqueConstraint(fields=('cart_key', 'product'), name='shop_cartline_unique')],
+            },
+        ),
+    ]
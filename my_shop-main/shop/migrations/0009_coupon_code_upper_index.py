@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:01
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coupon',
+            index=models.Index(django.db.models.functions.text.Upper('code'), name='shop_coupon_code_upper_idx'),
+        ),
+    ]
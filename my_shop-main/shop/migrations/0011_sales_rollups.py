@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_order_admin_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='День')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+                ('units', models.IntegerField(default=0, verbose_name='Товаров (шт.)')),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма до скидки')),
+                ('discount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Скидки')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('paid_orders', models.IntegerField(default=0, verbose_name='Оплачено заказов')),
+                ('paid_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Оплаченная выручка')),
+            ],
+            options={
+                'verbose_name': 'отчет о продажах',
+                'verbose_name_plural': 'отчеты о продажах',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyCouponSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='День')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма до скидки')),
+                ('discount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Скидки')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('paid_orders', models.IntegerField(default=0, verbose_name='Оплачено заказов')),
+                ('coupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='shop.coupon', verbose_name='Купон')),
+            ],
+            options={
+                'verbose_name': 'продажи по купону за день',
+                'verbose_name_plural': 'продажи по купонам по дням',
+                'constraints': [models.UniqueConstraint(fields=('date', 'coupon'), name='shop_daily_coupon_sales_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='День')),
+                ('units', models.IntegerField(default=0, verbose_name='Продано (шт.)')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('paid_units', models.IntegerField(default=0, verbose_name='Оплачено (шт.)')),
+                ('paid_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Оплаченная выручка')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='shop.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'продажи товара за день',
+                'verbose_name_plural': 'продажи товаров по дням',
+                'indexes': [models.Index(fields=['product', 'date'], name='shop_dailyp_product_77dfc9_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'product'), name='shop_daily_product_sales_unique')],
+            },
+        ),
+    ]
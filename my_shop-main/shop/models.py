@@ -1,15 +1,34 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Sum, F # Для подсчета суммы позиций заказа в базе данных
+from django.db.models.functions import Upper # Для индекса по коду купона без учета регистра
 from django.urls import reverse # Для генерации URL-адресов объектов (метод get_absolute_url)
+from django.core.exceptions import ValidationError # Ошибки проверки модели (clean)
 from django.core.validators import MinValueValidator, MaxValueValidator # Для валидации числовых полей
 from django.utils import timezone # Для работы с датой/временем (например, для купонов)
 from decimal import Decimal # Для точных денежных расчетов
 
 # Модель для категорий товаров
 class Category(models.Model):
+    # Число цифр на один уровень материализованного пути (id категории с ведущими нулями).
+    PATH_STEP = 8
+
     name = models.CharField(max_length=200, verbose_name='Название категории')
     # Slug - это URL-дружественная версия названия (например, "smartfony-apple" для "Смартфоны Apple").
     # unique=True гарантирует, что слаги не будут повторяться.
     slug = models.SlugField(max_length=200, unique=True, verbose_name='URL-слаг')
+    # Родительская категория (пусто - категория верхнего уровня).
+    parent = models.ForeignKey('self', null=True, blank=True, related_name='children', on_delete=models.CASCADE,
+                               verbose_name='Родительская категория')
+    # Материализованный путь: id всех предков и самой категории по PATH_STEP цифр на уровень
+    # ("0000000300000017" - категория 17 внутри категории 3). Путь любой подкатегории начинается
+    # с пути предка, поэтому поддерево - один диапазон по индексу (см. subtree_q). Строка только
+    # из цифр сравнивается одинаково при любой сортировке (collation) базы данных.
+    # Заполняется в save(); пути потомков при переносе категории обновляет shop/categories.py.
+    path = models.CharField(max_length=255, default='', editable=False, db_index=True, verbose_name='Путь')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Уровень')
+    # Количество доступных товаров в категории и всех ее подкатегориях. Меняется только
+    # атомарными UPDATE (shop/categories.py), поэтому не перезаписывается в save().
+    product_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Товаров')
 
     # Meta-класс для настройки поведения модели
     class Meta:
@@ -26,12 +45,52 @@ class Category(models.Model):
     def get_absolute_url(self):
         return reverse('shop:product_list_by_category', args=[self.slug])
 
+    # Путь и уровень вычисляются от родителя; новой категории путь записывается вторым запросом
+    # (до первого сохранения у нее нет id). Прежний путь остается в previous_path: по нему обработчик
+    # post_save переносит поддерево (см. shop/signals.py). product_count в существующей категории
+    # не перезаписывается.
+    def save(self, *args, **kwargs):
+        parent_path = self.parent.path if self.parent_id else ''
+        self.depth = len(parent_path) // self.PATH_STEP
+        if self._state.adding:
+            with transaction.atomic(using=kwargs.get('using')):
+                super().save(*args, **kwargs)
+                self.path = parent_path + self.path_segment(self.pk)
+                type(self).objects.filter(pk=self.pk).update(path=self.path)
+            return
+        self.previous_path, self.path = self.path, parent_path + self.path_segment(self.pk)
+        if kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'product_count']
+        super().save(*args, **kwargs)
+
+    # Родителем не может быть сама категория или ее подкатегория (получился бы цикл).
+    def clean(self):
+        if self.pk and self.path and self.parent_id and self.parent.path.startswith(self.path):
+            raise ValidationError({'parent': 'Категорию нельзя вложить в саму себя или в ее подкатегорию'})
+
+    @classmethod
+    def path_segment(cls, pk):
+        return str(pk).zfill(cls.PATH_STEP)
+
+    # id предков категории (от верхнего уровня), без нее самой.
+    def ancestor_ids(self):
+        return [int(self.path[i:i + self.PATH_STEP]) for i in range(0, len(self.path) - self.PATH_STEP, self.PATH_STEP)]
+
+    # Условие "категория и все ее подкатегории" для фильтра: path >= P AND path < P+1
+    # (P+1 - следующее число той же длины). prefix - путь к полю категории, например 'category__'.
+    def subtree_q(self, prefix=''):
+        upper = str(int(self.path) + 1).zfill(len(self.path))
+        return models.Q(**{f'{prefix}path__gte': self.path, f'{prefix}path__lt': upper})
+
 # Модель для товаров
 class Product(models.Model):
     # Связь "один-ко-многим" с моделью Category (одна категория - много товаров).
     # related_name='products' позволяет обращаться из категории к ее товарам (category.products.all()).
     # on_delete=models.CASCADE означает, что при удалении категории удалятся все связанные с ней товары.
-    category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE, verbose_name='Категория')
+    # Отдельный индекс по category не нужен: его заменяет составной индекс (category, updated), см. Meta.indexes.
+    category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE, db_index=False,
+                                 verbose_name='Категория')
     name = models.CharField(max_length=200, verbose_name='Название товара')
     slug = models.SlugField(max_length=200, unique=True, verbose_name='URL-слаг товара')
     # Поле для изображения товара.
@@ -39,11 +98,19 @@ class Product(models.Model):
     # %Y/%m/%d - создаст подпапки по году/месяцу/дню.
     # blank=True означает, что поле необязательное (товар может быть без картинки).
     image = models.ImageField(upload_to='products/%Y/%m/%d', blank=True, verbose_name='Изображение')
+    # SHA-1 содержимого файла изображения. Из него строятся имена уменьшенных копий (см. shop/images.py),
+    # поэтому новая картинка всегда получает новые URL. Заполняется автоматически при сохранении товара.
+    image_digest = models.CharField(max_length=40, blank=True, editable=False, verbose_name='Хэш изображения')
     description = models.TextField(blank=True, verbose_name='Описание')
     # DecimalField используется для денег, чтобы избежать проблем с точностью float.
     # max_digits - общее кол-во цифр, decimal_places - кол-во знаков после запятой.
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена')
     available = models.BooleanField(default=True, verbose_name='В наличии') # Доступен ли товар для продажи
+    # Остаток на складе. Пусто - количество не отслеживается (товар продается без ограничений).
+    stock = models.PositiveIntegerField(null=True, blank=True, verbose_name='Остаток на складе')
+    # Сколько единиц остатка зарезервировано в корзинах посетителей (см. shop/inventory.py).
+    # Меняется только атомарными UPDATE, поэтому не входит в формы и не перезаписывается в save().
+    reserved = models.PositiveIntegerField(default=0, editable=False, verbose_name='В резерве')
     # auto_now_add=True - дата/время будет установлено автоматически при создании объекта.
     created = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     # auto_now=True - дата/время будет обновляться автоматически при каждом сохранении объекта.
@@ -54,14 +121,152 @@ class Product(models.Model):
         verbose_name = 'товар'
         verbose_name_plural = 'товары'
         # Индексы для slug (unique=True) и id (primary_key=True) создаются автоматически.
-        # Если часто ищутся товары по имени, можно добавить: models.Index(fields=['name'])
+        # Частичные индексы только по доступным товарам (WHERE available) повторяют форму запросов каталога
+        # (filter(available=True) ... order_by('name', 'id')): строки читаются из индекса уже отсортированными,
+        # а курсорная пагинация (name, id) > (...) начинает чтение сразу с нужного места.
+        # Последний столбец available делает индекс покрывающим для условия WHERE available: без него SQLite
+        # считает COUNT(*) доступных товаров полным просмотром таблицы.
+        # Проверка планов запросов: python manage.py check_query_plans.
+        indexes = [
+            # Весь каталог и его COUNT(*)
+            models.Index(fields=['name', 'id', 'available'], condition=models.Q(available=True),
+                         name='shop_product_avail_name_idx'),
+            # Каталог категории и поддерева категорий, COUNT(*) по ним, id доступных товаров категории
+            # (похожие товары)
+            models.Index(fields=['category', 'name', 'id', 'available'], condition=models.Q(available=True),
+                         name='shop_product_cat_avail_idx'),
+            # Время изменения страниц каталога (Last-Modified, shop/caching.py): MAX(updated) по всем товарам
+            # и по товарам категорий. Второй индекс служит и внешнему ключу category.
+            models.Index(fields=['updated'], name='shop_product_updated_idx'),
+            models.Index(fields=['category', 'updated'], name='shop_product_cat_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    # Значения полей на момент загрузки из базы: по ним обработчики сигналов понимают, изменились ли
+    # категория и доступность товара (счетчики товаров в категориях, см. shop/categories.py).
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    # При сохранении существующего товара (админка, формы) поле reserved не записывается:
+    # значение в объекте могло устареть, пока посетители добавляли товар в корзины.
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'reserved']
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('shop:product_detail', args=[self.id, self.slug])
 
+    # Сколько единиц можно продать сейчас (None - количество не отслеживается).
+    @property
+    def sellable(self):
+        if self.stock is None:
+            return None
+        return max(self.stock - self.reserved, 0)
+
+# Модель для переносимого поискового индекса (используется, если база не SQLite с FTS5).
+# Каждая строка - одна основа слова (см. shop.search.tokenize) из названия или описания товара.
+class ProductSearchToken(models.Model):
+    product = models.ForeignKey(Product, related_name='search_tokens', on_delete=models.CASCADE, verbose_name='Товар')
+    # db_index=True - поиск идет по префиксу токена (token__startswith)
+    token = models.CharField(max_length=64, db_index=True, verbose_name='Токен')
+    # Суммарный вес токена в товаре (совпадение в названии весит больше, чем в описании)
+    weight = models.PositiveIntegerField(default=1, verbose_name='Вес')
+
+    class Meta:
+        verbose_name = 'токен поиска'
+        verbose_name_plural = 'токены поиска'
+
+    def __str__(self):
+        return self.token
+
+# Модель для предвычисленных "похожих товаров".
+# Для каждого товара хранится список кандидатов: товары, которые покупали вместе с ним,
+# и товары из той же категории. Заполняется командой rebuild_related_products и обновляется
+# при сохранении товара (см. shop/related.py), на странице товара из кандидатов выбирается случайная выборка.
+class RelatedProduct(models.Model):
+    SOURCE_CATEGORY = 'category'
+    SOURCE_COPURCHASE = 'copurchase'
+    SOURCE_CHOICES = [
+        (SOURCE_CATEGORY, 'Та же категория'),
+        (SOURCE_COPURCHASE, 'Покупают вместе'),
+    ]
+
+    product = models.ForeignKey(Product, related_name='related_links', on_delete=models.CASCADE, verbose_name='Товар')
+    # related_name='+' - обратная связь от похожего товара не нужна
+    related = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE, verbose_name='Похожий товар')
+    # Чем больше, тем выше кандидат в списке (для "покупают вместе" - число общих заказов)
+    score = models.FloatField(default=0, verbose_name='Вес')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, verbose_name='Источник')
+
+    class Meta:
+        verbose_name = 'похожий товар'
+        verbose_name_plural = 'похожие товары'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'related'], name='shop_relatedproduct_unique'),
+        ]
+        indexes = [ # Выборка кандидатов товара по убыванию веса
+            models.Index(fields=['product', '-score']),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} -> {self.related_id}'
+
+# Модель для строки корзины (хранилище shop.cart_storage.DatabaseCartStorage).
+# Вместо того чтобы хранить всю корзину в сессии (и перезаписывать строку django_session при
+# каждом изменении), каждая позиция хранится отдельной строкой и меняется только она.
+class CartLine(models.Model):
+    # Случайный ключ корзины, сохраненный в сессии посетителя (переживает смену ключа сессии при входе)
+    cart_key = models.CharField(max_length=64, verbose_name='Ключ корзины')
+    product = models.ForeignKey(Product, related_name='cart_lines', on_delete=models.CASCADE, verbose_name='Товар')
+    quantity = models.PositiveIntegerField(default=1, verbose_name='Количество')
+    # Цена товара на момент добавления в корзину
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена')
+    updated = models.DateTimeField(auto_now=True, verbose_name='Обновлена')
+
+    class Meta:
+        verbose_name = 'позиция корзины'
+        verbose_name_plural = 'позиции корзины'
+        constraints = [ # Один товар - одна строка в корзине; индекс также ускоряет выборку по cart_key
+            models.UniqueConstraint(fields=['cart_key', 'product'], name='shop_cartline_unique'),
+        ]
+        indexes = [ # Для удаления брошенных корзин (команда clear_expired_carts)
+            models.Index(fields=['updated']),
+        ]
+
+    def __str__(self):
+        return f'{self.cart_key}: {self.product_id} x{self.quantity}'
+
+# Модель для резерва товара в корзине (см. shop/inventory.py).
+# Когда товар с отслеживаемым остатком попадает в корзину, его количество резервируется
+# (Product.reserved) на SHOP_STOCK_RESERVATION_TTL секунд. Просроченные резервы возвращает
+# на склад команда release_stock_reservations, а при оформлении заказа резерв списывается вместе с остатком.
+class StockReservation(models.Model):
+    # Ключ корзины из сессии (тот же, что у CartLine)
+    cart_key = models.CharField(max_length=64, verbose_name='Ключ корзины')
+    product = models.ForeignKey(Product, related_name='reservations', on_delete=models.CASCADE, verbose_name='Товар')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    expires_at = models.DateTimeField(verbose_name='Действует до')
+
+    class Meta:
+        verbose_name = 'резерв товара'
+        verbose_name_plural = 'резервы товаров'
+        constraints = [ # Один товар - один резерв на корзину
+            models.UniqueConstraint(fields=['cart_key', 'product'], name='shop_stockreservation_unique'),
+        ]
+        indexes = [ # Для поиска просроченных резервов
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.cart_key}: {self.product_id} x{self.quantity}'
+
 # Модель для купонов на скидку
 class Coupon(models.Model):
     code = models.CharField(max_length=50, unique=True, verbose_name='Код купона')
@@ -76,6 +281,9 @@ class Coupon(models.Model):
         verbose_name = 'купон'
         verbose_name_plural = 'купоны'
         ordering = ['-valid_to'] # Сначала купоны, которые скоро закончатся или недавно закончились
+        indexes = [ # Поиск купона по коду без учета регистра (shop/coupons.py: UPPER(code) = UPPER(%s))
+            models.Index(Upper('code'), name='shop_coupon_code_upper_idx'),
+        ]
 
     def __str__(self):
         return self.code
@@ -105,11 +313,23 @@ class Order(models.Model):
     # Процент скидки, который был применен к этому заказу (копируется из купона)
     discount = models.IntegerField(default=0, validators=[MinValueValidator(0), MaxValueValidator(100)],
                                    verbose_name='Скидка по купону в %')
+    # Сохраненные итоги заказа (денормализация), чтобы не пересчитывать позиции при каждом обращении.
+    # Заполняются при оформлении заказа и пересчитываются при изменении позиций (см. shop/signals.py).
+    # Для существующих заказов заполняются миграцией 0003_order_totals (пересчитать заново - команда backfill_order_totals).
+    # editable=False - поля не попадают в формы (в админке итоги показываются через readonly_fields).
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False,
+                                   verbose_name='Сумма до скидки')
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False,
+                                          verbose_name='Сумма скидки')
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False,
+                                verbose_name='Итоговая сумма')
 
     class Meta:
         ordering = ['-created'] # Новые заказы первыми
         indexes = [ # Индекс для ускорения выборки заказов по дате создания
             models.Index(fields=['-created']),
+            # Список заказов в админке с фильтром "Оплачен" и навигацией по датам
+            models.Index(fields=['paid', '-created']),
         ]
         verbose_name = 'заказ'
         verbose_name_plural = 'заказы'
@@ -117,20 +337,52 @@ class Order(models.Model):
     def __str__(self):
         return f'Заказ №{self.id}'
 
+    # Значения полей на момент загрузки из базы: по ним обработчик post_save понимает,
+    # что именно изменилось (например, заказ отмечен оплаченным) - см. shop/signals.py.
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    # При сохранении пересчитываем скидку и итог от сохраненной суммы позиций
+    # (например, если в админке поменяли процент скидки). Запросов к позициям не делается.
+    def save(self, *args, **kwargs):
+        self.set_totals(self.subtotal)
+        super().save(*args, **kwargs)
+
+    # Заполняет subtotal/discount_amount/total по сумме позиций (до скидки). Без запросов к базе.
+    def set_totals(self, subtotal):
+        cent = Decimal('0.01')
+        self.subtotal = Decimal(subtotal or 0).quantize(cent)
+        if self.coupon_id and self.discount > 0: # Убеждаемся, что купон применен и скидка есть
+            self.discount_amount = (Decimal(self.discount) / Decimal('100') * self.subtotal).quantize(cent)
+        else:
+            self.discount_amount = Decimal('0.00')
+        self.total = self.subtotal - self.discount_amount
+
+    # Пересчет итогов по позициям заказа (одним агрегирующим запросом) и запись в базу.
+    # Используется queryset.update, чтобы не затрагивать остальные поля заказа.
+    def update_totals(self):
+        subtotal = self.items.aggregate(
+            subtotal=Sum(F('price') * F('quantity'), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+        )['subtotal']
+        self.set_totals(subtotal)
+        Order.objects.filter(pk=self.pk).update(
+            subtotal=self.subtotal, discount_amount=self.discount_amount, total=self.total
+        )
+
     # Общая стоимость товаров в заказе (до применения скидки по купону)
     def get_total_cost_before_discount(self):
-        return sum(item.get_cost() for item in self.items.all())
+        return self.subtotal
 
     # Сумма скидки по купону для этого заказа
     def get_discount_amount(self):
-        if self.coupon and self.discount > 0: # Убеждаемся, что купон применен и скидка есть
-            return (Decimal(self.discount) / Decimal('100')) * self.get_total_cost_before_discount()
-        return Decimal('0') # Если нет купона или скидки, возвращаем 0
+        return self.discount_amount
 
     # Итоговая стоимость заказа (с учетом скидки)
     def get_total_cost(self):
-        total_cost_before_discount = self.get_total_cost_before_discount()
-        return total_cost_before_discount - self.get_discount_amount()
+        return self.total
 
     # Метод для генерации темы email-сообщения
     def get_email_subject(self):
@@ -166,9 +418,11 @@ class Order(models.Model):
 # Модель для отдельной позиции (товара) в заказе
 class OrderItem(models.Model):
     # Связь с заказом, к которому относится эта позиция
-    order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
+    # Отдельные индексы внешних ключей не создаются: их заменяют составные индексы ниже.
+    order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE, db_index=False)
     # Связь с товаром, который был куплен
-    product = models.ForeignKey(Product, related_name='order_items', on_delete=models.CASCADE, verbose_name='Товар')
+    product = models.ForeignKey(Product, related_name='order_items', on_delete=models.CASCADE, db_index=False,
+                                verbose_name='Товар')
     # Цена товара на момент покупки (важно, т.к. цена на сайте может измениться)
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена (на момент покупки)')
     quantity = models.PositiveIntegerField(default=1, verbose_name='Количество')
@@ -176,10 +430,116 @@ class OrderItem(models.Model):
     class Meta:
         verbose_name = 'позиция заказа'
         verbose_name_plural = 'позиции заказа'
+        # "Покупают вместе" (shop/related.py): заказы с товаром - по (product, order), затем все товары
+        # этих заказов - по (order, product). Оба индекса покрывающие: таблица позиций не читается.
+        indexes = [
+            models.Index(fields=['product', 'order'], name='shop_orderitem_product_idx'),
+            models.Index(fields=['order', 'product'], name='shop_orderitem_order_idx'),
+        ]
 
     def __str__(self):
         return str(self.id) # Или f'{self.product.name} (x{self.quantity})'
 
     # Стоимость данной позиции заказа (цена * количество)
     def get_cost(self):
-        return self.price * self.quantity
\ No newline at end of file
+        return self.price * self.quantity
+
+# Задание очереди отправки писем (письмо-подтверждение заказа).
+# Оформление заказа только добавляет задание в эту таблицу (в той же транзакции, что и заказ),
+# а письма рендерит и отправляет отдельный процесс - команда send_order_emails (см. shop/emails.py).
+class EmailJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает отправки'),
+        (STATUS_SENDING, 'Отправляется'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_FAILED, 'Ошибка (попытки исчерпаны)'),
+    ]
+
+    order = models.ForeignKey(Order, related_name='email_jobs', on_delete=models.CASCADE, verbose_name='Заказ')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='Статус')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Попыток отправки')
+    # Время, раньше которого задание не берется в работу (для повторов с задержкой и "аренды" задания обработчиком)
+    available_at = models.DateTimeField(default=timezone.now, verbose_name='Доступно с')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Отправлено')
+
+    class Meta:
+        ordering = ['available_at', 'id']
+        verbose_name = 'письмо в очереди'
+        verbose_name_plural = 'очередь писем'
+        indexes = [
+            # Выборка очередной пачки: WHERE status IN (...) AND available_at <= now ORDER BY available_at
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+    def __str__(self):
+        return f'Письмо по заказу №{self.order_id} ({self.get_status_display()})'
+
+
+# Сводные таблицы продаж по дням (shop/reports.py). Отчеты в админке читают только их,
+# поэтому не зависят от количества заказов. Обновляются при оформлении заказа и при отметке
+# об оплате, полностью пересчитываются командой backfill_sales_reports.
+# День - дата создания заказа в часовом поясе магазина (TIME_ZONE).
+# Поля paid_* - то же самое только по оплаченным заказам.
+
+# Итоги дня по всем заказам.
+class DailySales(models.Model):
+    date = models.DateField(unique=True, verbose_name='День')
+    orders = models.IntegerField(default=0, verbose_name='Заказов')
+    units = models.IntegerField(default=0, verbose_name='Товаров (шт.)')
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Сумма до скидки')
+    discount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Скидки')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Выручка')
+    paid_orders = models.IntegerField(default=0, verbose_name='Оплачено заказов')
+    paid_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Оплаченная выручка')
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name = 'отчет о продажах'
+        verbose_name_plural = 'отчеты о продажах'
+
+    def __str__(self):
+        return f'Продажи за {self.date}'
+
+
+# Продажи товара за день (выручка - по ценам позиций, до скидки по купону).
+class DailyProductSales(models.Model):
+    date = models.DateField(verbose_name='День')
+    product = models.ForeignKey(Product, related_name='daily_sales', on_delete=models.CASCADE, verbose_name='Товар')
+    units = models.IntegerField(default=0, verbose_name='Продано (шт.)')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Выручка')
+    paid_units = models.IntegerField(default=0, verbose_name='Оплачено (шт.)')
+    paid_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Оплаченная выручка')
+
+    class Meta:
+        verbose_name = 'продажи товара за день'
+        verbose_name_plural = 'продажи товаров по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='shop_daily_product_sales_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'date']), # История продаж одного товара
+        ]
+
+
+# Заказы с купоном за день.
+class DailyCouponSales(models.Model):
+    date = models.DateField(verbose_name='День')
+    coupon = models.ForeignKey(Coupon, related_name='daily_sales', on_delete=models.CASCADE, verbose_name='Купон')
+    orders = models.IntegerField(default=0, verbose_name='Заказов')
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Сумма до скидки')
+    discount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Скидки')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Выручка')
+    paid_orders = models.IntegerField(default=0, verbose_name='Оплачено заказов')
+
+    class Meta:
+        verbose_name = 'продажи по купону за день'
+        verbose_name_plural = 'продажи по купонам по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'coupon'], name='shop_daily_coupon_sales_unique'),
+        ]
\ No newline at end of file
@@ -0,0 +1,251 @@
+import base64 # Для кодирования курсора в строку для URL
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache # Для кэширования количества товаров
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .caching import acache_get, acache_set # Асинхронный доступ к кэшу
+
+# Пагинация каталога.
+# KeysetPaginator - постраничный вывод по курсору (keyset / seek-пагинация):
+# вместо OFFSET следующая страница выбирается условием "после последнего показанного товара"
+# по ключу (name, id), поэтому глубокие страницы стоят столько же, сколько первая, и не нужен COUNT(*).
+# CachedCountPaginator - обычный Paginator (номера страниц), но COUNT(*) кэшируется.
+# EstimatedCountPaginator - для списков админки: на больших выборках COUNT(*) заменяется оценкой
+# планировщика PostgreSQL, на других базах считается точно.
+
+# Сколько секунд хранить в кэше количество объектов выборки.
+COUNT_CACHE_TIMEOUT = 300
+
+
+# Количество объектов в QuerySet с кэшированием по тексту SQL-запроса.
+# Если timeout равен 0, считается без кэша.
+def cached_count(queryset, timeout=COUNT_CACHE_TIMEOUT):
+    if not timeout:
+        return queryset.count()
+    key = _count_key(queryset)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+async def acached_count(queryset, timeout=COUNT_CACHE_TIMEOUT):
+    if not timeout:
+        return await queryset.acount()
+    key = _count_key(queryset)
+    count = await acache_get(key)
+    if count is None:
+        count = await queryset.acount()
+        await acache_set(key, count, timeout)
+    return count
+
+
+def _count_key(queryset):
+    sql, params = queryset.query.sql_with_params()
+    return 'shop:count:' + hashlib.md5(f'{queryset.db}:{sql}:{params!r}'.encode()).hexdigest()
+
+
+# Кодирование курсора: значения ключа последнего/первого объекта и направление ('n' - вперед, 'p' - назад).
+def encode_cursor(values, direction):
+    raw = json.dumps({'k': values, 'd': direction}, separators=(',', ':'), ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+# Раскодирование курсора. Для пустого или испорченного курсора возвращает (None, 'n') - первая страница.
+def decode_cursor(token, key_length):
+    if not token:
+        return None, 'n'
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+        values, direction = data['k'], data['d']
+    except (ValueError, TypeError, KeyError):
+        return None, 'n'
+    if not isinstance(values, list) or len(values) != key_length or direction not in ('n', 'p'):
+        return None, 'n'
+    return values, direction
+
+
+# Paginator, который кэширует результат COUNT(*) (используется для ссылок вида ?page=N).
+class CachedCountPaginator(Paginator):
+    count_cache_timeout = COUNT_CACHE_TIMEOUT
+
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list, self.count_cache_timeout)
+
+    # Асинхронная загрузка страницы number (номер уже проверен или будет проверен validate_number).
+    # COUNT(*) и товары страницы загружаются заранее, поэтому шаблон не обращается к базе.
+    # Неверный номер страницы заменяется первой (или последней) страницей, как в product_list.
+    async def apage(self, number):
+        self.__dict__['count'] = await acached_count(self.object_list, self.count_cache_timeout)
+        try:
+            page = self.page(number)
+        except PageNotAnInteger:
+            page = self.page(1)
+        except EmptyPage:
+            page = self.page(self.num_pages)
+        page.object_list = [obj async for obj in page.object_list]
+        return page
+
+
+# Paginator для списков админки (заказы, товары): точный COUNT(*) по большой таблице с фильтрами
+# занимает больше времени, чем сама страница. Поэтому:
+# - PostgreSQL: выборки больше SHOP_ADMIN_EXACT_COUNT_LIMIT строк (по оценке планировщика, EXPLAIN
+#   без чтения таблицы) не считаются точно - выводится оценка, точно считаются только меньшие;
+# - другие базы (оценки планировщика нет): точный COUNT(*) без кэша - после добавления или удаления
+#   строк итог в админке сразу верный. Количество не обрезается, поэтому все страницы остаются доступны.
+class EstimatedCountPaginator(Paginator):
+    @property
+    def exact_limit(self):
+        return getattr(settings, 'SHOP_ADMIN_EXACT_COUNT_LIMIT', 10000)
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'): # Список, а не QuerySet
+            return len(queryset)
+        if connections[queryset.db].vendor == 'postgresql':
+            estimate = self._planner_estimate(queryset)
+            if estimate is not None and estimate > self.exact_limit:
+                return estimate
+            return queryset.count()
+        return queryset.order_by().count()
+
+    # Оценка количества строк планировщиком PostgreSQL (None, если план не удалось разобрать).
+    @staticmethod
+    def _planner_estimate(queryset):
+        try:
+            plan = json.loads(queryset.order_by().explain(format='json'))
+            return int(plan[0]['Plan']['Plan Rows'])
+        except (ValueError, KeyError, IndexError, TypeError):
+            return None
+
+
+# Страница keyset-пагинации. По интерфейсу похожа на django.core.paginator.Page,
+# поэтому шаблон может перебирать ее в цикле и проверять has_next/has_previous.
+class KeysetPage:
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __repr__(self):
+        return f'<KeysetPage next={self.next_cursor!r} previous={self.previous_cursor!r}>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+# Keyset-пагинатор.
+# queryset - выборка (сортировка будет заменена на key_fields),
+# per_page - размер страницы,
+# key_fields - поля уникального ключа сортировки (последнее поле должно быть уникальным, обычно 'id'),
+# count_cache_timeout - время кэширования приблизительного количества (0 - считать точно каждый раз).
+class KeysetPaginator:
+    is_keyset = True
+
+    def __init__(self, queryset, per_page, key_fields=('name', 'id'), count_cache_timeout=COUNT_CACHE_TIMEOUT):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.key_fields = tuple(key_fields)
+        self.count_cache_timeout = count_cache_timeout
+
+    # Количество объектов во всей выборке (из кэша, поэтому может немного отставать).
+    # Запрос выполняется только если шаблон действительно обращается к count.
+    @cached_property
+    def count(self):
+        return cached_count(self.queryset.order_by(), self.count_cache_timeout)
+
+    # Асинхронная загрузка count заранее (шаблон асинхронного представления не может обращаться к базе).
+    async def aload_count(self):
+        self.__dict__['count'] = await acached_count(self.queryset.order_by(), self.count_cache_timeout)
+        return self.count
+
+    # Условие "строго после (или до) ключа values" для составного ключа:
+    # (a > x) OR (a = x AND b > y) OR ...
+    def _seek_filter(self, values, lookup):
+        condition = Q()
+        for i, field in enumerate(self.key_fields):
+            equal = {f: values[j] for j, f in enumerate(self.key_fields[:i])}
+            condition |= Q(**equal, **{f'{field}__{lookup}': values[i]})
+        return condition
+
+    def _key(self, obj):
+        return [getattr(obj, field) for field in self.key_fields]
+
+    # Курсор, значения которого приведены к типам полей ключа. Курсор с неподходящими значениями
+    # (например, строка вместо id) считается испорченным - первая страница, а не ошибка 500.
+    def _decode(self, cursor):
+        values, direction = decode_cursor(cursor, len(self.key_fields))
+        if values is None:
+            return None, 'n'
+        opts = self.queryset.model._meta
+        try:
+            values = [opts.get_field(field).to_python(value) for field, value in zip(self.key_fields, values)]
+        except (ValueError, TypeError, ValidationError):
+            return None, 'n'
+        if any(value is None for value in values):
+            return None, 'n'
+        return values, direction
+
+    # Возвращает страницу по курсору (None или испорченный курсор - первая страница).
+    def page(self, cursor=None):
+        values, direction = self._decode(cursor)
+        queryset = self._page_queryset(values, direction)
+        # Берем на один объект больше, чтобы узнать, есть ли еще страница в этом направлении.
+        return self._make_page(list(queryset[:self.per_page + 1]), values, direction)
+
+    # Асинхронный вариант page() (асинхронная итерация по QuerySet).
+    async def apage(self, cursor=None):
+        values, direction = self._decode(cursor)
+        queryset = self._page_queryset(values, direction)
+        return self._make_page([obj async for obj in queryset[:self.per_page + 1]], values, direction)
+
+    # Выборка страницы: после курсора по возрастанию ключа или до курсора по убыванию.
+    def _page_queryset(self, values, direction):
+        if values is None:
+            return self.queryset.order_by(*self.key_fields)
+        if direction == 'n':
+            return self.queryset.filter(self._seek_filter(values, 'gt')).order_by(*self.key_fields)
+        descending = [f'-{field}' for field in self.key_fields]
+        return self.queryset.filter(self._seek_filter(values, 'lt')).order_by(*descending)
+
+    # Страница из загруженных строк (на одну больше размера страницы - признак следующей страницы).
+    def _make_page(self, rows, values, direction):
+        if values is None:
+            has_more, has_before = len(rows) > self.per_page, False
+            rows = rows[:self.per_page]
+        elif direction == 'n':
+            has_more, has_before = len(rows) > self.per_page, True
+            rows = rows[:self.per_page]
+        else:
+            has_before, has_more = len(rows) > self.per_page, True
+            rows = rows[:self.per_page][::-1]
+
+        if not rows:
+            return KeysetPage([], self)
+        next_cursor = encode_cursor(self._key(rows[-1]), 'n') if has_more else None
+        previous_cursor = encode_cursor(self._key(rows[0]), 'p') if has_before else None
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
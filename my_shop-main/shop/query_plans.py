@@ -0,0 +1,153 @@
+import json
+
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from . import categories
+from .benchmarks import seed_catalog, seed_coupons, seed_orders
+from .caching import bump_catalog_version
+from .models import Category, Coupon, Product
+
+# Проверка планов запросов представлений магазина (команда check_query_plans и тесты).
+# Каждый сценарий - обращение к странице или API через тестовый клиент (кэш страниц выключен).
+# Все SELECT, выполненные при этом, перехватываются (execute_wrapper), и для каждого выполняется
+# EXPLAIN с теми же параметрами. Регрессия - полный просмотр таблицы:
+#   SQLite     - строка плана "SCAN <таблица>" без индекса (SCAN ... USING INDEX - это чтение
+#                индекса по порядку, например для ORDER BY ... LIMIT, оно допустимо);
+#   PostgreSQL - узел "Seq Scan" (на реальном объеме данных после ANALYZE).
+# Временная сортировка (SQLite "USE TEMP B-TREE", PostgreSQL "Sort") не считается ошибкой,
+# но выводится в отчете.
+
+# Таблицы, которые читаются целиком намеренно: {таблица: причина}.
+ALLOWED_SCANS = {
+    'shop_category': 'снимок дерева категорий (caching.get_category_tree) загружает все категории',
+}
+
+ORDER_FORM = {'first_name': 'План', 'last_name': 'Запросов', 'email': 'plans@example.com',
+              'address': 'ул. Тестовая, 1', 'postal_code': '101000', 'city': 'Москва'}
+
+
+# Тестовые данные: каталог с вложенными категориями (вторая половина категорий - подкатегории первой),
+# купоны и заказы (для "покупают вместе"). ANALYZE собирает статистику для планировщика.
+# Данные создаются без сигналов, поэтому версия каталога (и закэшированное дерево категорий) сбрасывается явно.
+def seed(categories_count=20, products=5000, orders=2000, seed=0):
+    seeded = seed_catalog(categories=categories_count, products=products, seed=seed)
+    half = len(seeded) // 2
+    for index, category in enumerate(seeded[half:]):
+        Category.objects.filter(pk=category.pk).update(parent=seeded[index % half])
+    categories.rebuild()
+    bump_catalog_version()
+    seed_coupons(seed=seed)
+    seed_orders(orders=orders, seed=seed)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+# Данные для сценариев: товар, категория с подкатегориями и без, слово для поиска, купон.
+def _fixtures():
+    parent = Category.objects.filter(children__isnull=False).order_by('id').first()
+    leaf = Category.objects.filter(children__isnull=True, product_count__gt=0).order_by('id').first()
+    product = Product.objects.filter(available=True).order_by('id').first()
+    coupon = Coupon.objects.filter(active=True).order_by('id').first()
+    return {
+        'parent': parent, 'leaf': leaf, 'product': product, 'coupon': coupon,
+        'word': product.name.split()[0] if product else 'товар',
+    }
+
+
+def _cart_api(client, data):
+    operations = [{'op': 'add', 'product_id': data['product'].id, 'quantity': 1}]
+    return client.post(reverse('shop:cart_api'), json.dumps({'operations': operations}),
+                       content_type='application/json')
+
+
+def _next_page(client, data):
+    page = client.get(reverse('shop:product_list')).context['products']
+    return client.get(reverse('shop:product_list'), {'cursor': page.next_cursor})
+
+
+# Сценарии: (название, функция(client, data) -> response). Клиент общий: корзина, заполненная
+# в cart_api, используется страницами корзины и оформления заказа.
+SCENARIOS = [
+    ('product_list', lambda client, data: client.get(reverse('shop:product_list'))),
+    ('product_list_cursor', _next_page),
+    ('product_list_page', lambda client, data: client.get(reverse('shop:product_list'), {'page': 2})),
+    ('product_list_category', lambda client, data: client.get(data['parent'].get_absolute_url())),
+    ('product_list_leaf_category', lambda client, data: client.get(data['leaf'].get_absolute_url())),
+    ('product_search', lambda client, data: client.get(reverse('shop:product_list'), {'query': data['word']})),
+    ('product_detail', lambda client, data: client.get(data['product'].get_absolute_url())),
+    ('cart_api', _cart_api),
+    ('cart_detail', lambda client, data: client.get(reverse('shop:cart_detail'))),
+    ('coupon_apply', lambda client, data: client.post(reverse('shop:coupon_apply'), {'code': data['coupon'].code})),
+    ('order_create', lambda client, data: client.post(reverse('shop:order_create'), ORDER_FORM)),
+]
+
+
+# Строки плана запроса: список (текст, полный просмотр, временная сортировка).
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [_sqlite_step(row[3]) for row in cursor.fetchall()]
+        if connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            return list(_postgres_steps(plan[0]['Plan']))
+    raise NotImplementedError(f'Планы запросов для {connection.vendor} не поддерживаются')
+
+
+def _sqlite_step(detail):
+    table = detail.split()[1] if detail.startswith('SCAN ') else None
+    full_scan = (table is not None and ' USING ' not in detail and 'VIRTUAL TABLE' not in detail
+                 and 'CONSTANT ROW' not in detail and not detail.startswith('SCAN (subquery'))
+    return detail, table if full_scan else None, detail.startswith('USE TEMP B-TREE')
+
+
+def _postgres_steps(node):
+    table = node.get('Relation Name') if node['Node Type'] == 'Seq Scan' else None
+    yield f'{node["Node Type"]} {node.get("Relation Name", "")}'.strip(), table, node['Node Type'] == 'Sort'
+    for child in node.get('Plans', []):
+        yield from _postgres_steps(child)
+
+
+# Выполняет сценарии и возвращает отчет: список {'scenario', 'status', 'queries': [{'sql', 'plan',
+# 'full_scans', 'sorts'}]} (одинаковые запросы сценария - один раз).
+def collect(scenarios=None):
+    data = _fixtures()
+    client = Client()
+    report = []
+    for name, run in SCENARIOS:
+        if scenarios and name not in scenarios:
+            continue
+        captured = []
+
+        def capture(execute, sql, params, many, context):
+            if not many and sql.lstrip().upper().startswith('SELECT'):
+                captured.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with override_settings(SHOP_PAGE_CACHE_ENABLED=False), connection.execute_wrapper(capture):
+            response = run(client, data)
+
+        queries, seen = [], set()
+        for sql, params in captured:
+            if sql in seen:
+                continue
+            seen.add(sql)
+            plan = explain(sql, params)
+            queries.append({
+                'sql': sql,
+                'plan': [step for step, _, _ in plan],
+                'full_scans': sorted({table for _, table, _ in plan if table and table not in ALLOWED_SCANS}),
+                'sorts': sum(1 for _, _, sort in plan if sort),
+            })
+        report.append({'scenario': name, 'status': response.status_code, 'queries': queries})
+    return report
+
+
+# Запросы с полным просмотром таблиц: [(сценарий, sql, таблицы)].
+def full_scans(report):
+    return [(entry['scenario'], query['sql'], query['full_scans'])
+            for entry in report for query in entry['queries'] if query['full_scans']]
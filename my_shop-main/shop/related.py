@@ -0,0 +1,207 @@
+import random # Для случайной выборки из кандидатов
+
+from django.conf import settings
+from django.core.cache import cache # Кэш списков кандидатов
+from django.db import transaction
+from django.db.models import Count
+
+from .caching import acache_get, acache_set # Асинхронный доступ к кэшу
+from .models import Category, Product, OrderItem, RelatedProduct
+
+# "Похожие товары" на странице товара.
+# Вместо .order_by('?') (сортировка всей категории случайным ключом на каждый просмотр)
+# кандидаты заранее записываются в таблицу RelatedProduct, а при запросе из небольшого
+# списка кандидатов (хранится в кэше) выбирается случайная выборка и загружается по id.
+
+# Сколько кандидатов хранить для одного товара.
+def _candidates_limit():
+    return getattr(settings, 'SHOP_RELATED_CANDIDATES', 20)
+
+# Сколько секунд хранить в кэше список кандидатов товара.
+def _cache_timeout():
+    return getattr(settings, 'SHOP_RELATED_CACHE_TIMEOUT', 600)
+
+# Ключ "поколения" кэша: увеличивается при полной перестройке, чтобы сразу устарели все списки.
+GENERATION_KEY = 'shop:related:generation'
+
+# Вес кандидата "покупают вместе" за один общий заказ (кандидаты из категории имеют вес < 1).
+COPURCHASE_WEIGHT = 10.0
+
+
+def _cache_key(product_id, generation=None):
+    generation = generation or cache.get_or_set(GENERATION_KEY, 1, None)
+    return f'shop:related:{generation}:{product_id}'
+
+
+# Счетчики совместных покупок для товаров product_ids: {product_id: {other_id: число заказов}}.
+# Один агрегирующий запрос: позиции заказов соединяются с другими позициями тех же заказов.
+def _copurchase_counts(product_ids):
+    counts = {}
+    rows = (OrderItem.objects
+            .filter(product_id__in=product_ids)
+            .values('product_id', 'order__items__product_id')
+            .annotate(orders=Count('order_id', distinct=True)))
+    for row in rows:
+        other_id = row['order__items__product_id']
+        if other_id != row['product_id']:
+            counts.setdefault(row['product_id'], {})[other_id] = row['orders']
+    return counts
+
+
+# Список кандидатов для одного товара: сначала "покупают вместе" (по убыванию числа заказов),
+# затем случайные товары той же категории до заполнения limit.
+# pool - id товаров категории (список строится один раз на категорию), pool_set - те же id множеством.
+# Случайные id выбираются по индексу с отбрасыванием уже взятых, поэтому время не зависит от размера
+# категории; в маленьком списке (где отбрасываний было бы много) выборка делается из отфильтрованного списка.
+def _build_links(product_id, copurchases, pool, limit, rng, pool_set=None):
+    links = []
+    top = sorted(copurchases.items(), key=lambda pair: -pair[1])[:limit]
+    for other_id, orders in top:
+        links.append(RelatedProduct(product_id=product_id, related_id=other_id,
+                                    score=COPURCHASE_WEIGHT * orders, source=RelatedProduct.SOURCE_COPURCHASE))
+    taken = {product_id, *(other_id for other_id, _ in top)}
+    pool_set = set(pool) if pool_set is None else pool_set
+    need = min(limit - len(links), len(pool) - len(taken & pool_set))
+    if need <= 0:
+        return links
+    if len(pool) <= 4 * (need + len(taken)):
+        chosen = rng.sample([pk for pk in pool if pk not in taken], need)
+    else:
+        chosen = []
+        while len(chosen) < need:
+            pk = pool[rng.randrange(len(pool))]
+            if pk not in taken:
+                taken.add(pk)
+                chosen.append(pk)
+    for pk in chosen:
+        links.append(RelatedProduct(product_id=product_id, related_id=pk,
+                                    score=rng.random(), source=RelatedProduct.SOURCE_CATEGORY))
+    return links
+
+
+# Пересчитывает кандидатов для всех товаров одной категории.
+# Запросов: id товаров категории + совместные покупки + удаление + вставка (bulk_create).
+def rebuild_category(category_id, rng=None):
+    rng = rng or random.Random()
+    limit = _candidates_limit()
+    all_ids = list(Product.objects.filter(category_id=category_id).order_by().values_list('id', 'available'))
+    product_ids = [pk for pk, _ in all_ids]
+    available_ids = [pk for pk, available in all_ids if available]
+    copurchases = _copurchase_counts(product_ids)
+
+    available_set = set(available_ids)
+    links = []
+    for pk in product_ids:
+        links.extend(_build_links(pk, copurchases.get(pk, {}), available_ids, limit, rng, available_set))
+    with transaction.atomic():
+        RelatedProduct.objects.filter(product_id__in=product_ids).delete()
+        RelatedProduct.objects.bulk_create(links, batch_size=1000)
+    return len(product_ids)
+
+
+# Полная перестройка таблицы кандидатов (команда rebuild_related_products).
+# Возвращает количество обработанных товаров.
+def rebuild_all(seed=None):
+    return rebuild_categories(Category.objects.values_list('id', flat=True).iterator(), seed)
+
+
+# Перестройка кандидатов для товаров нескольких категорий (например, после массового импорта).
+def rebuild_categories(category_ids, seed=None):
+    rng = random.Random(seed)
+    total = 0
+    for category_id in category_ids:
+        total += rebuild_category(category_id, rng)
+    # Новое поколение кэша - все закэшированные списки кандидатов становятся неактуальными.
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 2, None)
+    return total
+
+
+# Инкрементальное обновление кандидатов одного товара (вызывается при сохранении товара).
+# Кандидаты из категории - случайная выборка из первых limit * 5 id категории
+# (order_by() отключает сортировку по имени, чтобы не сортировать всю категорию).
+def refresh_product(product):
+    limit = _candidates_limit()
+    category_ids = list(Product.objects
+                        .filter(category_id=product.category_id, available=True)
+                        .exclude(id=product.id)
+                        .order_by()
+                        .values_list('id', flat=True)[:limit * 5])
+    copurchases = _copurchase_counts([product.id]).get(product.id, {})
+    links = _build_links(product.id, copurchases, category_ids, limit, random.Random())
+    with transaction.atomic():
+        RelatedProduct.objects.filter(product_id=product.id).delete()
+        RelatedProduct.objects.bulk_create(links)
+    cache.delete(_cache_key(product.id))
+
+
+# id кандидатов для товара: из кэша, иначе из таблицы RelatedProduct.
+# Если кандидатов еще нет (товар добавлен массовым импортом и таблица не перестроена),
+# берутся первые попавшиеся товары той же категории - без сортировки случайным ключом.
+def candidate_ids(product):
+    key = _cache_key(product.id)
+    ids = cache.get(key)
+    if ids is None:
+        limit = _candidates_limit()
+        ids = list(RelatedProduct.objects
+                   .filter(product_id=product.id)
+                   .order_by('-score')
+                   .values_list('related_id', flat=True)[:limit])
+        if not ids:
+            ids = list(Product.objects
+                       .filter(category_id=product.category_id, available=True)
+                       .exclude(id=product.id)
+                       .order_by()
+                       .values_list('id', flat=True)[:limit])
+        cache.set(key, ids, _cache_timeout())
+    return ids
+
+
+# Асинхронный вариант candidate_ids (для асинхронных представлений).
+async def acandidate_ids(product):
+    generation = await acache_get(GENERATION_KEY)
+    if generation is None:
+        generation = 1
+        await acache_set(GENERATION_KEY, generation, None)
+    key = _cache_key(product.id, generation)
+    ids = await acache_get(key)
+    if ids is None:
+        limit = _candidates_limit()
+        ids = [pk async for pk in (RelatedProduct.objects
+                                   .filter(product_id=product.id)
+                                   .order_by('-score')
+                                   .values_list('related_id', flat=True)[:limit])]
+        if not ids:
+            ids = [pk async for pk in (Product.objects
+                                       .filter(category_id=product.category_id, available=True)
+                                       .exclude(id=product.id)
+                                       .order_by()
+                                       .values_list('id', flat=True)[:limit])]
+        await acache_set(key, ids, _cache_timeout())
+    return ids
+
+
+# Случайная выборка из кандидатов с запасом (часть кандидатов могла стать недоступной).
+def _sample(ids, count):
+    return random.sample(ids, min(len(ids), count * 2))
+
+
+# Похожие товары для страницы товара: случайная выборка из кандидатов (до count штук).
+def get_related_products(product, count=4):
+    ids = candidate_ids(product)
+    if not ids:
+        return []
+    sample = _sample(ids, count)
+    products = {p.id: p for p in Product.objects.filter(id__in=sample, available=True)}
+    return [products[pk] for pk in sample if pk in products][:count]
+
+
+async def aget_related_products(product, count=4):
+    ids = await acandidate_ids(product)
+    if not ids:
+        return []
+    sample = _sample(ids, count)
+    products = {p.id: p async for p in Product.objects.filter(id__in=sample, available=True)}
+    return [products[pk] for pk in sample if pk in products][:count]
@@ -0,0 +1,256 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyCouponSales, DailyProductSales, DailySales, Order, OrderItem
+
+# Отчеты о продажах: выручка по дням, продажи товаров, эффективность купонов, лучшие категории.
+# Отчеты читают только сводные таблицы по дням (DailySales, DailyProductSales, DailyCouponSales),
+# в которых строк не больше, чем дней x товаров, поэтому время ответа не зависит от числа заказов.
+# Сводные таблицы поддерживаются так (обработчики в shop/signals.py, после фиксации транзакции):
+# - новый заказ (оформление или админка) - record_order(): прибавляет заказ к строкам его дня;
+# - заказ отмечен оплаченным или оплата снята - record_payment(): меняет только поля paid_*;
+# - другие правки (позиции, скидка, удаление заказа) - rebuild_dates(): день пересчитывается целиком.
+# Прибавление выполняется UPDATE ... SET поле = поле + N, поэтому одновременные заказы не теряют
+# изменения друг друга. Ошибка обновления сводки не мешает заказу (on_commit с robust=True) -
+# расхождение исправляет команда backfill_sales_reports, которая пересчитывает сводки в SQL по дням.
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+MONEY_FIELDS = ('subtotal', 'discount', 'revenue', 'paid_revenue', 'average_order')
+
+
+# День заказа (дата создания в часовом поясе магазина).
+def order_date(created):
+    return timezone.localdate(created)
+
+
+# Границы дней start..end (включительно) как моменты времени: [начало start, начало дня после end).
+# Фильтр по created в таком виде использует индекс, в отличие от created__date.
+def day_bounds(start, end):
+    return (timezone.make_aware(datetime.combine(start, time.min)),
+            timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)))
+
+
+# Прибавляет deltas к строке model с ключом keys (строки нет - создается).
+def _increment(model, keys, deltas):
+    changes = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**keys).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **deltas)
+    except IntegrityError: # Строку только что создал параллельный заказ
+        model.objects.filter(**keys).update(**changes)
+
+
+# Позиции заказа по товарам: [(product_id, штук, сумма)], по возрастанию id товара
+# (одинаковый порядок блокировки строк сводки в параллельных транзакциях).
+def _order_lines(order_id):
+    return list(OrderItem.objects.filter(order_id=order_id).order_by('product_id').values('product_id')
+                .annotate(units=Sum('quantity'), revenue=Sum(F('price') * F('quantity'), output_field=MONEY))
+                .values_list('product_id', 'units', 'revenue'))
+
+
+# Прибавляет заказ к сводкам его дня (sign=-1 - вычитает).
+def record_order(order_id, sign=1):
+    order = Order.objects.filter(pk=order_id).first()
+    if order is None:
+        return
+    day = order_date(order.created)
+    lines = _order_lines(order_id)
+    paid = 1 if order.paid else 0
+    with transaction.atomic():
+        _increment(DailySales, {'date': day}, {
+            'orders': sign, 'units': sign * sum(units for _, units, _ in lines),
+            'subtotal': sign * order.subtotal, 'discount': sign * order.discount_amount,
+            'revenue': sign * order.total, 'paid_orders': sign * paid, 'paid_revenue': sign * paid * order.total,
+        })
+        for product_id, units, revenue in lines:
+            _increment(DailyProductSales, {'date': day, 'product_id': product_id}, {
+                'units': sign * units, 'revenue': sign * revenue,
+                'paid_units': sign * paid * units, 'paid_revenue': sign * paid * revenue,
+            })
+        if order.coupon_id:
+            _increment(DailyCouponSales, {'date': day, 'coupon_id': order.coupon_id}, {
+                'orders': sign, 'subtotal': sign * order.subtotal, 'discount': sign * order.discount_amount,
+                'revenue': sign * order.total, 'paid_orders': sign * paid,
+            })
+
+
+# Заказ отмечен оплаченным (paid=True) или оплата снята (paid=False): меняются только поля paid_*.
+def record_payment(order_id, paid):
+    order = Order.objects.filter(pk=order_id).first()
+    if order is None:
+        return
+    sign = 1 if paid else -1
+    day = order_date(order.created)
+    with transaction.atomic():
+        _increment(DailySales, {'date': day}, {'paid_orders': sign, 'paid_revenue': sign * order.total})
+        for product_id, units, revenue in _order_lines(order_id):
+            _increment(DailyProductSales, {'date': day, 'product_id': product_id},
+                       {'paid_units': sign * units, 'paid_revenue': sign * revenue})
+        if order.coupon_id:
+            _increment(DailyCouponSales, {'date': day, 'coupon_id': order.coupon_id}, {'paid_orders': sign})
+
+
+# Пересчитывает сводки за дни с start по end (включительно) из заказов - агрегатами в SQL,
+# одной транзакцией (заказ, оформленный во время пересчета, не потеряется). Возвращает количество заказов.
+@transaction.atomic
+def rebuild_range(start, end):
+    since, until = day_bounds(start, end)
+    orders = Order.objects.filter(created__gte=since, created__lt=until)
+    items = OrderItem.objects.filter(order__created__gte=since, order__created__lt=until)
+    paid = Q(paid=True)
+
+    daily = {row['day']: row for row in (
+        orders.annotate(day=TruncDate('created')).values('day').order_by()
+        .annotate(orders=Count('id'), subtotal=Sum('subtotal'), discount=Sum('discount_amount'),
+                  revenue=Sum('total'), paid_orders=Count('id', filter=paid),
+                  paid_revenue=Sum('total', filter=paid))
+    )}
+    units = dict(items.annotate(day=TruncDate('order__created')).values('day').order_by()
+                 .annotate(units=Sum('quantity')).values_list('day', 'units'))
+    products = (
+        items.annotate(day=TruncDate('order__created')).values('day', 'product_id').order_by()
+        .annotate(units=Sum('quantity'), revenue=Sum(F('price') * F('quantity'), output_field=MONEY),
+                  paid_units=Sum('quantity', filter=Q(order__paid=True)),
+                  paid_revenue=Sum(F('price') * F('quantity'), filter=Q(order__paid=True), output_field=MONEY))
+    )
+    coupons = (
+        orders.filter(coupon__isnull=False).annotate(day=TruncDate('created')).values('day', 'coupon_id')
+        .order_by()
+        .annotate(orders=Count('id'), subtotal=Sum('subtotal'), discount=Sum('discount_amount'),
+                  revenue=Sum('total'), paid_orders=Count('id', filter=paid))
+    )
+
+    for model in (DailySales, DailyProductSales, DailyCouponSales):
+        model.objects.filter(date__gte=start, date__lte=end).delete()
+    DailySales.objects.bulk_create([
+        DailySales(date=day, orders=row['orders'], units=units.get(day) or 0, subtotal=row['subtotal'] or ZERO,
+                   discount=row['discount'] or ZERO, revenue=row['revenue'] or ZERO,
+                   paid_orders=row['paid_orders'], paid_revenue=row['paid_revenue'] or ZERO)
+        for day, row in daily.items()
+    ])
+    DailyProductSales.objects.bulk_create([
+        DailyProductSales(date=row['day'], product_id=row['product_id'], units=row['units'],
+                          revenue=row['revenue'] or ZERO, paid_units=row['paid_units'] or 0,
+                          paid_revenue=row['paid_revenue'] or ZERO)
+        for row in products
+    ], batch_size=1000)
+    DailyCouponSales.objects.bulk_create([
+        DailyCouponSales(date=row['day'], coupon_id=row['coupon_id'], orders=row['orders'],
+                         subtotal=row['subtotal'] or ZERO, discount=row['discount'] or ZERO,
+                         revenue=row['revenue'] or ZERO, paid_orders=row['paid_orders'])
+        for row in coupons
+    ])
+    return sum(row['orders'] for row in daily.values())
+
+
+# Пересчитывает сводки за отдельные дни (после правок заказов в админке).
+def rebuild_dates(dates):
+    for day in sorted(set(dates)):
+        rebuild_range(day, day)
+
+
+# Дни, которые нужно пересчитать после фиксации текущей транзакции. Одно удаление заказа
+# вызывает сигналы для каждой его позиции - день пересчитывается один раз.
+def schedule_rebuild(day):
+    connection = transaction.get_connection()
+    pending = connection.__dict__.setdefault('shop_report_dates', set())
+    pending.add(day)
+
+    def flush():
+        dates = set(pending)
+        pending.clear()
+        if dates:
+            rebuild_dates(dates)
+
+    transaction.on_commit(flush, robust=True)
+
+
+# --- Отчеты ---
+
+# Денежные суммы строк отчета с двумя знаками после запятой (SUM на SQLite возвращает их без округления).
+def _money(rows):
+    for row in rows:
+        for field in MONEY_FIELDS:
+            if field in row:
+                row[field] = Decimal(row[field] or 0).quantize(CENT)
+    return rows
+
+
+# Период отчета: (start, end) включительно. По умолчанию - последние days дней.
+def default_period(days=30):
+    end = timezone.localdate()
+    return end - timedelta(days=days - 1), end
+
+
+# Выручка по дням за период (строки DailySales по возрастанию даты).
+def daily_revenue(start, end):
+    return _money(list(DailySales.objects.filter(date__gte=start, date__lte=end).order_by('date')
+                       .values('date', 'orders', 'units', 'subtotal', 'discount', 'revenue', 'paid_orders',
+                               'paid_revenue')))
+
+
+# Итоги периода.
+def period_totals(start, end):
+    totals = DailySales.objects.filter(date__gte=start, date__lte=end).aggregate(
+        orders=Sum('orders'), units=Sum('units'), subtotal=Sum('subtotal'), discount=Sum('discount'),
+        revenue=Sum('revenue'), paid_orders=Sum('paid_orders'), paid_revenue=Sum('paid_revenue'))
+    totals = {key: value or 0 for key, value in totals.items()}
+    totals['average_order'] = totals['revenue'] / totals['orders'] if totals['orders'] else ZERO
+    return _money([totals])[0]
+
+
+# Самые продаваемые товары за период (по выручке).
+def top_products(start, end, limit=20):
+    return _money(list(DailyProductSales.objects.filter(date__gte=start, date__lte=end)
+                       .values('product_id', 'product__name').order_by()
+                       .annotate(units=Sum('units'), revenue=Sum('revenue'), paid_units=Sum('paid_units'),
+                                 paid_revenue=Sum('paid_revenue'))
+                       .order_by('-revenue', 'product_id')[:limit]))
+
+
+# Категории с наибольшей выручкой за период.
+def top_categories(start, end, limit=10):
+    return _money(list(DailyProductSales.objects.filter(date__gte=start, date__lte=end)
+                       .values('product__category_id', 'product__category__name').order_by()
+                       .annotate(units=Sum('units'), revenue=Sum('revenue'), paid_revenue=Sum('paid_revenue'),
+                                 products=Count('product_id', distinct=True))
+                       .order_by('-revenue', 'product__category_id')[:limit]))
+
+
+# Эффективность купонов за период: заказы, выручка и скидки по каждому купону,
+# доля заказов с купоном и средний чек (с купоном и без).
+def coupon_effectiveness(start, end):
+    totals = period_totals(start, end)
+    rows = list(DailyCouponSales.objects.filter(date__gte=start, date__lte=end)
+                .values('coupon_id', 'coupon__code', 'coupon__discount').order_by()
+                .annotate(orders=Sum('orders'), subtotal=Sum('subtotal'), discount=Sum('discount'),
+                          revenue=Sum('revenue'), paid_orders=Sum('paid_orders'))
+                .order_by('-revenue', 'coupon_id'))
+    for row in rows:
+        row['order_share'] = round(100 * row['orders'] / totals['orders'], 1) if totals['orders'] else 0
+        row['average_order'] = Decimal(row['revenue']) / row['orders'] if row['orders'] else ZERO
+        row['paid_share'] = round(100 * row['paid_orders'] / row['orders'], 1) if row['orders'] else 0
+    return _money(rows)
+
+
+# Отчеты для выгрузки в CSV: имя -> (функция(start, end), колонки).
+CSV_REPORTS = {
+    'daily': (daily_revenue, ['date', 'orders', 'units', 'subtotal', 'discount', 'revenue', 'paid_orders',
+                              'paid_revenue']),
+    'products': (lambda start, end: top_products(start, end, limit=None),
+                 ['product_id', 'product__name', 'units', 'revenue', 'paid_units', 'paid_revenue']),
+    'categories': (lambda start, end: top_categories(start, end, limit=None),
+                   ['product__category_id', 'product__category__name', 'products', 'units', 'revenue',
+                    'paid_revenue']),
+    'coupons': (coupon_effectiveness, ['coupon_id', 'coupon__code', 'coupon__discount', 'orders', 'order_share',
+                                       'subtotal', 'discount', 'revenue', 'average_order', 'paid_orders']),
+}
@@ -0,0 +1,225 @@
+import re # Для разбиения текста на слова
+from functools import reduce # Для объединения Q-условий через OR
+from operator import or_
+
+from django.conf import settings # Для выбора движка поиска (SHOP_SEARCH_BACKEND)
+from django.db import connections, transaction
+from django.db.models import Q, Sum, Subquery, OuterRef, IntegerField
+from django.db.models.functions import Coalesce
+
+# Поисковый индекс товаров.
+# Вместо Q(name__icontains=...) | Q(description__icontains=...) (полный просмотр таблицы)
+# используется инвертированный индекс:
+#   - на SQLite - виртуальная таблица FTS5 (shop_product_fts), rowid = id товара;
+#   - на остальных СУБД - обычная таблица токенов ProductSearchToken с индексом по токену.
+# В оба индекса записываются уже "обрезанные" (стемминг) слова, поэтому запросы
+# "телефоны", "телефона" и "телефон" находят одни и те же товары.
+
+FTS_TABLE = 'shop_product_fts'
+
+# Веса полей при ранжировании: совпадение в названии важнее совпадения в описании.
+NAME_WEIGHT = 10
+DESCRIPTION_WEIGHT = 1
+
+# Максимальная длина токена (совпадает с max_length поля ProductSearchToken.token).
+MAX_TOKEN_LENGTH = 64
+
+_WORD_RE = re.compile(r'\w+')
+_CYRILLIC_RE = re.compile(r'^[а-я]+$')
+
+# Окончания русских существительных и прилагательных (упрощенный стеммер в духе Snowball).
+# Отсортированы по длине, чтобы сначала отрезалось самое длинное подходящее окончание.
+_RU_ENDINGS = sorted([
+    # прилагательные и причастия
+    'ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой',
+    'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+    # существительные
+    'иями', 'ями', 'ами', 'иях', 'ях', 'ах', 'иям', 'ям', 'ам', 'ием', 'ией', 'ев', 'ов',
+    'ии', 'ию', 'ья', 'ье', 'ью', 'ия', 'а', 'е', 'и', 'о', 'у', 'ы', 'ь', 'ю', 'я', 'й',
+], key=len, reverse=True)
+
+# Минимальная длина основы после отрезания окончания (чтобы "сок" не превратился в "с").
+_MIN_STEM_LENGTH = 3
+
+
+# Приводит слово к основе: нижний регистр, ё -> е, отрезание русского окончания.
+# Латиница и цифры возвращаются как есть (только в нижнем регистре).
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    if not _CYRILLIC_RE.match(word):
+        return word
+    for ending in _RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM_LENGTH:
+            return word[:-len(ending)]
+    return word
+
+
+# Разбивает текст на список основ слов (в порядке появления, с повторами).
+def tokenize(text):
+    return [stem(word)[:MAX_TOKEN_LENGTH] for word in _WORD_RE.findall(text or '')]
+
+
+# Основы слов поискового запроса без повторов (порядок сохраняется).
+def query_terms(query):
+    return list(dict.fromkeys(tokenize(query)))
+
+
+# Какой движок поиска использовать для данного подключения: 'fts5' или 'tokens'.
+# settings.SHOP_SEARCH_BACKEND может принудительно задать движок; по умолчанию 'auto' -
+# FTS5, если база SQLite и виртуальная таблица была создана миграцией 0002_product_search_index.
+# Результат проверки запоминается по имени базы (тестовая база и бенчмарки подменяют NAME у того же алиаса).
+_fts_available = {}
+
+def get_backend(using='default'):
+    backend = getattr(settings, 'SHOP_SEARCH_BACKEND', 'auto')
+    if backend != 'auto':
+        return backend
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return 'tokens'
+    key = (using, conn.settings_dict['NAME'])
+    if key not in _fts_available:
+        with conn.cursor() as cursor:
+            _fts_available[key] = FTS_TABLE in conn.introspection.table_names(cursor)
+    return 'fts5' if _fts_available[key] else 'tokens'
+
+
+# Подсчет весов токенов одного товара: {токен: вес}.
+def _token_weights(name, description):
+    weights = {}
+    for token in tokenize(name):
+        weights[token] = weights.get(token, 0) + NAME_WEIGHT
+    for token in tokenize(description):
+        weights[token] = weights.get(token, 0) + DESCRIPTION_WEIGHT
+    return weights
+
+
+# Записывает в индекс документы товаров.
+# rows - итерируемый набор кортежей (id, name, description).
+# Старые записи этих товаров удаляются, поэтому функцию можно вызывать повторно.
+def index_documents(rows, using='default'):
+    rows = list(rows)
+    if not rows:
+        return
+    ids = [row[0] for row in rows]
+    if get_backend(using) == 'fts5':
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', ids)
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, description) VALUES (%s, %s, %s)',
+                [(pk, ' '.join(tokenize(name)), ' '.join(tokenize(description)))
+                 for pk, name, description in rows],
+            )
+        return
+
+    from .models import ProductSearchToken
+    tokens = [
+        ProductSearchToken(product_id=pk, token=token, weight=weight)
+        for pk, name, description in rows
+        for token, weight in _token_weights(name, description).items()
+    ]
+    with transaction.atomic(using=using):
+        ProductSearchToken.objects.using(using).filter(product_id__in=ids).delete()
+        ProductSearchToken.objects.using(using).bulk_create(tokens, batch_size=1000)
+
+
+# Удаляет товары из индекса (например, после удаления товара).
+def remove_documents(ids, using='default'):
+    ids = list(ids)
+    if not ids:
+        return
+    if get_backend(using) == 'fts5':
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', ids)
+        return
+    from .models import ProductSearchToken
+    ProductSearchToken.objects.using(using).filter(product_id__in=ids).delete()
+
+
+# Индексация одного товара (вызывается из сигнала post_save).
+def index_product(product):
+    index_documents([(product.pk, product.name, product.description)], using=product._state.db or 'default')
+
+
+# Индексация списка товаров по их id (например, после bulk_create, который не вызывает сигналы).
+def index_products(ids, using='default'):
+    from .models import Product
+    ids = list(ids)
+    for start in range(0, len(ids), 1000):
+        chunk = ids[start:start + 1000]
+        index_documents(
+            Product.objects.using(using).filter(id__in=chunk).values_list('id', 'name', 'description'),
+            using=using,
+        )
+
+
+# Полная перестройка индекса по всем товарам, порциями по chunk_size.
+# Возвращает количество проиндексированных товаров.
+def rebuild_index(using='default', chunk_size=1000):
+    from .models import Product, ProductSearchToken
+    if get_backend(using) == 'fts5':
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+    else:
+        ProductSearchToken.objects.using(using).all().delete()
+
+    total = 0
+    rows = (Product.objects.using(using).order_by('pk')
+            .values_list('id', 'name', 'description').iterator(chunk_size=chunk_size))
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            index_documents(chunk, using=using)
+            total += len(chunk)
+            chunk = []
+    index_documents(chunk, using=using)
+    return total + len(chunk)
+
+
+# Основная функция поиска.
+# Принимает QuerySet товаров и строку запроса, возвращает отфильтрованный QuerySet,
+# аннотированный полем search_rank (чем больше, тем релевантнее) и отсортированный по нему.
+# Каждое слово запроса ищется как префикс основы, все слова должны совпасть (AND).
+def search_products(queryset, query):
+    terms = query_terms(query)
+    if not terms:
+        return queryset.none()
+    using = queryset.db
+
+    if get_backend(using) == 'fts5':
+        # Каждый термин в кавычках со звездочкой - префиксный поиск FTS5, пробел между ними - AND.
+        match = ' '.join(f'"{term}"*' for term in terms)
+        table = queryset.model._meta.db_table
+        # Соединяем таблицу товаров с FTS5 по rowid: полнотекстовый запрос выполняется один раз
+        # (коррелированный подзапрос на каждую строку выполнял бы MATCH заново).
+        # bm25() возвращает тем меньшее число, чем выше релевантность, поэтому меняем знак.
+        # Веса столбцов: название, описание.
+        return (queryset
+                .extra(
+                    tables=[FTS_TABLE],
+                    where=[f'{FTS_TABLE}.rowid = "{table}"."id"', f'{FTS_TABLE} MATCH %s'],
+                    params=[match],
+                    select={'search_rank': f'-bm25({FTS_TABLE}, {float(NAME_WEIGHT)}, {float(DESCRIPTION_WEIGHT)})'},
+                )
+                .order_by('-search_rank', 'name'))
+
+    from .models import ProductSearchToken
+    # Каждое слово запроса сужает выборку через подзапрос к индексу по токену.
+    for term in terms:
+        queryset = queryset.filter(
+            id__in=ProductSearchToken.objects.filter(token__startswith=term).values('product_id')
+        )
+    # Релевантность - сумма весов совпавших токенов товара.
+    rank = Subquery(
+        ProductSearchToken.objects
+        .filter(product=OuterRef('pk'))
+        .filter(reduce(or_, [Q(token__startswith=term) for term in terms]))
+        .values('product')
+        .annotate(total=Sum('weight'))
+        .values('total')[:1],
+        output_field=IntegerField(),
+    )
+    return queryset.annotate(search_rank=Coalesce(rank, 0)).order_by('-search_rank', 'name')
@@ -0,0 +1,90 @@
+import logging # Для записи замеров времени оформления заказа
+import time
+
+from django.db import transaction # Для атомарного оформления заказа
+
+from . import inventory # Списание остатков товаров
+from .emails import enqueue_order_confirmation # Очередь писем-подтверждений
+from .models import OrderItem
+
+logger = logging.getLogger(__name__)
+
+
+# Исключение при невозможности оформить заказ (например, все товары корзины были удалены из каталога).
+class CheckoutError(Exception):
+    pass
+
+
+# Оформление заказа из корзины.
+# Принимает корзину (shop.cart.Cart) и валидную форму OrderCreateForm.
+# Заказ и все его позиции создаются в одной транзакции: при ошибке в базе не останется
+# "половины" заказа. Позиции записываются одним bulk_create, а товары берутся из
+# уже загруженных Cart.__iter__ (один запрос на все товары корзины).
+# Остатки товаров списываются в той же транзакции одним условным UPDATE (shop/inventory.py):
+# если какого-то товара не хватает, заказ не создается.
+# Письмо-подтверждение не отправляется здесь, а добавляется в очередь (shop/emails.py).
+# Заказ оформляется только по текущим ценам, которые посетитель уже видел: если цены пересчитаны
+# в этом запросе (Cart.refresh_prices) или успели измениться после загрузки корзины, корзина
+# пересчитывается по уже загруженным товарам и выбрасывается CheckoutError.
+# Возвращает кортеж (order, timings), где timings - словарь {этап: миллисекунды}.
+def checkout(cart, form):
+    timings = {}
+    started = stage_started = time.perf_counter()
+
+    # Вспомогательная функция: записывает длительность этапа и начинает отсчет следующего.
+    def mark(stage):
+        nonlocal stage_started
+        now = time.perf_counter()
+        timings[stage] = (now - stage_started) * 1000
+        stage_started = now
+
+    items = list(cart) # Один запрос за всеми товарами корзины
+    if not items:
+        raise CheckoutError('Корзина пуста')
+    if any(item['price'] != item['product'].price for item in items):
+        cart.refresh_prices(item['product'] for item in items)
+    if cart.repriced:
+        raise CheckoutError('Цены некоторых товаров изменились. Проверьте корзину и оформите заказ еще раз.')
+    active_coupon = cart.coupon
+    mark('cart')
+
+    with transaction.atomic():
+        order = form.save(commit=False)
+        if active_coupon:
+            order.coupon = active_coupon
+            order.discount = active_coupon.discount
+        # Итоги заказа считаем сразу по позициям корзины (bulk_create не вызывает сигналы пересчета).
+        order.set_totals(sum(item['total_price'] for item in items))
+        order.save()
+        mark('order')
+
+        # Товары с отслеживаемым остатком (объекты Product только что загружены корзиной).
+        tracked = {item['product'].id: item['quantity'] for item in items if item['product'].stock is not None}
+        try:
+            inventory.commit(cart.get_key(), tracked, {item['product'].id: item['product'].name for item in items})
+        except inventory.InsufficientStock as e:
+            raise CheckoutError(str(e)) from e
+        mark('stock')
+
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order,
+                      product=item['product'],
+                      price=item['price'],
+                      quantity=item['quantity'])
+            for item in items
+        ])
+        mark('items')
+
+        # Письмо-подтверждение только ставится в очередь (отправит команда send_order_emails).
+        enqueue_order_confirmation(order)
+        mark('email')
+
+    cart.clear()
+    mark('clear')
+    timings['total'] = (time.perf_counter() - started) * 1000
+
+    logger.info(
+        'checkout order=%s lines=%d %s',
+        order.id, len(items), ' '.join(f'{stage}={ms:.1f}ms' for stage, ms in timings.items()),
+    )
+    return order, timings
@@ -0,0 +1,181 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created # Новое соединение с базой данных
+from django.db.models.signals import pre_save, post_save, post_delete # Сигналы сохранения и удаления моделей
+from django.dispatch import receiver
+
+from . import search # Поисковый индекс товаров
+from . import related # Предвычисленные похожие товары
+from . import images # Уменьшенные копии изображений товаров
+from .caching import bump_catalog_version # Версия каталога для кэша страниц
+from .cart import bump_price_version # Версия цен для пересчета корзин
+from . import coupons # Реестр купонов в кэше
+from . import reports # Сводные таблицы продаж
+from . import db # Настройка соединений с базой данных
+from . import categories # Дерево категорий и счетчики товаров
+from .models import Category, Product, Coupon, Order, OrderItem
+
+# Обработчики сигналов приложения shop.
+# Подключаются в ShopConfig.ready() (см. apps.py).
+
+# Каждое новое соединение с SQLite настраивается PRAGMA из SHOP_SQLITE_PRAGMAS (ожидание блокировки, WAL и т.д.).
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    db.apply_sqlite_pragmas(connection)
+
+# После сохранения товара (в том числе из ProductAdmin и list_editable) обновляем его в поисковом индексе
+# и в таблице похожих товаров.
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, raw=False, **kwargs):
+    if raw: # Загрузка фикстур (loaddata) - индекс перестраивается командой rebuild_search_index
+        return
+    search.index_product(instance)
+    # Обновляем кандидатов "похожих товаров" для этого товара (категория могла измениться).
+    related.refresh_product(instance)
+
+# Перед сохранением товара считаем хэш нового изображения (из него строятся имена копий).
+# Для загруженного через форму файла (_committed=False) хэш считается до записи файла в хранилище.
+@receiver(pre_save, sender=Product)
+def product_image_digest(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if not instance.image:
+        instance.image_digest = ''
+    elif not instance.image._committed or not instance.image_digest:
+        instance.image_digest = images.file_digest(instance.image)
+
+# После сохранения товара с изображением создаем недостающие копии (после фиксации транзакции,
+# чтобы при откате не остались лишние файлы). Можно отключить настройкой SHOP_IMAGE_GENERATE_ON_SAVE -
+# тогда копии создадутся при первом показе или командой regenerate_product_images.
+@receiver(post_save, sender=Product)
+def product_image_variants(sender, instance, raw=False, **kwargs):
+    if raw or not instance.image or not getattr(settings, 'SHOP_IMAGE_GENERATE_ON_SAVE', True):
+        return
+    name, digest = instance.image.name, instance.image_digest
+    transaction.on_commit(lambda: images.generate_variants(name, digest))
+
+# Счетчики доступных товаров в категориях (Category.product_count) меняются только тогда, когда
+# доступный товар появляется, исчезает или переходит в другую категорию. Перед сохранением
+# запоминаем, где товар учитывался раньше (по значениям из from_db, без запроса к базе).
+def _counted_category(category_id, available):
+    return category_id if available else None
+
+@receiver(pre_save, sender=Product)
+def product_category_before(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance._state.adding:
+        instance._counted_category = None
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if 'category_id' in loaded and 'available' in loaded:
+        instance._counted_category = _counted_category(loaded['category_id'], loaded['available'])
+    else: # Объект загружен не целиком (only/defer) - берем старые значения из базы
+        old = Product.objects.filter(pk=instance.pk).values_list('category_id', 'available').first()
+        instance._counted_category = _counted_category(*old) if old else None
+
+@receiver(post_save, sender=Product)
+def product_category_counts(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old, new = instance._counted_category, _counted_category(instance.category_id, instance.available)
+    if old != new:
+        categories.product_moved(old, new)
+    instance._loaded_values = {**getattr(instance, '_loaded_values', {}),
+                               'category_id': instance.category_id, 'available': instance.available}
+
+# Перенос категории к другому родителю: пути потомков и счетчики предков (shop/categories.py).
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    old_path = getattr(instance, 'previous_path', None)
+    if old_path and old_path != instance.path:
+        categories.move_subtree(instance, old_path)
+
+# После удаления товара убираем его из поискового индекса.
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    search.remove_documents([instance.pk], using=instance._state.db or 'default')
+    if instance.available:
+        categories.product_moved(instance.category_id, None)
+
+# Любое изменение товара или категории (в том числе цена через list_editable в ProductAdmin)
+# увеличивает версию каталога - закэшированные страницы каталога перестают использоваться.
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
+
+# Изменение цены (в том числе массовое через list_editable в ProductAdmin) или удаление товара увеличивает
+# версию цен: корзины пересчитают цены позиций при следующей загрузке (см. shop/cart.py). Версия меняется
+# после фиксации транзакции - иначе корзина успела бы сверить цены со старыми данными под новой версией.
+# Новый товар еще не лежит ни в одной корзине.
+@receiver(post_save, sender=Product)
+def product_price_changed(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if 'price' not in loaded or loaded['price'] != instance.price:
+        transaction.on_commit(bump_price_version)
+
+@receiver(post_delete, sender=Product)
+def product_price_removed(sender, instance, **kwargs):
+    transaction.on_commit(bump_price_version)
+
+# Изменение или удаление купона (в том числе из CouponAdmin) сбрасывает реестр купонов в кэше:
+# и по id, и по коду (код тоже мог измениться).
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def coupon_changed(sender, **kwargs):
+    coupons.invalidate()
+
+# Позиции удаляются каскадом вместе с заказом (origin - удаляемый заказ или QuerySet заказов): итоги
+# удаляемого заказа не пересчитываются, а день в отчетах пересчитывается один раз в order_deleted.
+def _deleting_orders(origin):
+    return isinstance(origin, Order) or getattr(origin, 'model', None) is Order
+
+# При добавлении, изменении или удалении позиции заказа пересчитываем сохраненные итоги заказа.
+# (bulk_create при оформлении заказа сигналы не вызывает - там итоги считаются сразу, см. shop.services)
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_item_changed(sender, instance, raw=False, origin=None, **kwargs):
+    if raw or _deleting_orders(origin):
+        return
+    # Берем заказ заново из базы: у позиции может быть устаревший объект заказа.
+    order = Order.objects.filter(pk=instance.order_id).first()
+    if order:
+        order.update_totals()
+        # Позиции изменили в админке - день заказа в отчетах пересчитывается целиком
+        reports.schedule_rebuild(reports.order_date(order.created))
+
+# Сводные таблицы продаж (shop/reports.py) обновляются после фиксации транзакции заказа:
+# к этому моменту позиции нового заказа уже записаны (при оформлении - одним bulk_create).
+# Отметка об оплате меняет только оплаченные суммы; другие изменения итогов заказа
+# (скидка, купон) пересчитывают его день.
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        order_id = instance.pk
+        transaction.on_commit(lambda: reports.record_order(order_id), robust=True)
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if any(field in loaded and loaded[field] != value
+           for field, value in (('total', instance.total), ('coupon_id', instance.coupon_id),
+                                ('created', instance.created))):
+        reports.schedule_rebuild(reports.order_date(instance.created))
+        if 'created' in loaded:
+            reports.schedule_rebuild(reports.order_date(loaded['created']))
+    elif 'paid' in loaded and loaded['paid'] != instance.paid:
+        order_id, paid = instance.pk, instance.paid
+        transaction.on_commit(lambda: reports.record_payment(order_id, paid), robust=True)
+    instance._loaded_values = {**loaded, 'paid': instance.paid, 'total': instance.total,
+                               'coupon_id': instance.coupon_id, 'created': instance.created}
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    reports.schedule_rebuild(reports.order_date(instance.created))
@@ -0,0 +1,89 @@
+// Изменение количества товаров на странице корзины без перезагрузки.
+// Изменения нескольких полей за короткое время собираются и отправляются одним запросом
+// в JSON API корзины (shop:cart_api); ответ - новые количества и итоги, которые подставляются
+// в таблицу и значок корзины. Без JavaScript формы количества работают как обычные (views.cart_add).
+(function () {
+    var table = document.querySelector('table.cart[data-api-url]');
+    if (!table) {
+        return;
+    }
+    var pending = {}; // {product_id: новое количество}
+    var timer = null;
+
+    function csrfToken() {
+        var input = table.querySelector('input[name=csrfmiddlewaretoken]');
+        return input ? input.value : '';
+    }
+
+    function setText(selector, value) {
+        document.querySelectorAll(selector).forEach(function (element) {
+            element.textContent = value;
+        });
+    }
+
+    function render(cart) {
+        if (!cart.lines.length) {
+            window.location.reload(); // Пустая корзина отображается по-другому
+            return;
+        }
+        var lines = {};
+        cart.lines.forEach(function (line) {
+            lines[line.product_id] = line;
+        });
+        table.querySelectorAll('tr[data-product-id]').forEach(function (row) {
+            var line = lines[row.dataset.productId];
+            if (!line) {
+                row.remove();
+                return;
+            }
+            row.querySelector('input[name=quantity]').value = line.quantity;
+            row.querySelector('[data-line-total]').textContent = '$' + line.total_price;
+        });
+        setText('[data-cart-count]', cart.count);
+        setText('[data-cart-subtotal]', cart.subtotal);
+        setText('[data-cart-discount]', cart.discount);
+        setText('[data-cart-total]', cart.total);
+        if (cart.errors.length) {
+            window.alert(cart.errors.map(function (error) { return error.error; }).join('\n'));
+        }
+    }
+
+    function send() {
+        var operations = Object.keys(pending).map(function (productId) {
+            return {op: 'set', product_id: Number(productId), quantity: pending[productId]};
+        });
+        pending = {};
+        timer = null;
+        fetch(table.dataset.apiUrl, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {'Content-Type': 'application/json', 'X-CSRFToken': csrfToken()},
+            body: JSON.stringify({operations: operations})
+        }).then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.status);
+            }
+            return response.json();
+        }).then(render).catch(function () {
+            window.location.reload(); // Показываем актуальное состояние корзины
+        });
+    }
+
+    function schedule(input, delay) {
+        pending[input.closest('tr').dataset.productId] = Math.max(0, parseInt(input.value, 10) || 0);
+        clearTimeout(timer);
+        timer = setTimeout(send, delay);
+    }
+
+    table.addEventListener('change', function (event) {
+        if (event.target.name === 'quantity') {
+            schedule(event.target, 400);
+        }
+    });
+    table.addEventListener('submit', function (event) {
+        if (event.target.classList.contains('cart-quantity')) {
+            event.preventDefault();
+            schedule(event.target.querySelector('input[name=quantity]'), 0);
+        }
+    });
+})();
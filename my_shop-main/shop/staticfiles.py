@@ -0,0 +1,249 @@
+import asyncio
+import gzip # Для сжатых копий статических файлов
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.utils.http import http_date
+
+try:
+    import brotli # Необязательная зависимость: без нее создаются только .gz-копии
+except ImportError:
+    brotli = None
+
+from . import images
+
+# Статические файлы в production.
+# 1. CompressedManifestStaticFilesStorage - хранилище для collectstatic: к именам файлов добавляется
+#    хэш содержимого (base.css -> base.5f1c0a2b9e3d.css, {% static %} подставляет новое имя),
+#    и рядом кладутся сжатые копии .gz (и .br, если установлен пакет brotli).
+# 2. StaticFilesWSGI / StaticFilesASGI - обертки над приложением Django (my_shop/wsgi.py, asgi.py),
+#    которые сами отдают файлы из STATIC_ROOT и MEDIA_ROOT: файлы с хэшем в имени - с заголовком
+#    Cache-Control "immutable" на год, остальные - с коротким max-age и проверкой по ETag
+#    (If-None-Match -> 304 без тела). Сжатая копия выбирается по Accept-Encoding.
+
+mimetypes.add_type('image/webp', '.webp')
+
+# Какие файлы сжимать (картинки и шрифты уже сжаты).
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico'}
+# Файлы меньше этого размера не сжимаются (выигрыш меньше заголовков).
+MIN_COMPRESS_SIZE = 256
+
+# Имя файла с хэшем от ManifestStaticFilesStorage: name.0123456789ab.ext
+_HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+# Cache-Control для файлов с хэшем в имени: содержимое по этому URL никогда не изменится.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+# Сжатые копии файла path: .gz всегда, .br - если есть brotli. Копия сохраняется,
+# только если она заметно меньше оригинала. Возвращает список созданных файлов.
+def compress_file(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return []
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data)))
+    created = []
+    for suffix, compressed in variants:
+        if len(compressed) < len(data) * 0.95:
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            created.append(path + suffix)
+    return created
+
+
+# Хранилище статики для collectstatic: имена с хэшем + манифест + сжатые копии.
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Файл, которого нет в манифесте (например, ссылка на несуществующую картинку), не должен
+    # ронять страницу с ошибкой 500 - для него используется имя без хэша.
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed = []
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and processed and not isinstance(processed, Exception):
+                hashed.append(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for hashed_name in hashed:
+            if os.path.splitext(hashed_name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                for created in compress_file(self.path(hashed_name)):
+                    yield hashed_name, os.path.relpath(created, self.location), True
+
+    # Без collectstatic (разработка, тесты) файла еще нет в STATIC_ROOT - отдаем имя без хэша.
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+
+# --- Раздача файлов ---
+
+# Результат поиска файла: статус, заголовки и путь к файлу (None для ответа без тела).
+class StaticResponse:
+    def __init__(self, status, headers, path=None):
+        self.status = status
+        self.headers = headers
+        self.path = path
+
+
+# Раздача файлов из нескольких папок (URL-префикс -> папка).
+class StaticFileServer:
+    def __init__(self, mounts=None):
+        if mounts is None:
+            mounts = []
+            if settings.STATIC_ROOT:
+                mounts.append((settings.STATIC_URL, settings.STATIC_ROOT, self.is_hashed_static))
+            if settings.MEDIA_ROOT:
+                mounts.append((settings.MEDIA_URL, settings.MEDIA_ROOT, self.is_hashed_media))
+        # Префиксы URL приводим к виду /static/ (STATIC_URL может быть задан без ведущего слэша).
+        # Префикс с адресом другого сервера (CDN) пропускается.
+        self.mounts = [('/' + prefix.lstrip('/'), os.path.realpath(root), is_hashed)
+                       for prefix, root, is_hashed in mounts if prefix and '://' not in prefix]
+        self.max_age = getattr(settings, 'SHOP_STATIC_MAX_AGE', 60)
+
+    @staticmethod
+    def is_hashed_static(name):
+        return bool(_HASHED_NAME.search(name))
+
+    # Уменьшенные копии изображений (shop/images.py) названы по хэшу содержимого.
+    @staticmethod
+    def is_hashed_media(name):
+        return name.startswith(images.cache_dir() + '/')
+
+    # Путь к файлу для URL path или None, если URL не относится к раздаваемым папкам.
+    def find(self, path):
+        for prefix, root, is_hashed in self.mounts:
+            if path.startswith(prefix):
+                name = posixpath.normpath(unquote(path[len(prefix):])).lstrip('/')
+                if name.startswith('..') or '\0' in name:
+                    return None
+                full = os.path.realpath(os.path.join(root, name))
+                if not full.startswith(root + os.sep) or not os.path.isfile(full):
+                    return None
+                return full, is_hashed(name)
+        return None
+
+    # Ответ на GET/HEAD-запрос файла или None (запрос передается приложению Django).
+    def respond(self, method, path, accept_encoding='', if_none_match=''):
+        if method not in ('GET', 'HEAD'):
+            return None
+        found = self.find(path)
+        if found is None:
+            return None
+        full, hashed = found
+
+        # Сжатая копия, если клиент ее принимает (brotli лучше gzip).
+        accepted = {token.split(';')[0].strip().lower() for token in accept_encoding.split(',')}
+        content_path, encoding = full, None
+        has_compressed = False
+        for suffix, name in (('.br', 'br'), ('.gz', 'gzip')):
+            if os.path.isfile(full + suffix):
+                has_compressed = True
+                if encoding is None and name in accepted:
+                    content_path, encoding = full + suffix, name
+
+        stat = os.stat(content_path)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+        content_type, _ = mimetypes.guess_type(full)
+        content_type = content_type or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in ('application/javascript', 'image/svg+xml'):
+            content_type += '; charset=utf-8'
+        headers = [
+            ('Cache-Control', IMMUTABLE_CACHE_CONTROL if hashed else f'public, max-age={self.max_age}'),
+            ('ETag', etag),
+            ('Last-Modified', http_date(stat.st_mtime)),
+        ]
+        if has_compressed:
+            headers.append(('Vary', 'Accept-Encoding'))
+
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return StaticResponse(304, headers)
+        headers += [('Content-Type', content_type), ('Content-Length', str(stat.st_size))]
+        if encoding:
+            headers.append(('Content-Encoding', encoding))
+        return StaticResponse(200, headers, content_path if method == 'GET' else None)
+
+
+def _etag_matches(header, etag):
+    candidates = [tag.strip() for tag in header.split(',')]
+    return '*' in candidates or any(tag.removeprefix('W/') == etag for tag in candidates)
+
+
+_REASONS = {200: 'OK', 304: 'Not Modified'}
+
+
+# WSGI-обертка: файлы отдаются без Django (без middleware и сессии), остальное - приложению.
+class StaticFilesWSGI:
+    def __init__(self, application, server=None):
+        self.application = application
+        self.server = server or StaticFileServer()
+
+    def __call__(self, environ, start_response):
+        response = self.server.respond(
+            environ.get('REQUEST_METHOD', 'GET'),
+            environ.get('PATH_INFO', ''),
+            environ.get('HTTP_ACCEPT_ENCODING', ''),
+            environ.get('HTTP_IF_NONE_MATCH', ''),
+        )
+        if response is None:
+            return self.application(environ, start_response)
+        start_response(f'{response.status} {_REASONS[response.status]}', response.headers)
+        if response.path is None:
+            return []
+        f = open(response.path, 'rb')
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper:
+            return file_wrapper(f, 64 * 1024)
+        return _iter_file(f)
+
+
+def _iter_file(f, chunk_size=64 * 1024):
+    with f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+# ASGI-обертка (для запуска через uvicorn/daphne). Файл читается в отдельном потоке блоками.
+class StaticFilesASGI:
+    def __init__(self, application, server=None):
+        self.application = application
+        self.server = server or StaticFileServer()
+
+    async def __call__(self, scope, receive, send):
+        response = None
+        if scope['type'] == 'http':
+            request_headers = dict(scope.get('headers') or [])
+            response = self.server.respond(
+                scope['method'],
+                scope['path'],
+                request_headers.get(b'accept-encoding', b'').decode('latin-1'),
+                request_headers.get(b'if-none-match', b'').decode('latin-1'),
+            )
+        if response is None:
+            return await self.application(scope, receive, send)
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.headers],
+        })
+        if response.path is None:
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        with open(response.path, 'rb') as f:
+            while True:
+                chunk = await asyncio.to_thread(f.read, 64 * 1024)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': bool(chunk)})
+                if not chunk:
+                    break
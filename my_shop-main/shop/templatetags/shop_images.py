@@ -0,0 +1,34 @@
+from django import template
+from django.templatetags.static import static
+
+from shop import images
+
+register = template.Library()
+
+# Теги для уменьшенных копий изображений товаров (см. shop/images.py).
+# Использование: {% load shop_images %}
+#   {% product_image product 'list' %}                          - <picture> с WebP и основным форматом
+#   {% product_image product 'thumbnail' css_class='small' %}   - с CSS-классом для <img>
+#   {% product_image_url product 'detail' %}                    - только URL копии
+
+
+# <picture>: браузер с поддержкой WebP загрузит WebP, остальные - JPEG/PNG.
+# Для товара без изображения показывается заглушка img/no_image.png.
+# lazy=True - атрибут loading="lazy" (картинки ниже первого экрана грузятся при прокрутке).
+@register.inclusion_tag('shop/includes/product_image.html')
+def product_image(product, variant='list', css_class='', lazy=True, style=''):
+    src = images.variant_url(product, variant) if product.image else None
+    return {
+        'src': src or static('img/no_image.png'),
+        'webp': images.variant_url(product, variant, 'webp') if src else None,
+        'alt': product.name if src else 'Изображение отсутствует',
+        'css_class': css_class,
+        'style': style,
+        'lazy': lazy,
+    }
+
+
+# URL копии изображения товара (или заглушки, если изображения нет).
+@register.simple_tag
+def product_image_url(product, variant='list'):
+    return images.variant_url(product, variant) or static('img/no_image.png')
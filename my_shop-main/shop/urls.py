@@ -1,5 +1,14 @@
+from django.conf import settings
 from django.urls import path
 from . import views # Импортируем представления из текущего приложения (shop.views)
+from . import async_views # Асинхронные варианты представлений каталога и корзины
+
+# Под ASGI (SHOP_ASYNC_VIEWS = True) каталог обслуживается асинхронными представлениями,
+# под WSGI - обычными синхронными. Страница корзины по умолчанию синхронная и под ASGI: в замерах
+# bench_asgi асинхронный вариант медленнее (много запросов к базе, каждый - через поток);
+# включается настройкой SHOP_ASYNC_CART_VIEW.
+catalog_views = async_views if settings.SHOP_ASYNC_VIEWS else views
+cart_views = async_views if settings.SHOP_ASYNC_VIEWS and settings.SHOP_ASYNC_CART_VIEW else views
 
 # Пространство имен для URL-шаблонов этого приложения.
 # Позволяет использовать, например, {% url 'shop:product_list' %} в шаблонах.
@@ -11,11 +20,17 @@ urlpatterns = [
     # URL-ы для информационных страниц (используют TemplateView)
     path('about-us/', views.AboutUsView.as_view(), name='about_us'),
     path('contact-info/', views.ContactInfoView.as_view(), name='contact_info'),
+    # Статистика кэша страниц каталога (только для сотрудников)
+    path('page-cache/stats/', views.page_cache_stats_view, name='page_cache_stats'),
+    # Статистика инструментирования: SQL-запросы и время по представлениям (только для сотрудников)
+    path('instrumentation/stats/', views.instrumentation_stats_view, name='instrumentation_stats'),
 
     # URL-ы для корзины и купонов
-    path('cart/', views.cart_detail, name='cart_detail'), # Страница с деталями корзины
+    path('cart/', cart_views.cart_detail, name='cart_detail'), # Страница с деталями корзины
     path('cart/add/<int:product_id>/', views.cart_add, name='cart_add'), # Добавление товара в корзину
     path('cart/remove/<int:product_id>/', views.cart_remove, name='cart_remove'), # Удаление товара из корзины
+    # JSON API корзины: пакетное изменение и итоги без перезагрузки страницы
+    path('cart/api/', views.cart_api, name='cart_api'),
     path('coupons/apply/', views.coupon_apply, name='coupon_apply'), # Применение купона
 
     # URL-ы для заказов
@@ -23,11 +38,11 @@ urlpatterns = [
     path('order/created/', views.order_created, name='order_created'), # Страница подтверждения заказа
     # URL-ы для каталога товаров
     # Пустой путь '' для главной страницы каталога (также обрабатывает поиск)
-    path('', views.product_list, name='product_list'), 
+    path('', catalog_views.product_list, name='product_list'),
     # URL для отображения товаров по категории (например, /tovary-dlya-doma/)
     # <slug:category_slug> захватывает часть URL как переменную category_slug
-    path('<slug:category_slug>/', views.product_list, name='product_list_by_category'),
+    path('<slug:category_slug>/', catalog_views.product_list, name='product_list_by_category'),
     # URL для детальной страницы товара (например, /123/super-tovar/)
     # <int:id> захватывает числовой ID, <slug:slug> - слаг товара.
-    path('<int:id>/<slug:slug>/', views.product_detail, name='product_detail'),
+    path('<int:id>/<slug:slug>/', catalog_views.product_detail, name='product_detail'),
 ]
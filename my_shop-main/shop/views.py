@@ -1,48 +1,136 @@
+import json # Тело запросов JSON API корзины
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse # Для генерации URL-адресов по их именам
-from django.views.decorators.http import require_POST # Декоратор, разрешающий только POST-запросы
+from django.views.decorators.http import require_POST, require_http_methods # Ограничение HTTP-методов
+from django.utils.cache import get_conditional_response # Ответ 304 по If-None-Match
 from django.views.generic import TemplateView # Базовый класс для простых страниц с шаблоном
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger # Для пагинации
-from django.core.mail import send_mail # Для отправки email
+from django.utils.decorators import method_decorator # Для применения декораторов к class-based views
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, JsonResponse
+from django.core.paginator import EmptyPage, PageNotAnInteger # Исключения постраничной навигации
 from django.conf import settings # Для доступа к настройкам проекта
-from django.db.models import Q # Для создания сложных поисковых запросов (OR-условия)
 from django.utils import timezone # Для работы с временем (например, для купонов)
 from django.contrib import messages
-from .forms import CouponApplyForm, OrderCreateForm
+from .forms import CartOperationForm, CouponApplyForm, OrderCreateForm
 
-from shop.cart import Cart # Для отображения флеш-сообщений пользователю
+from shop.cart import get_cart # Корзина текущего запроса
 
-from .models import Product, Category, Coupon, Order, OrderItem # Модели данных
+from .models import Product, Order # Модели данных
+from . import coupons # Реестр купонов в кэше
+from .search import search_products # Поиск по индексу (FTS5 / таблица токенов)
+from .services import checkout, CheckoutError # Оформление заказа
+from .pagination import CachedCountPaginator, KeysetPaginator # Пагинация каталога
+from .related import get_related_products # Похожие товары
+from .caching import (cache_catalog_page, conditional_catalog_page, detail_page_products, get_category_tree,
+                      list_page_products, page_cache_stats) # Кэширование страниц каталога и условные запросы
+from . import instrumentation # Статистика запросов по представлениям
+from . import inventory # Резервы товаров на складе
+from .db import read_from_replica # Чтение каталога с реплик базы данных
 
 # --- Информационные страницы (используют Class-Based View - TemplateView) ---
 
+@method_decorator(cache_catalog_page, name='dispatch')
 class AboutUsView(TemplateView):
     template_name = 'shop/about_us.html'
 
+@method_decorator(cache_catalog_page, name='dispatch')
 class ContactInfoView(TemplateView):
     template_name = 'shop/contact_info.html'
 
 # --- Представления для Корзины и Купонов ---
 
 # Представление для добавления товара в корзину.
+# Необязательные поля формы: quantity - количество (по умолчанию 1), update - установить
+# количество вместо добавления (форма количества на странице корзины; 0 - удалить товар).
 @require_POST
 def cart_add(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
-    cart.add(product=product, quantity=1, update_quantity=False)
-    messages.success(request, f'Товар {product.name} был добавлен в вашу корзину')
+    form = CartOperationForm({'op': 'set' if request.POST.get('update') else 'add', 'product_id': product_id,
+                              'quantity': request.POST.get('quantity')})
+    if not form.is_valid():
+        messages.error(request, 'Неверное количество товара')
+        return redirect('shop:cart_detail')
+    quantity, update = form.cleaned_data['quantity'], form.cleaned_data['op'] == 'set'
+    if not quantity:
+        cart.remove(product)
+        messages.success(request, f'Товар {product.name} был удален из корзины')
+        return redirect('shop:cart_detail')
+    try:
+        cart.add(product=product, quantity=quantity, update_quantity=update)
+    except inventory.InsufficientStock as e:
+        messages.error(request, str(e))
+        return redirect('shop:cart_detail')
+    if update:
+        messages.success(request, f'Количество товара {product.name} изменено')
+    else:
+        messages.success(request, f'Товар {product.name} был добавлен в вашу корзину')
     return redirect('shop:cart_detail')
 # Представление для удаления товара из корзины.
 @require_POST
 def cart_remove(request, product_id):
-    cart = Cart(request)
+    cart = get_cart(request)
     product = get_object_or_404(Product, id=product_id)
     cart.remove(product)
     messages.success(request, f'Товар {product.name} был удален из корзины')
     return redirect('shop:cart_detail')
+
+# JSON API корзины: без перенаправлений, сообщений и отрисовки страниц.
+# GET - содержимое корзины и итоги. POST - пакет операций в теле запроса (JSON):
+#   {"operations": [{"op": "add", "product_id": 5, "quantity": 2},
+#                   {"op": "set", "product_id": 7, "quantity": 3},
+#                   {"op": "remove", "product_id": 9}]}
+# Товары всех операций загружаются одним запросом (Cart.apply). Ответ - корзина после изменений
+# (Cart.as_dict) и ошибки невыполненных операций (errors). Версия корзины передается в ETag:
+# GET с If-None-Match получает 304 без тела, если корзина не изменилась.
+@require_http_methods(['GET', 'POST'])
+def cart_api(request):
+    cart = get_cart(request)
+    errors = []
+    if request.method == 'POST':
+        try:
+            operations = _parse_cart_operations(request.body)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        errors = cart.apply(operations)
+    else:
+        etag = f'"{cart.get_version()}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            not_modified['Cache-Control'] = 'private, no-cache'
+            return not_modified
+    data = cart.as_dict()
+    response = JsonResponse({**data, 'errors': errors})
+    response['ETag'] = f'"{data["version"]}"'
+    response['Cache-Control'] = 'private, no-cache' # Браузер каждый раз проверяет версию (If-None-Match)
+    return response
+
+# Разбор тела запроса JSON API корзины: список (op, product_id, quantity).
+# Неверный JSON или операция - ValueError (ответ 400, корзина не меняется).
+def _parse_cart_operations(body):
+    try:
+        data = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError('Тело запроса должно быть в формате JSON')
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list):
+        raise ValueError('Ожидается список операций "operations"')
+    limit = getattr(settings, 'SHOP_CART_API_MAX_OPERATIONS', 100)
+    if len(operations) > limit:
+        raise ValueError(f'Не больше {limit} операций в одном запросе')
+    parsed = []
+    for index, operation in enumerate(operations):
+        form = CartOperationForm(operation if isinstance(operation, dict) else {})
+        if not form.is_valid():
+            details = '; '.join(f'{field}: {" ".join(errors)}' for field, errors in form.errors.items())
+            raise ValueError(f'Операция {index}: {details}')
+        parsed.append((form.cleaned_data['op'], form.cleaned_data['product_id'], form.cleaned_data['quantity']))
+    return parsed
+
 # Представление для отображения страницы с деталями корзины.
 def cart_detail(request):
-    cart = Cart(request)
+    cart = get_cart(request)
     coupon_apply_form = CouponApplyForm()
 
     context = {'cart':cart,
@@ -56,17 +144,17 @@ def coupon_apply(request):
     form = CouponApplyForm(request.POST) 
     if form.is_valid():
         code = form.cleaned_data['code'] #LETO2025
-        try:
-            coupon = Coupon.objects.get(code__iexact=code)
-            if coupon.is_valid():
-                request.session['coupon_id'] = coupon.id
-                messages.success(request, f'Купон {coupon.code} успешно применен!')
-            else:
-                request.session['coupon_id'] = None
-                messages.warning(request, 'Данный купон недействителен')
-        except Coupon.DoesNotExist:
+        # Купон ищется без учета регистра в реестре купонов (кэш, см. shop/coupons.py).
+        coupon = coupons.get_coupon_by_code(code)
+        if coupon is None:
             request.session['coupon_id'] = None
             messages.error(request, 'Купон с таким кодом не найден')
+        elif coupon.is_valid():
+            request.session['coupon_id'] = coupon.id
+            messages.success(request, f'Купон {coupon.code} успешно применен!')
+        else:
+            request.session['coupon_id'] = None
+            messages.warning(request, 'Данный купон недействителен')
     else:
         messages.error(request, 'Введите код купона')
     return redirect('shop:cart_detail')
@@ -74,58 +162,106 @@ def coupon_apply(request):
 # --- Представления для Каталога товаров ---
 
 # Представление для отображения списка товаров (главная страница каталога, категории, результаты поиска).
+# Страница кэшируется целиком (см. shop/caching.py), при промахе кэша каталог читается с реплик (shop/db.py).
+# Повторный запрос браузера с неустаревшей страницей получает 304 (conditional_catalog_page).
+@conditional_catalog_page(list_page_products, catalog_wide=True)
+@cache_catalog_page
+@read_from_replica
 def product_list(request, category_slug=None):
     category = None # Текущая категория (None, если не выбрана)
-    categories = Category.objects.all() # Все категории для отображения в сайдбаре
-    products_queryset = Product.objects.filter(available=True).order_by('name') # Начальный QuerySet всех доступных товаров
+    tree = get_category_tree() # Дерево категорий для сайдбара (снимок из кэша)
+    # Начальный QuerySet всех доступных товаров. id в сортировке делает порядок однозначным
+    # (нужно для пагинации по курсору).
+    products_queryset = Product.objects.filter(available=True).order_by('name', 'id')
     
-    # Обработка поискового запроса
+    # Обработка поискового запроса: ищем по поисковому индексу, результаты сортируются по релевантности
     query = request.GET.get('query', '').strip()
     if query:
-        products_queryset = products_queryset.filter (
-            Q(name__icontains=query) |  Q(description__icontains=query)
-        ).distinct()
+        products_queryset = search_products(products_queryset, query)
 
     # Фильтрация по категории, если передан category_slug
     if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
-        products_queryset = products_queryset.filter(category=category)
+        # Категорию ищем в снимке дерева, без отдельного запроса; товары - из нее и всех подкатегорий
+        category = tree.get(category_slug)
+        if category is None:
+            raise Http404('Категория не найдена')
+        products_queryset = tree.filter_products(products_queryset, category)
 
-    # Пагинация для разбивки списка товаров на отдельные страницы
-    paginator = Paginator(products_queryset, 3)
+    # Пагинация для разбивки списка товаров на отдельные страницы.
+    # Старые ссылки вида ?page=N (и результаты поиска, отсортированные по релевантности)
+    # обслуживаются обычным пагинатором по номерам страниц с кэшированным COUNT(*).
+    # Остальные страницы каталога листаются по курсору (?cursor=...): без COUNT(*) и OFFSET.
+    page_size = settings.SHOP_CATALOG_PAGE_SIZE
+    count_timeout = settings.SHOP_CATALOG_COUNT_CACHE_TIMEOUT
     page_number = request.GET.get('page')
+    cursor_mode = page_number is None and not query
 
-    try:
-        products_page_obj = paginator.page(page_number)
-    except PageNotAnInteger:
-        products_page_obj = paginator.page(1)
-    except EmptyPage:
-        products_page_obj = paginator.page(paginator.num_pages)
+    if cursor_mode:
+        paginator = KeysetPaginator(products_queryset, page_size, key_fields=('name', 'id'),
+                                    count_cache_timeout=count_timeout)
+        products_page_obj = paginator.page(request.GET.get('cursor'))
+    else:
+        paginator = CachedCountPaginator(products_queryset, page_size)
+        paginator.count_cache_timeout = count_timeout
+        try:
+            products_page_obj = paginator.page(page_number)
+        except PageNotAnInteger:
+            products_page_obj = paginator.page(1)
+        except EmptyPage:
+            products_page_obj = paginator.page(paginator.num_pages)
 
     context = {
         'category': category,
-        'categories': categories,
+        'categories': tree.sidebar(category), # Верхний уровень и раскрытая ветка текущей категории
+        'breadcrumbs': tree.ancestors(category) if category else [],
         'products': products_page_obj,
         'query': query,
+        'cursor_mode': cursor_mode,
+        'show_count': settings.SHOP_CATALOG_SHOW_COUNT,
     }
     return render(request, 'shop/product/list.html', context)
 
 # Представление для отображения детальной информации о товаре.
+# Страница кэшируется целиком (см. shop/caching.py), при промахе кэша каталог читается с реплик (shop/db.py).
+# Last-Modified - Product.updated; повторный запрос с неустаревшей страницей получает 304.
+@conditional_catalog_page(detail_page_products)
+@cache_catalog_page
+@read_from_replica
 def product_detail(request, id, slug):
     product = get_object_or_404(Product, id=id, slug=slug, available=True)
-    related_products = Product.objects.filter(category=product.category,
-    available=True).exclude(id=product.id).order_by('?')[:4]
+    # Похожие товары: случайная выборка из предвычисленных кандидатов (см. shop/related.py).
+    # С кэшем страниц выборка остается той же, пока страница в кэше (см. shop/caching.py).
+    related_products = get_related_products(product, count=4)
 
     context = {'product':product,
                'related_products':related_products}
 
     return render(request, 'shop/product/detail.html', context)
 
+# Статистика кэша страниц каталога (попадания/промахи) в формате JSON. Только для сотрудников.
+@staff_member_required
+def page_cache_stats_view(request):
+    return JsonResponse(page_cache_stats())
+
+# Скользящая статистика инструментирования по представлениям (запросы к базе, время, дубли) в формате JSON.
+# GET - показать статистику, POST - показать и очистить (GET не меняет состояние: ссылку могут открыть
+# предзагрузка браузера или сканер). Только для сотрудников; работает при SHOP_INSTRUMENTATION_ENABLED.
+@staff_member_required
+@require_http_methods(['GET', 'POST'])
+def instrumentation_stats_view(request):
+    if not instrumentation.is_enabled():
+        raise Http404('Инструментирование выключено (SHOP_INSTRUMENTATION_ENABLED)')
+    stats = instrumentation.get_stats()
+    if request.method == 'POST':
+        instrumentation.reset_stats()
+    return JsonResponse(stats, json_dumps_params={'ensure_ascii': False, 'indent': 2})
+
 # --- Представления для Заказов ---
 
 # Представление для создания (оформления) заказа.
+# Сама логика оформления вынесена в shop.services.checkout (одна транзакция, bulk_create позиций).
 def order_create(request):
-    cart = Cart(request)
+    cart = get_cart(request)
     if not cart:
         messages.warning(request, 'Ваша корзина пуста')
         return redirect('shop:product_list')
@@ -133,34 +269,26 @@ def order_create(request):
     if request.method == 'POST':
         form = OrderCreateForm(request.POST)
         if form.is_valid():
-            order = form.save(commit=False)
-            active_coupon = cart.coupon
-            if active_coupon:
-                order.coupon = active_coupon
-                order.discount = active_coupon.discount
-            order.save()
-        for item_cart in cart:
-            OrderItem.objects.create(
-                order = order,
-                product = item_cart['product'],
-                price = item_cart['price'],
-                quantity = item_cart['quantity']
-            )
-
-        request.session['order_id'] = order.id
-
-        cart.clear()
-
-        return redirect('shop:order_created')
+            try:
+                order, _ = checkout(cart, form)
+            except CheckoutError as e:
+                messages.error(request, str(e))
+                return redirect('shop:cart_detail')
+
+            request.session['order_id'] = order.id
+            return redirect('shop:order_created')
     else:
         form = OrderCreateForm()
+        # Пока посетитель заполняет форму, резервы товаров его корзины не должны истечь.
+        if cart.get_key():
+            inventory.extend(cart.get_key())
 
     context = {
         'cart': cart,
         'form':form
     }
 
-    return render(request, 'shop/order/create.html', {'form':form})
+    return render(request, 'shop/order/create.html', context)
 
 # Представление для страницы "Спасибо за заказ" (подтверждение заказа).
 def order_created(request):